@@ -1,6 +1,7 @@
 # Import necessary libraries
 import streamlit as st
 from streamlit.logger import get_logger
+from startup import prewarm
 
 # Get logger
 LOGGER = get_logger(__name__)
@@ -13,6 +14,9 @@ def run():
         page_icon="📗",
     )
 
+    # Import LangChain and the Sheets client in the background, if enabled
+    prewarm()
+
     # Write main header
     st.write("# 📗 Welcome to Pocketbook AI")
 
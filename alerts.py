@@ -0,0 +1,260 @@
+# Budget and unusual-spend alerts, kept up to date incrementally.
+#
+# An AlertEngine holds running statistics for one source: the count, mean
+# and variance of charges per category and per merchant (merged batch by
+# batch with the parallel variance formula) and spend per month and
+# category in integer cents. When a synced sheet gains rows, only those rows
+# are normalized, checked against the statistics gathered before them and
+# then folded in, so the cost of an update follows the number of new rows
+# rather than the size of the ledger. Budgets are checked against the
+# month-to-date totals, which is a lookup per budget. The whole history is
+# only read when a source is first seen or its earlier rows changed.
+
+import math
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from analytics import find_description_column, normalize_transactions
+from categorize import normalize_descriptions
+from instrumentation import span
+from startup import get_settings
+
+
+# Charges this many standard deviations above the typical amount are unusual...
+Z_THRESHOLD = 3.0
+
+# ...if they are also at least this many times the typical amount
+MIN_RATIO = 2.0
+
+# Charges a merchant (or category) needs before its amounts count as history
+MIN_HISTORY = 5
+
+# On first load, rows in this many days before the latest one are checked too
+INITIAL_ALERT_DAYS = 30
+
+# Alerts kept per source, newest first
+MAX_ALERTS = 200
+
+# Month-to-date share of a budget at which it is reported as nearly spent
+NEAR_BUDGET_SHARE = 0.8
+
+# Sources with an engine; the least recently used one is dropped beyond this
+MAX_ENGINES = 64
+
+ALERT_COLUMNS = ["DATE", "DESCRIPTION", "CATEGORY", "PRICE", "TYPICAL", "TIMES", "COMPARED_TO"]
+
+BUDGET_COLUMNS = ["CATEGORY", "BUDGET", "SPENT", "USED", "STATUS"]
+
+
+def _merge(stats, keys, prices):
+    """Fold a batch of charges into {key: (count, mean, sum of squared deviations)}."""
+    groups = pd.Series(prices).groupby(keys, sort=False)
+    counts, means = groups.count(), groups.mean()
+    squares = groups.var(ddof=0).fillna(0.0) * counts
+    for key, count, mean, square in zip(counts.index, counts.to_numpy(), means.to_numpy(), squares.to_numpy()):
+        old_count, old_mean, old_square = stats.get(key, (0, 0.0, 0.0))
+        total = old_count + count
+        delta = mean - old_mean
+        stats[key] = (total, old_mean + delta * count / total,
+                      old_square + square + delta * delta * old_count * count / total)
+
+
+def _lookup(stats, keys):
+    """(count, mean, standard deviation) per row for the keys of a batch, zeros for unknown keys."""
+    codes, uniques = pd.factorize(keys)
+    table = np.array([stats.get(key, (0, 0.0, 0.0)) for key in uniques] + [(0, 0.0, 0.0)],
+                     dtype=np.float64).reshape(-1, 3)
+    # Missing keys (code -1) take the zero row at the end
+    rows = table[codes]
+    counts = rows[:, 0]
+    return counts, rows[:, 1], np.sqrt(rows[:, 2] / np.maximum(counts, 1))
+
+
+def _unusual(prices, counts, means, deviations):
+    return ((counts >= MIN_HISTORY) & (prices >= means + Z_THRESHOLD * deviations)
+            & (prices >= MIN_RATIO * means))
+
+
+class AlertEngine:
+    """Running spend statistics, alerts and month-to-date totals for one source; thread-safe."""
+
+    def __init__(self):
+        self.version = None
+        self.rows_seen = 0
+        self.category_stats = {}
+        self.merchant_stats = {}
+        # {(months since 1970-01, category): cents}
+        self.month_cents = {}
+        self.last_month = None
+        self.alerts = deque(maxlen=MAX_ALERTS)
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self.version = None
+        self.rows_seen = 0
+        self.category_stats.clear()
+        self.merchant_stats.clear()
+        self.month_cents.clear()
+        self.last_month = None
+        self.alerts.clear()
+
+    def _add(self, frame, check=True):
+        """Check the charges of a normalized frame against the statistics so far, then fold them in.
+
+        Returns the number of alerts raised.
+        """
+        self.rows_seen += len(frame)
+        prices = frame["PRICE"].to_numpy(dtype=np.float64)
+        charged = prices > 0
+        if not charged.any():
+            return 0
+        frame, prices = frame[charged], prices[charged]
+        categories = frame["CATEGORY"].astype(object).to_numpy()
+        description_column = find_description_column(frame)
+        if description_column is not None:
+            descriptions = frame[description_column].to_numpy(dtype=object)
+            # Distinct descriptions are normalized once; missing ones (code -1) take the NaN at the end
+            codes, uniques = pd.factorize(descriptions)
+            normalized = normalize_descriptions(uniques)
+            merchants = np.append(normalized.mask(normalized == "").to_numpy(dtype=object), np.nan)[codes]
+        else:
+            descriptions = np.full(len(frame), None, dtype=object)
+            merchants = np.full(len(frame), None, dtype=object)
+
+        raised = 0
+        if check:
+            # A merchant's own history is preferred; its category's is the fallback
+            merchant_counts, merchant_means, merchant_deviations = _lookup(self.merchant_stats, merchants)
+            category_counts, category_means, category_deviations = _lookup(self.category_stats, categories)
+            by_merchant = merchant_counts >= MIN_HISTORY
+            means = np.where(by_merchant, merchant_means, category_means)
+            unusual = _unusual(prices, np.where(by_merchant, merchant_counts, category_counts), means,
+                               np.where(by_merchant, merchant_deviations, category_deviations))
+            for position in np.flatnonzero(unusual):
+                self.alerts.appendleft({
+                    "DATE": frame["DATE"].iloc[position],
+                    "DESCRIPTION": descriptions[position],
+                    "CATEGORY": categories[position],
+                    "PRICE": prices[position],
+                    "TYPICAL": means[position],
+                    "TIMES": prices[position] / means[position],
+                    "COMPARED_TO": "merchant" if by_merchant[position] else "category",
+                })
+            raised = int(unusual.sum())
+
+        _merge(self.category_stats, categories, prices)
+        known = pd.notna(merchants)
+        _merge(self.merchant_stats, merchants[known], prices[known])
+
+        months = frame["DATE"].to_numpy(dtype="datetime64[M]").astype(np.int64)
+        cents = np.round(prices * 100).astype(np.int64)
+        month_totals = pd.Series(cents).groupby([months, categories], sort=False).sum()
+        for key, total in month_totals.items():
+            self.month_cents[key] = self.month_cents.get(key, 0) + int(total)
+        latest = int(months.max())
+        self.last_month = latest if self.last_month is None else max(self.last_month, latest)
+        return raised
+
+    @property
+    def latest_month(self):
+        """First day of the latest month with a charge, or None."""
+        if self.last_month is None:
+            return None
+        return pd.Timestamp(np.datetime64(self.last_month, "M"))
+
+    def _load(self, frame):
+        """Start over from a whole normalized ledger, checking only its last INITIAL_ALERT_DAYS.
+
+        Returns the number of alerts raised.
+        """
+        self._reset()
+        if frame.empty:
+            return 0
+        cutoff = frame["DATE"].max() - pd.Timedelta(days=INITIAL_ALERT_DAYS)
+        recent = frame["DATE"].to_numpy() > np.datetime64(cutoff)
+        self._add(frame[~recent], check=False)
+        return self._add(frame[recent])
+
+    def sync(self, snapshot):
+        """Bring the engine up to date with a SheetSnapshot; returns the number of new alerts.
+
+        When the snapshot only appends rows to the version the engine has
+        seen, just those rows are read. Otherwise the engine starts over
+        from the snapshot's dataset.
+        """
+        with self._lock:
+            if snapshot.version == self.version:
+                return 0
+            appended = (self.version is not None and snapshot.previous_version == self.version
+                        and snapshot.appended is not None)
+            with span("alerts.sync", incremental=appended) as current:
+                if appended:
+                    new_rows = snapshot.data.iloc[len(snapshot.data) - snapshot.appended:]
+                    raised = self._add(normalize_transactions(new_rows)) if len(new_rows) else 0
+                    current.set(rows=len(new_rows), alerts=raised)
+                else:
+                    raised = self._load(snapshot.dataset.frame)
+                    current.set(rows=self.rows_seen, alerts=raised)
+            self.version = snapshot.version
+            return raised
+
+    def recent_alerts(self):
+        """Alerts raised so far, newest first."""
+        with self._lock:
+            return pd.DataFrame(list(self.alerts), columns=ALERT_COLUMNS)
+
+    def month_to_date(self):
+        """{category: spend} for the latest month seen."""
+        with self._lock:
+            return {category: cents / 100 for (month, category), cents in self.month_cents.items()
+                    if month == self.last_month}
+
+    def budget_status(self, budgets):
+        """Month-to-date spend against {category: monthly budget}, most used first."""
+        spent = self.month_to_date()
+        rows = []
+        for category, budget in budgets.items():
+            if budget is None or not budget > 0:
+                continue
+            used = spent.get(category, 0.0) / budget
+            status = "Over budget" if used >= 1 else "Nearly spent" if used >= NEAR_BUDGET_SHARE else "On track"
+            rows.append((category, budget, spent.get(category, 0.0), used, status))
+        table = pd.DataFrame(rows, columns=BUDGET_COLUMNS)
+        return table.sort_values("USED", ascending=False, kind="mergesort").reset_index(drop=True)
+
+
+def load_budgets(path):
+    """{category: monthly budget} from a CSV file with CATEGORY and BUDGET columns."""
+    table = pd.read_csv(path).rename(columns=str.upper)
+    missing = [column for column in ("CATEGORY", "BUDGET") if column not in table.columns]
+    if missing:
+        raise ValueError("Missing required columns in {}: {}".format(path, ", ".join(missing)))
+    table = table.dropna(subset=["CATEGORY", "BUDGET"])
+    return {str(category).strip(): float(budget) for category, budget in zip(table["CATEGORY"], table["BUDGET"])
+            if not math.isnan(float(budget))}
+
+
+def default_budgets():
+    """The budgets file from the settings, or no budgets."""
+    path = get_settings().budgets_path
+    return load_budgets(path) if path else {}
+
+
+# Engines shared by every session, one per source
+_alert_engines = OrderedDict()
+_alert_engines_lock = threading.Lock()
+
+
+def get_alert_engine(source):
+    """The process-wide AlertEngine for `source` (e.g. a spreadsheet URL)."""
+    with _alert_engines_lock:
+        engine = _alert_engines.get(source)
+        if engine is None:
+            engine = _alert_engines[source] = AlertEngine()
+            while len(_alert_engines) > MAX_ENGINES:
+                _alert_engines.popitem(last=False)
+        _alert_engines.move_to_end(source)
+        return engine
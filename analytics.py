@@ -0,0 +1,404 @@
+# Shared transaction analytics engine used by every page.
+#
+# Transactions are kept in a date-sorted, typed columnar form: DATE as
+# datetime64, PRICE as float64 plus whole cents as int64, CATEGORY as a
+# categorical (small integer codes into a sorted category list) and each
+# distinct description as one shared string. A date range is then a
+# binary-search slice over the sorted dates, and the metrics / category
+# breakdown are plain numpy reductions. Totals are summed in integer cents,
+# each price rounded to the cent first, so they do not drift the way float
+# dollar sums do.
+
+import hashlib
+import sys
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Columns every ledger must provide; CATEGORY can instead be derived from a description column
+REQUIRED_COLUMNS = ["DATE", "CATEGORY", "PRICE"]
+
+# Category of rows that have none
+UNCATEGORIZED = "Uncategorized"
+
+# Spending metrics shown at the top of each page
+SpendMetrics = namedtuple("SpendMetrics", ["total", "median", "min", "max"])
+
+# Row count, metrics and per-category totals for one set of filters
+SpendSummary = namedtuple("SpendSummary", ["count", "metrics", "category_totals"])
+
+# Free-text columns that describe a transaction, in order of preference
+DESCRIPTION_COLUMNS = ["DESCRIPTION", "MERCHANT", "ITEM", "NAME", "PAYEE", "MEMO", "NOTES"]
+
+# Spending-over-time buckets, finest first, and the most points a chart gets
+GRANULARITIES = ["day", "week", "month"]
+MAX_CHART_POINTS = 400
+_BUCKET_FREQUENCIES = {"day": "D", "week": "W-MON", "month": "MS"}
+
+
+def format_dollars(value):
+    """Format a number the way the metric tiles show it."""
+    return "${:,.2f}".format(value)
+
+
+def to_cents(prices):
+    """Whole cents per price as int64, with 0 for missing prices.
+
+    Each price is rounded on its own, halves away from zero, the way a
+    statement posts it and DuckDB's round() rounds it for the store. Totals
+    are therefore sums of posted amounts: three prices of 0.333 add up to
+    0.99, not to 1.00.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    cents = np.zeros(len(prices), dtype=np.int64)
+    valid = ~np.isnan(prices)
+    scaled = prices[valid] * 100
+    cents[valid] = np.trunc(scaled + np.copysign(0.5, scaled))
+    return cents
+
+
+def intern_strings(values):
+    """`values` as an object array in which equal values are one shared object."""
+    codes, uniques = pd.factorize(values)
+    # Missing values (code -1) take the NaN at the end
+    return np.append(np.asarray(uniques, dtype=object), np.nan)[codes]
+
+
+def column_memory(frame):
+    """Bytes held by each column of `frame`, counting an object shared by many rows once."""
+    usage = {}
+    for column in frame.columns:
+        values = frame[column]
+        if values.dtype == object:
+            array = values.to_numpy()
+            ids = pd.Series(np.fromiter(map(id, array), dtype=np.int64, count=len(array)))
+            first = np.flatnonzero(~ids.duplicated().to_numpy())
+            usage[column] = array.nbytes + sum(sys.getsizeof(array[position]) for position in first)
+        else:
+            usage[column] = int(values.memory_usage(index=False, deep=True))
+    return pd.Series(usage, dtype=np.int64)
+
+
+def find_description_column(frame):
+    """Name of the column describing each transaction, or None."""
+    for column in DESCRIPTION_COLUMNS:
+        if column in frame.columns:
+            return column
+    for column in frame.columns:
+        if column not in REQUIRED_COLUMNS and frame[column].dtype == object:
+            return column
+    return None
+
+
+def missing_columns(frame):
+    """Required columns absent from `frame`."""
+    missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+    if "CATEGORY" in missing and find_description_column(frame) is not None:
+        # Categorized from the descriptions during normalization
+        missing.remove("CATEGORY")
+    return missing
+
+
+def transaction_fingerprints(frame):
+    """Stable 64-bit fingerprint per transaction.
+
+    Built from the day, the amount in cents and the normalized description,
+    plus the row's occurrence number among identical rows so that genuine
+    repeats (two coffees on the same day) stay distinct while re-importing
+    the same statement yields the same fingerprints. CATEGORY is left out so
+    recategorizing a row does not make it a new transaction.
+    """
+    description_column = find_description_column(frame)
+    if description_column is None:
+        descriptions = pd.Series("", index=frame.index)
+    else:
+        descriptions = (frame[description_column].fillna("").astype(str)
+                        .str.lower().str.split().str.join(" "))
+    keys = pd.DataFrame({
+        "DAY": pd.to_datetime(frame["DATE"]).dt.normalize().to_numpy(dtype="datetime64[D]").astype(np.int64),
+        "CENTS": np.round(pd.to_numeric(frame["PRICE"], errors="coerce").fillna(0).to_numpy() * 100).astype(np.int64),
+        "DESCRIPTION": descriptions.to_numpy(),
+    })
+    keys["OCCURRENCE"] = keys.groupby(["DAY", "CENTS", "DESCRIPTION"], sort=False).cumcount()
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def choose_granularity(start_date, end_date, max_points=MAX_CHART_POINTS):
+    """Finest bucket that keeps an inclusive date range within `max_points` points."""
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    if days <= max_points:
+        return "day"
+    if days <= max_points * 7:
+        return "week"
+    return "month"
+
+
+def bucket_days(days, granularity):
+    """First day (days since epoch) of each day's day/week/month bucket; weeks start on Monday."""
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # Day 0 (1970-01-01) was a Thursday
+        return days - (days + 3) % 7
+    months = days.astype("datetime64[D]").astype("datetime64[M]")
+    return months.astype("datetime64[D]").astype(np.int64)
+
+
+def spending_series(bucket_starts, totals, start_date, end_date, granularity):
+    """Totals per bucket as a Series over every bucket in the range, empty ones as 0."""
+    first = pd.Timestamp(np.datetime64(int(bucket_days([np.datetime64(start_date, "D").astype(np.int64)],
+                                                       granularity)[0]), "D"))
+    index = pd.date_range(first, pd.Timestamp(end_date), freq=_BUCKET_FREQUENCIES[granularity],
+                          name=granularity.upper())
+    series = pd.Series(np.asarray(totals, dtype=np.float64),
+                       index=pd.DatetimeIndex(np.asarray(bucket_starts, dtype="datetime64[D]")),
+                       name="PRICE")
+    return series.groupby(level=0).sum().reindex(index, fill_value=0.0)
+
+
+def normalize_transactions(data):
+    """Return a copy of the ledger with typed columns, sorted by date."""
+    missing = missing_columns(data)
+    if missing:
+        raise ValueError("Missing required columns: " + ", ".join(missing))
+
+    frame = pd.DataFrame(data).copy()
+    if "CATEGORY" not in frame.columns:
+        frame["CATEGORY"] = None
+
+    # Dates as datetime64 truncated to the day, prices as floats
+    frame["DATE"] = pd.to_datetime(frame["DATE"]).dt.normalize()
+    frame["PRICE"] = pd.to_numeric(frame["PRICE"], errors="coerce").astype("float64")
+    category = frame["CATEGORY"]
+    if isinstance(category.dtype, pd.CategoricalDtype):
+        category = category.astype(object)
+    category = category.where(category.notna() & (category != ""), UNCATEGORIZED)
+    if pd.api.types.infer_dtype(category, skipna=False) != "string":
+        category = category.astype(str)
+    frame["CATEGORY"] = category
+
+    # Rows without a date cannot be placed on the timeline
+    frame = frame[frame["DATE"].notna()]
+
+    # Stable sort keeps same-day rows in file order
+    if not frame["DATE"].is_monotonic_increasing:
+        frame = frame.sort_values("DATE", kind="mergesort")
+    frame = frame.reset_index(drop=True)
+
+    # Repeated descriptions share one string
+    description_column = find_description_column(frame)
+    if description_column is not None and frame[description_column].dtype == object:
+        frame[description_column] = intern_strings(frame[description_column])
+
+    # Label uncategorized rows from their descriptions before anything is aggregated
+    if (frame["CATEGORY"] == UNCATEGORIZED).any():
+        from categorize import fill_categories
+
+        fill_categories(frame)
+    return frame
+
+
+class TransactionDataset:
+    """An immutable, date-sorted ledger with columnar arrays for fast filtering."""
+
+    def __init__(self, frame):
+        # `frame` must already be normalized (see normalize_transactions)
+        self.frame = frame
+        self.dates = frame["DATE"].to_numpy(dtype="datetime64[ns]")
+        self.prices = frame["PRICE"].to_numpy(dtype="float64")
+        self.cents = to_cents(self.prices)
+
+        # CATEGORY is stored as a categorical, whose codes double as the category codes
+        if not isinstance(frame["CATEGORY"].dtype, pd.CategoricalDtype):
+            frame["CATEGORY"] = pd.Categorical(frame["CATEGORY"])
+        category = frame["CATEGORY"].cat.remove_unused_categories()
+        frame["CATEGORY"] = category
+        self.category_codes = category.cat.codes.to_numpy()
+        self.categories = list(category.cat.categories)
+        self._category_lookup = {name: code for code, name in enumerate(self.categories)}
+
+        self._rollup = None
+        self._rollup_lock = threading.Lock()
+        self._raw_view = None
+        self._recurring = None
+        self._fingerprint = None
+        self._frame_bytes = None
+
+    @classmethod
+    def from_frame(cls, data):
+        """Build a dataset from a raw DATE/CATEGORY/PRICE frame."""
+        # Imported here because instrumentation is only needed by the app
+        from instrumentation import span
+
+        with span("dataset.normalize", rows=len(data)):
+            frame = normalize_transactions(data)
+        with span("dataset.index", rows=len(frame)):
+            return cls(frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        """Memory held by the frame, the arrays not shared with it and the rollup."""
+        # The frame never changes, so its per-object scan runs once per dataset
+        if self._frame_bytes is None:
+            self._frame_bytes = int(column_memory(self.frame).sum())
+        arrays = self.cents.nbytes
+        if self._rollup is not None:
+            arrays += self._rollup.nbytes
+        return self._frame_bytes + arrays
+
+    @property
+    def fingerprint(self):
+        """Content hash of the dataset, computed on first use."""
+        if self._fingerprint is None:
+            row_hashes = pd.util.hash_pandas_object(self.frame, index=False).to_numpy()
+            digest = hashlib.blake2b(row_hashes.tobytes(), digest_size=20)
+            digest.update(",".join(map(str, self.frame.columns)).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @property
+    def rollup(self):
+        """The date x category RollupCube, built on first use."""
+        # Imported here because rollup.py builds on this module
+        from rollup import RollupCube
+
+        with self._rollup_lock:
+            if self._rollup is None:
+                from instrumentation import span
+
+                with span("rollup.build", rows=len(self)):
+                    self._rollup = RollupCube(self)
+            return self._rollup
+
+    @property
+    def raw_view(self):
+        """The RawDataView used to page through the rows, built on first use."""
+        from raw_data import RawDataView
+
+        with self._rollup_lock:
+            if self._raw_view is None:
+                self._raw_view = RawDataView(self)
+            return self._raw_view
+
+    def recurring_charges(self):
+        """Table of recurring charges over the whole history (see find_recurring), computed on first use."""
+        from recurring import find_recurring
+
+        with self._rollup_lock:
+            if self._recurring is None:
+                description_column = find_description_column(self.frame)
+                descriptions = (self.frame[description_column].to_numpy() if description_column
+                                else np.full(len(self), None, dtype=object))
+                self._recurring = find_recurring(self.dates, descriptions, self.prices,
+                                                 np.asarray(self.categories, dtype=object)[self.category_codes])
+            return self._recurring
+
+    def summarize(self, start_date, end_date, categories=None):
+        """SpendSummary for a date range, answered from the rollup."""
+        return self.rollup.summarize(start_date, end_date, categories)
+
+    def spending_over_time(self, start_date, end_date, categories=None, granularity=None):
+        """Total spend per day, week or month; the granularity defaults to choose_granularity()."""
+        granularity = granularity or choose_granularity(start_date, end_date)
+        return self.rollup.spending_over_time(start_date, end_date, categories, granularity)
+
+    @property
+    def min_date(self):
+        return pd.Timestamp(self.dates[0]).date() if len(self) else date.today()
+
+    @property
+    def max_date(self):
+        return pd.Timestamp(self.dates[-1]).date() if len(self) else date.today()
+
+    def date_slice(self, start_date, end_date):
+        """Row positions [start, stop) for an inclusive date range."""
+        lower = np.datetime64(pd.Timestamp(start_date), "ns")
+        upper = np.datetime64(pd.Timestamp(end_date + timedelta(days=1)), "ns")
+        start = int(np.searchsorted(self.dates, lower, side="left"))
+        stop = int(np.searchsorted(self.dates, upper, side="left"))
+        return start, max(start, stop)
+
+    def category_codes_for(self, categories):
+        """Integer codes for the given category names; unknown names are ignored."""
+        return np.array(
+            [self._category_lookup[name] for name in categories if name in self._category_lookup],
+            dtype=np.int32,
+        )
+
+    def select(self, start_date, end_date, categories=None):
+        """Rows within an inclusive date range, optionally limited to categories."""
+        start, stop = self.date_slice(start_date, end_date)
+        mask = None
+        if categories:
+            wanted = self.category_codes_for(categories)
+            mask = np.isin(self.category_codes[start:stop], wanted)
+        return TransactionSelection(self, start, stop, mask)
+
+
+class TransactionSelection:
+    """A filtered view over a TransactionDataset."""
+
+    def __init__(self, dataset, start, stop, mask=None):
+        self.dataset = dataset
+        self.start = start
+        self.stop = stop
+        self.mask = mask
+
+    def _column(self, values):
+        window = values[self.start:self.stop]
+        return window if self.mask is None else window[self.mask]
+
+    @property
+    def prices(self):
+        return self._column(self.dataset.prices)
+
+    @property
+    def cents(self):
+        return self._column(self.dataset.cents)
+
+    @property
+    def category_codes(self):
+        return self._column(self.dataset.category_codes)
+
+    @property
+    def frame(self):
+        """The selected rows as a DataFrame."""
+        window = self.dataset.frame.iloc[self.start:self.stop]
+        return window if self.mask is None else window[self.mask]
+
+    def __len__(self):
+        if self.mask is None:
+            return self.stop - self.start
+        return int(np.count_nonzero(self.mask))
+
+    def metrics(self):
+        """Total, median, min and max spend for the selection."""
+        prices = self.prices
+        prices = prices[~np.isnan(prices)]
+        if prices.size == 0:
+            return SpendMetrics(0.0, float("nan"), float("nan"), float("nan"))
+        return SpendMetrics(
+            # Missing prices are 0 cents
+            total=int(self.cents.sum()) / 100,
+            median=float(np.median(prices)),
+            min=float(prices.min()),
+            max=float(prices.max()),
+        )
+
+    def category_totals(self):
+        """Total spend per category, indexed by category name."""
+        codes = self.category_codes
+        categories = self.dataset.categories
+        # Missing prices count as 0 cents; float64 weights add whole cents exactly
+        totals = np.bincount(codes, weights=self.cents, minlength=len(categories))
+        present = np.bincount(codes, minlength=len(categories)) > 0
+        index = pd.Index(np.asarray(categories, dtype=object)[present], name="CATEGORY")
+        return pd.Series(totals[present] / 100, index=index, name="PRICE")
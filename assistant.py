@@ -0,0 +1,448 @@
+# The "query financial data in plain English" assistant.
+#
+# Routine spending questions are answered locally by the intent parser in
+# intents.py. Everything else goes either to a LangChain pandas agent, built
+# once per dataset and session, or to the schema-only text-to-SQL engine in
+# text_to_sql.py. Answers (or generated SQL) are kept in an LRU/TTL cache
+# keyed by (dataset fingerprint, normalized question), optionally backed by a
+# SQLite file so they survive restarts.
+#
+# Assistant.stream() reports agent steps and model tokens as they arrive,
+# and ask_batch() answers a list of questions concurrently with asyncio,
+# retrying transient model errors with backoff.
+
+import asyncio
+import contextvars
+import hashlib
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from instrumentation import llm_usage, span
+from intents import answer_question
+from startup import get_settings
+from text_to_sql import answer_with_sql, build_prompt, extract_sql, format_result, run_query
+
+
+# Model used by the agent
+MODEL_NAME = "gpt-3.5-turbo"
+
+# Answers kept in memory, and how long an answer stays valid
+ANSWER_CACHE_SIZE = 512
+ANSWER_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# Engines that can answer questions the fast path does not understand
+AGENT_ENGINE = "agent"
+SQL_ENGINE = "sql"
+
+# Attempts per question in a batch, and the first retry delay (doubled each time)
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 1.0
+
+# Characters of a tool's output shown while streaming
+STEP_TEXT_LIMIT = 300
+
+# An answer plus where it came from: "local", "cache", "agent" or "sql"
+Answer = namedtuple("Answer", ["text", "table", "source", "seconds", "sql"], defaults=(None,))
+
+# One question of a batch: its Answer, or the error that stopped it
+BatchResult = namedtuple("BatchResult", ["question", "answer", "error", "attempts", "seconds"])
+
+
+def build_chat(api_key, streaming=False):
+    """The chat model shared by the agent and the SQL engine."""
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model_name=MODEL_NAME,
+                      temperature=0,
+                      streaming=streaming,
+                      openai_api_key=api_key)
+
+
+def build_agent(frame, api_key, streaming=False):
+    """A LangChain pandas agent over `frame`."""
+    from langchain_experimental.agents import create_pandas_dataframe_agent
+
+    return create_pandas_dataframe_agent(build_chat(api_key, streaming), frame, verbose=True)
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    question = re.sub(r"['’]", "", question.lower())
+    question = re.sub(r"[^\w\s$.%-]", " ", question)
+    question = re.sub(r"\s+", " ", question)
+    return question.strip(" .")
+
+
+class AnswerCache:
+    """LRU + TTL cache of agent answers, optionally persisted to SQLite."""
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_TTL_SECONDS, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "dataset TEXT, question TEXT, answer TEXT, created REAL, latency REAL, "
+                "PRIMARY KEY (dataset, question))"
+            )
+            self._db.commit()
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT answer, created, latency FROM answers WHERE dataset = ? AND question = ?", key
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def get(self, dataset_key, question):
+        """Cached answer or None. Hits add the original latency to `saved_seconds`."""
+        key = (dataset_key, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key) or self._load(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                self._entries.pop(key, None)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return entry[0]
+
+    def contains(self, dataset_key, question):
+        """Whether get() would return an answer, without counting a hit or miss."""
+        key = (dataset_key, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key) or self._load(key)
+        return entry is not None and time.time() - entry[1] <= self.ttl
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, dataset_key, question, answer, latency):
+        key = (dataset_key, normalize_question(question))
+        entry = (answer, time.time(), latency)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)", key + entry)
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+class _StreamEvents:
+    """LangChain callback handler that forwards agent steps and tokens to a queue."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def on_agent_action(self, action, **kwargs):
+        self.events.put(("step", "🔧 {}: {}".format(action.tool, action.tool_input)))
+
+    def on_tool_end(self, output, **kwargs):
+        self.events.put(("observation", str(output)[:STEP_TEXT_LIMIT]))
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.events.put(("token", token))
+
+
+def stream_handler(events):
+    """A _StreamEvents that LangChain's callback manager accepts."""
+    try:
+        from langchain_core.callbacks import BaseCallbackHandler
+    except ImportError:
+        # Only the fake models in fake_llm.py can be used without LangChain
+        return _StreamEvents(events)
+
+    class Handler(_StreamEvents, BaseCallbackHandler):
+        pass
+
+    return Handler(events)
+
+
+class Assistant:
+    """Answers questions about one dataset, building its models on first use.
+
+    `chat` and `agent` replace the OpenAI-backed models, e.g. with the fakes
+    in fake_llm.py.
+    """
+
+    def __init__(self, dataset, api_key, cache, chat=None, agent=None):
+        self.dataset = dataset
+        self.api_key = api_key
+        self.cache = cache
+        self._chat = chat
+        self._agent = agent
+        self._streaming_agent = agent
+
+    @property
+    def chat(self):
+        if self._chat is None:
+            self._chat = build_chat(self.api_key)
+        return self._chat
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            self._agent = build_agent(self._agent_frame(), self.api_key)
+        return self._agent
+
+    @property
+    def streaming_agent(self):
+        """An agent whose model emits tokens to callbacks as they arrive."""
+        if self._streaming_agent is None:
+            self._streaming_agent = build_agent(self._agent_frame(), self.api_key, streaming=True)
+        return self._streaming_agent
+
+    def _agent_frame(self):
+        # A shallow copy: columns the agent's code adds stay out of the dataset other sessions share
+        return self.dataset.frame.copy(deep=False)
+
+    def complete(self, prompt):
+        """Plain completion from the chat model."""
+        with span("llm.complete", prompt_chars=len(prompt)) as current, llm_usage(current):
+            return self.chat.invoke(prompt).content
+
+    def ask(self, question, engine=AGENT_ENGINE):
+        """Answer locally, from the cache, or with the chosen engine."""
+        with span("assistant.ask", engine=engine, question_id=question_id(question)) as current:
+            answer = self._ask(question, engine)
+            current.set(source=answer.source)
+        return answer
+
+    def _ask(self, question, engine):
+        started = time.perf_counter()
+        answer = self._quick_answer(question, engine, started)
+        if answer is not None:
+            return answer
+
+        if engine == SQL_ENGINE:
+            with span("sql.answer") as current:
+                sql, result, truncated = answer_with_sql(self.dataset, question, self.complete)
+                current.set(rows=len(result), truncated=truncated)
+            return self._sql_answer(question, sql, result, truncated, started)
+
+        with span("llm.agent") as current, llm_usage(current):
+            response = self.agent.invoke(question)
+        return self._agent_answer(question, response["output"], started)
+
+    async def aask(self, question, engine=AGENT_ENGINE):
+        """ask() for asyncio: model calls are awaited, so many questions can be in flight."""
+        with span("assistant.aask", engine=engine, question_id=question_id(question)) as current:
+            answer = await self._aask(question, engine)
+            current.set(source=answer.source)
+        return answer
+
+    async def _aask(self, question, engine):
+        started = time.perf_counter()
+        answer = self._quick_answer(question, engine, started)
+        if answer is not None:
+            return answer
+
+        if engine == SQL_ENGINE:
+            with span("sql.answer") as current:
+                prompt = build_prompt(self.dataset, question)
+                with span("llm.complete", prompt_chars=len(prompt)) as llm, llm_usage(llm):
+                    reply = await self.chat.ainvoke(prompt)
+                sql = extract_sql(reply.content)
+                result, truncated = await asyncio.to_thread(run_query, self.dataset.frame, sql)
+                current.set(rows=len(result), truncated=truncated)
+            return self._sql_answer(question, sql, result, truncated, started)
+
+        with span("llm.agent") as current, llm_usage(current):
+            response = await self.agent.ainvoke(question)
+        return self._agent_answer(question, response["output"], started)
+
+    def stream(self, question, engine=AGENT_ENGINE):
+        """Yield (kind, value) events while answering, ending with ("answer", Answer).
+
+        Other kinds are "token" (model output as it is generated), "step"
+        (a tool the agent is about to run) and "observation" (its result).
+        """
+        started = time.perf_counter()
+        answer = self._quick_answer(question, engine, started)
+        if answer is not None:
+            yield "answer", answer
+            return
+
+        with span("assistant.stream", engine=engine, question_id=question_id(question)) as current:
+            first_output = None
+            if engine == SQL_ENGINE:
+                pieces = []
+                prompt = build_prompt(self.dataset, question)
+                with span("llm.stream", prompt_chars=len(prompt)) as llm, llm_usage(llm):
+                    for chunk in self.chat.stream(prompt):
+                        first_output = first_output or time.perf_counter() - started
+                        pieces.append(chunk.content)
+                        yield "token", chunk.content
+                sql = extract_sql("".join(pieces))
+                result, truncated = run_query(self.dataset.frame, sql)
+                answer = self._sql_answer(question, sql, result, truncated, started)
+            else:
+                # The agent runs in a worker thread and reports through the queue
+                events = queue.Queue()
+
+                def run():
+                    try:
+                        response = self.streaming_agent.invoke(
+                            question, config={"callbacks": [stream_handler(events)]})
+                        events.put(("done", response["output"]))
+                    except Exception as error:
+                        events.put(("error", error))
+
+                with span("llm.agent", streaming=True) as llm, llm_usage(llm):
+                    # The worker runs in a copy of this context, so its model calls are counted here
+                    threading.Thread(target=contextvars.copy_context().run, args=(run,), name="agent-stream",
+                                     daemon=True).start()
+                    while True:
+                        kind, value = events.get()
+                        if kind == "error":
+                            raise value
+                        if kind == "done":
+                            break
+                        first_output = first_output or time.perf_counter() - started
+                        yield kind, value
+                answer = self._agent_answer(question, value, started)
+            current.set(first_output_seconds=first_output, source=answer.source)
+        yield "answer", answer
+
+    def needs_model(self, question, engine=AGENT_ENGINE):
+        """Whether answering `question` would call the model (no local or cached answer)."""
+        if answer_question(question, self.dataset) is not None:
+            return False
+        dataset_key = self.dataset.fingerprint + (":sql" if engine == SQL_ENGINE else "")
+        return not self.cache.contains(dataset_key, question)
+
+    def _quick_answer(self, question, engine, started):
+        """An answer that needs no model call, or None."""
+        # Routine questions never reach the LLM
+        fast_answer = answer_question(question, self.dataset)
+        if fast_answer is not None:
+            return Answer(fast_answer.text, fast_answer.table, "local", time.perf_counter() - started)
+
+        if engine == SQL_ENGINE:
+            # The cache holds the generated SQL, which is cheap to run again
+            sql = self.cache.get(self.dataset.fingerprint + ":sql", question)
+            if sql is None:
+                return None
+            with span("sql.query", cached=True):
+                result, truncated = run_query(self.dataset.frame, sql)
+            return self._sql_answer(question, sql, result, truncated, started, cached=True)
+
+        answer = self.cache.get(self.dataset.fingerprint, question)
+        if answer is not None:
+            return Answer(answer, None, "cache", time.perf_counter() - started)
+        return None
+
+    def _agent_answer(self, question, output, started):
+        elapsed = time.perf_counter() - started
+        self.cache.put(self.dataset.fingerprint, question, output, elapsed)
+        return Answer(output, None, "agent", elapsed)
+
+    def _sql_answer(self, question, sql, result, truncated, started, cached=False):
+        if not cached:
+            self.cache.put(self.dataset.fingerprint + ":sql", question, sql, time.perf_counter() - started)
+        source = "cache" if cached else "sql"
+        value = format_result(result)
+        if value is not None:
+            return Answer(value, None, source, time.perf_counter() - started, sql)
+        text = "Showing the first {:,} rows.".format(len(result)) if truncated else ""
+        return Answer(text, result, source, time.perf_counter() - started, sql)
+
+
+def question_id(question):
+    """Short hash identifying a question in logs without recording its text."""
+    return hashlib.blake2b(normalize_question(question).encode(), digest_size=4).hexdigest()
+
+
+def retryable_errors():
+    """Exceptions worth retrying: rate limits, timeouts and dropped connections."""
+    errors = [ConnectionError]
+    try:
+        import openai
+    except ImportError:
+        return tuple(errors)
+    return tuple(errors + [openai.RateLimitError, openai.APIConnectionError,
+                           openai.APITimeoutError, openai.InternalServerError])
+
+
+async def ask_batch(assistant, questions, engine=AGENT_ENGINE, concurrency=None,
+                    attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF_SECONDS, on_result=None):
+    """Answer `questions` concurrently; returns BatchResults in question order.
+
+    At most `concurrency` questions wait on the model at once. Transient
+    failures are retried up to `attempts` times with jittered exponential
+    backoff; other errors are reported on the question's result.
+    `on_result(index, result)` is called as each question finishes.
+    """
+    concurrency = concurrency or get_settings().llm_concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+    retryable = retryable_errors()
+
+    async def answer(index, question):
+        started = time.perf_counter()
+        async with semaphore:
+            for attempt in range(1, attempts + 1):
+                try:
+                    result = BatchResult(question, await assistant.aask(question, engine), None, attempt,
+                                         time.perf_counter() - started)
+                    break
+                except retryable as error:
+                    if attempt == attempts:
+                        result = BatchResult(question, None, error, attempt, time.perf_counter() - started)
+                        break
+                    await asyncio.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                except Exception as error:
+                    result = BatchResult(question, None, error, attempt, time.perf_counter() - started)
+                    break
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    with span("assistant.batch", engine=engine, questions=len(questions), concurrency=concurrency):
+        return await asyncio.gather(*(answer(index, question) for index, question in enumerate(questions)))
+
+
+def run_batch(assistant, questions, **kwargs):
+    """ask_batch() from synchronous code such as a Streamlit script."""
+    return asyncio.run(ask_batch(assistant, questions, **kwargs))
+
+
+# Process-wide answer cache shared by every session
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """The shared AnswerCache; persisted when POCKETBOOK_ANSWER_CACHE_PATH is set."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(path=get_settings().answer_cache_path)
+        return _answer_cache
@@ -0,0 +1,275 @@
+# Headless spending reports for a directory of ledgers.
+#
+#   python batch_report.py ledgers/ --output reports --start 2024-01-01 --end 2024-12-31
+#   python batch_report.py ledgers/ --output reports --category DINING --category TRAVEL --workers 4
+#
+# Every CSV/XLSX ledger in the directory is ingested and summarized the way
+# the dashboard does it: an inclusive date range (default: the ledger's
+# whole history), an optional category filter, the four spend metrics and
+# the per-category totals. Ledgers are processed in parallel worker
+# processes. The output directory gets, per ledger, <file>.json,
+# <file>.categories.csv and a <file>.png category chart under files/, and
+# for the whole run summary.json (every ledger, the combined metrics and
+# throughput), summary.csv (one row per ledger), categories.csv (one row per
+# ledger and category) and categories.png. With POCKETBOOK_WORKBOOK_CACHE_DIR
+# set, workbooks are read through their Parquet copies, so nightly reruns
+# over unchanged workbooks are fast.
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analytics import format_dollars, to_cents
+from ingest import SUPPORTED_EXTENSIONS, file_extension, ingest_transactions, ingest_workbook
+
+
+# Spend metrics in the order the dashboard shows them
+METRIC_NAMES = ["min", "median", "max", "total"]
+
+SUMMARY_COLUMNS = ["FILE", "ROWS", "TRANSACTIONS", "START", "END", "MIN", "MEDIAN", "MAX", "TOTAL",
+                   "BAD_ROWS", "SECONDS", "ERROR"]
+
+# Category chart layout, in pixels
+CHART_WIDTH = 900
+CHART_BAR_HEIGHT = 26
+CHART_LABEL_WIDTH = 180
+CHART_MARGIN = 16
+
+
+def ledger_files(directory):
+    """Paths of the supported ledgers directly inside `directory`, sorted by name."""
+    paths = (os.path.join(directory, name) for name in os.listdir(directory)
+             if file_extension(name) in SUPPORTED_EXTENSIONS)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def _number(value):
+    # JSON has no NaN; metrics of an empty selection are reported as null
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def report_ledger(path, start_date=None, end_date=None, categories=None):
+    """Report for one ledger, plus the prices it covers (for the combined median).
+
+    Runs in a worker process, so everything it returns is picklable. A
+    ledger that cannot be read is reported with its error instead.
+    """
+    started = time.perf_counter()
+    file_name = os.path.basename(path)
+    try:
+        with open(path, "rb") as ledger:
+            data = ledger.read()
+        if file_extension(file_name) == "xlsx":
+            result = ingest_workbook(data, file_name)
+        else:
+            result = ingest_transactions(data, file_name)
+    except Exception as error:
+        return {"file": file_name, "bytes": 0, "error": str(error),
+                "seconds": time.perf_counter() - started}, np.empty(0)
+
+    dataset = result.dataset
+    start = start_date or dataset.min_date
+    end = end_date or dataset.max_date
+    summary = dataset.summarize(start, end, categories)
+    prices = dataset.select(start, end, categories).prices
+    report = {
+        "file": file_name,
+        "bytes": len(data),
+        "rows": len(dataset),
+        "bad_rows": result.bad_row_count,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "transactions": summary.count,
+        "metrics": {name: _number(getattr(summary.metrics, name)) for name in METRIC_NAMES},
+        "category_totals": {category: _number(total) for category, total in summary.category_totals.items()},
+        "error": None,
+        "seconds": time.perf_counter() - started,
+    }
+    return report, prices[~np.isnan(prices)]
+
+
+def combine(reports, prices):
+    """Metrics and category totals over every ledger that was read."""
+    totals = pd.Series(dtype=np.float64)
+    for report in reports:
+        if report["error"] is None:
+            totals = totals.add(pd.Series(report["category_totals"], dtype=np.float64), fill_value=0)
+    prices = np.concatenate(prices) if prices else np.empty(0)
+    metrics = dict.fromkeys(METRIC_NAMES)
+    if prices.size:
+        # Integer cents, as the dashboard totals are kept
+        cents = to_cents(prices)
+        metrics = {"min": _number(prices.min()), "median": _number(np.median(prices)),
+                   "max": _number(prices.max()), "total": int(cents.sum()) / 100}
+    return {
+        "transactions": int(prices.size),
+        "metrics": metrics,
+        "category_totals": {category: _number(total)
+                            for category, total in totals.sort_values(ascending=False).items()},
+    }
+
+
+def draw_category_chart(category_totals, title, path):
+    """Write a horizontal bar chart of {category: total} as a PNG."""
+    from PIL import Image, ImageDraw
+
+    items = sorted(((category, total) for category, total in category_totals.items() if total),
+                   key=lambda item: -item[1])
+    height = 2 * CHART_MARGIN + CHART_BAR_HEIGHT * (len(items) + 1)
+    image = Image.new("RGB", (CHART_WIDTH, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((CHART_MARGIN, CHART_MARGIN), title, fill="black")
+
+    largest = max((abs(total) for _, total in items), default=0) or 1
+    bar_space = CHART_WIDTH - CHART_LABEL_WIDTH - 2 * CHART_MARGIN - 110
+    for index, (category, total) in enumerate(items, start=1):
+        top = CHART_MARGIN + index * CHART_BAR_HEIGHT
+        draw.text((CHART_MARGIN, top + 6), str(category)[:28], fill="black")
+        width = max(1, int(bar_space * abs(total) / largest))
+        left = CHART_MARGIN + CHART_LABEL_WIDTH
+        draw.rectangle([left, top + 3, left + width, top + CHART_BAR_HEIGHT - 3], fill="#1f77b4")
+        draw.text((left + width + 8, top + 6), format_dollars(total), fill="black")
+    image.save(path)
+
+
+def _summary_row(report):
+    metrics = report.get("metrics") or {}
+    return {"FILE": report["file"], "ROWS": report.get("rows"), "TRANSACTIONS": report.get("transactions"),
+            "START": report.get("start"), "END": report.get("end"),
+            "MIN": metrics.get("min"), "MEDIAN": metrics.get("median"), "MAX": metrics.get("max"),
+            "TOTAL": metrics.get("total"), "BAD_ROWS": report.get("bad_rows"),
+            "SECONDS": round(report["seconds"], 3), "ERROR": report["error"]}
+
+
+def write_reports(output, reports, combined, throughput, charts=True):
+    """Write the per-ledger and combined JSON, CSV and chart files under `output`."""
+    files_directory = os.path.join(output, "files")
+    os.makedirs(files_directory, exist_ok=True)
+    category_rows = []
+    for report in reports:
+        base = os.path.join(files_directory, report["file"])
+        with open(base + ".json", "w") as handle:
+            json.dump(report, handle, indent=2)
+        if report["error"] is not None:
+            continue
+        categories = pd.DataFrame({"CATEGORY": list(report["category_totals"]),
+                                   "TOTAL": list(report["category_totals"].values())})
+        categories.to_csv(base + ".categories.csv", index=False)
+        category_rows.append(categories.assign(FILE=report["file"]))
+        if charts:
+            draw_category_chart(report["category_totals"], "{}: {} to {}".format(
+                report["file"], report["start"], report["end"]), base + ".png")
+
+    summary = pd.DataFrame([_summary_row(report) for report in reports], columns=SUMMARY_COLUMNS)
+    # Counts stay integers next to the blanks of failed ledgers
+    summary = summary.astype({"ROWS": "Int64", "TRANSACTIONS": "Int64", "BAD_ROWS": "Int64"})
+    summary.to_csv(os.path.join(output, "summary.csv"), index=False)
+    if category_rows:
+        categories = pd.concat(category_rows, ignore_index=True)[["FILE", "CATEGORY", "TOTAL"]]
+    else:
+        categories = pd.DataFrame(columns=["FILE", "CATEGORY", "TOTAL"])
+    categories.to_csv(os.path.join(output, "categories.csv"), index=False)
+    with open(os.path.join(output, "summary.json"), "w") as handle:
+        json.dump({"combined": combined, "throughput": throughput, "files": reports}, handle, indent=2)
+    if charts:
+        draw_category_chart(combined["category_totals"], "All ledgers ({:,} files)".format(len(reports)),
+                            os.path.join(output, "categories.png"))
+
+
+def _report_all(paths, workers, start_date, end_date, categories):
+    """Yield (index, report, prices) as each ledger finishes."""
+    if workers <= 1 or len(paths) <= 1:
+        for index, path in enumerate(paths):
+            yield (index,) + report_ledger(path, start_date, end_date, categories)
+        return
+    # spawn, as for parsing uploads: workers start from a clean interpreter
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(report_ledger, path, start_date, end_date, categories): index
+                   for index, path in enumerate(paths)}
+        for future in as_completed(futures):
+            yield (futures[future],) + future.result()
+
+
+def run_batch_reports(directory, output, start_date=None, end_date=None, categories=None, workers=None,
+                      charts=True, on_report=None):
+    """Report every ledger in `directory` into `output`; returns the summary.json contents.
+
+    `on_report(report)` is called as each ledger finishes.
+    """
+    paths = ledger_files(directory)
+    workers = min(workers or os.cpu_count() or 1, max(len(paths), 1))
+    started = time.perf_counter()
+    reports = [None] * len(paths)
+    prices = [None] * len(paths)
+    for index, report, ledger_prices in _report_all(paths, workers, start_date, end_date, categories):
+        reports[index], prices[index] = report, ledger_prices
+        if on_report is not None:
+            on_report(report)
+    seconds = time.perf_counter() - started
+
+    read = [report for report in reports if report["error"] is None]
+    rows = sum(report["rows"] for report in read)
+    throughput = {
+        "files": len(paths),
+        "failed": len(paths) - len(read),
+        "rows": rows,
+        "megabytes": sum(report["bytes"] for report in read) / 1024 / 1024,
+        "workers": workers,
+        "seconds": seconds,
+        "files_per_second": len(paths) / seconds if seconds else 0.0,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+    }
+    combined = combine(reports, [ledger_prices for ledger_prices in prices if ledger_prices is not None])
+    combined.update(start=start_date.isoformat() if start_date else None,
+                    end=end_date.isoformat() if end_date else None, categories=categories or None)
+    write_reports(output, reports, combined, throughput, charts=charts)
+    return {"combined": combined, "throughput": throughput, "files": reports}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write spending reports for a directory of CSV/XLSX ledgers.")
+    parser.add_argument("directory", help="directory holding the ledgers")
+    parser.add_argument("--output", default="reports", help="directory to write the reports to")
+    parser.add_argument("--start", type=date.fromisoformat,
+                        help="first day, YYYY-MM-DD (default: each ledger's first)")
+    parser.add_argument("--end", type=date.fromisoformat,
+                        help="last day, YYYY-MM-DD (default: each ledger's last)")
+    parser.add_argument("--category", action="append", dest="categories",
+                        help="only count this category; repeat for several (default: all)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--no-charts", action="store_true", help="skip the PNG charts")
+    args = parser.parse_args(argv)
+
+    if args.start and args.end and args.start > args.end:
+        parser.error("--end must be on or after --start")
+    if not os.path.isdir(args.directory):
+        parser.error("{} is not a directory".format(args.directory))
+
+    def on_report(report):
+        status = "error: " + report["error"] if report["error"] else "{:,} rows".format(report["rows"])
+        print("{:<40} {:>8.2f} s  {}".format(report["file"], report["seconds"], status), file=sys.stderr)
+
+    result = run_batch_reports(args.directory, args.output, args.start, args.end, args.categories,
+                               args.workers, charts=not args.no_charts, on_report=on_report)
+    throughput = result["throughput"]
+    total = result["combined"]["metrics"]["total"]
+    print("{:,} ledgers ({} failed), {:,} rows, {:.1f} MB in {:.2f} s with {} workers".format(
+        throughput["files"], throughput["failed"], throughput["rows"], throughput["megabytes"],
+        throughput["seconds"], throughput["workers"]))
+    print("{:,.1f} ledgers/s, {:,.0f} rows/s; total spend {}".format(
+        throughput["files_per_second"], throughput["rows_per_second"],
+        format_dollars(total) if total is not None else "n/a"))
+    print("Reports written to " + args.output)
+    return 1 if throughput["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# Benchmark runner.
+#
+#   python -m benchmarks.bench --sizes 1k,100k,1m --output results.json
+#   python -m benchmarks.bench --sizes 1k,100k --baseline results.json
+#
+# For each ledger size it times ingestion (CSV, XLSX and a sheet-like
+# frame), date conversion, rule-based categorization, filtering, the
+# metrics block, the category groupby and recurring-charge detection, then optionally runs the three pages headlessly. Every timing is
+# the best of --repeat runs. Results are written as JSON; with --baseline,
+# each timing is compared to the same benchmark in an earlier results file
+# and the exit status is 1 if any got slower by more than --tolerance
+# (and by more than a few milliseconds).
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from analytics import TransactionDataset, normalize_transactions
+from categorize import DEFAULT_RULES, Categorizer
+from ingest import ingest_transactions, ingest_workbook
+from recurring import find_recurring
+from sheets_sync import LocalSheetBackend, SheetSync
+
+from benchmarks.ledger import (DATE_FORMAT, DEFAULT_SEED, XLSX_MAX_ROWS, as_sheet, format_dates,
+                               make_ledger, parse_size, to_csv_bytes, to_xlsx_bytes)
+
+
+DEFAULT_SIZES = "1k,100k,1m"
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.2
+
+# Slowdowns smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.005
+
+# Pages are only run up to this size unless --page-rows says otherwise
+DEFAULT_PAGE_ROWS = 100_000
+
+
+def best_of(function, repeat):
+    """Fastest of `repeat` calls, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def filter_window(dataset):
+    """The middle half of the date range and half of the categories."""
+    first, last = pd.Timestamp(dataset.min_date), pd.Timestamp(dataset.max_date)
+    quarter = (last - first) / 4
+    return (first + quarter).date(), (last - quarter).date(), dataset.categories[::2]
+
+
+def engine_benchmarks(ledger, repeat):
+    """{benchmark: seconds} for one ledger."""
+    rows = len(ledger)
+    results = {}
+
+    csv_bytes = to_csv_bytes(ledger)
+    results["ingest_csv"] = best_of(lambda: ingest_transactions(csv_bytes, "ledger.csv"), repeat)
+
+    if rows <= XLSX_MAX_ROWS:
+        xlsx_bytes = to_xlsx_bytes(ledger)
+        results["ingest_xlsx"] = best_of(lambda: ingest_transactions(xlsx_bytes, "ledger.xlsx"), repeat)
+        # Later loads of the same workbook read its Parquet copy
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ingest_workbook(xlsx_bytes, "ledger.xlsx", cache_dir=cache_dir)
+            results["ingest_xlsx_parquet"] = best_of(
+                lambda: ingest_workbook(xlsx_bytes, "ledger.xlsx", cache_dir=cache_dir), repeat)
+
+    sheet = as_sheet(ledger)
+    results["ingest_sheet"] = best_of(
+        lambda: SheetSync().snapshot("benchmark", LocalSheetBackend({"benchmark": sheet})), repeat)
+
+    date_strings = pd.Series(format_dates(ledger["DATE"]))
+    results["date_conversion"] = best_of(lambda: pd.to_datetime(date_strings, format=DATE_FORMAT), repeat)
+    results["normalize"] = best_of(lambda: normalize_transactions(sheet), repeat)
+
+    # A fresh Categorizer each time, so nothing comes from its memo
+    descriptions = ledger["DESCRIPTION"].to_numpy()
+    results["categorize"] = best_of(lambda: Categorizer(DEFAULT_RULES).categorize(descriptions), repeat)
+
+    dataset = TransactionDataset.from_frame(ledger)
+    start, end, categories = filter_window(dataset)
+    selection = dataset.select(start, end, categories)
+    results["filter"] = best_of(lambda: dataset.select(start, end, categories), repeat)
+    results["metrics"] = best_of(selection.metrics, repeat)
+    results["category_groupby"] = best_of(selection.category_totals, repeat)
+
+    # The dashboard path: the first call builds the rollup, later ones reuse it
+    started = time.perf_counter()
+    dataset.summarize(start, end, categories)
+    results["rollup_build"] = time.perf_counter() - started
+    results["summarize"] = best_of(lambda: dataset.summarize(start, end, categories), repeat)
+
+    descriptions = dataset.frame["DESCRIPTION"].to_numpy()
+    results["recurring"] = best_of(lambda: find_recurring(dataset.dates, descriptions, dataset.prices), repeat)
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def run(sizes, seed, repeat, page_rows):
+    """Benchmark records for every size, as written to the results file."""
+    records = []
+    for rows in sizes:
+        ledger = make_ledger(rows, seed=seed)
+        print("{:,} rows".format(rows), file=sys.stderr)
+        for name, seconds in engine_benchmarks(ledger, repeat).items():
+            records.append({"benchmark": name, "rows": rows, "seconds": seconds})
+            print("  {:<32} {:10.4f} s".format(name, seconds), file=sys.stderr)
+
+        if rows <= page_rows:
+            from benchmarks.pages import run_pages
+
+            for page, steps in run_pages(ledger).items():
+                for step, seconds in steps.items():
+                    name = "page_{}_{}".format(page, step)
+                    records.append({"benchmark": name, "rows": rows, "seconds": seconds})
+                    print("  {:<32} {:10.4f} s".format(name, seconds), file=sys.stderr)
+    return records
+
+
+def compare(records, baseline, tolerance):
+    """Rows of (benchmark, rows, baseline seconds, seconds, ratio, regressed)."""
+    previous = {(record["benchmark"], record["rows"]): record["seconds"] for record in baseline}
+    comparison = []
+    for record in records:
+        key = (record["benchmark"], record["rows"])
+        if key not in previous:
+            continue
+        ratio = record["seconds"] / previous[key] if previous[key] else float("inf")
+        regressed = ratio > 1 + tolerance and record["seconds"] - previous[key] > MIN_REGRESSION_SECONDS
+        comparison.append(key + (previous[key], record["seconds"], ratio, regressed))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, filtering and the pages.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated row counts or names: 1k, 100k, 1m, 10m")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--page-rows", type=parse_size, default=DEFAULT_PAGE_ROWS,
+                        help="largest ledger to run the pages with; 0 skips them")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown before a benchmark counts as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = {
+        "environment": environment(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": run(sizes, args.seed, args.repeat, args.page_rows),
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    comparison = compare(results["results"], baseline, args.tolerance)
+    print("{:<32} {:>12} {:>10} {:>10} {:>7}".format("benchmark", "rows", "baseline", "now", "ratio"))
+    for name, rows, before, now, ratio, regressed in comparison:
+        print("{:<32} {:>12,} {:>10.4f} {:>10.4f} {:>6.2f}x{}".format(
+            name, rows, before, now, ratio, "  SLOWER" if regressed else ""))
+    return 1 if any(row[-1] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
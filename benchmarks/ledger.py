@@ -0,0 +1,116 @@
+# Seeded synthetic ledgers for the benchmarks.
+#
+# Rows look like the upload example (DATE, DESCRIPTION, CATEGORY, PRICE with
+# uppercase merchants and m/d/yy dates), newest first as bank exports are.
+# The same seed and size always produce the same ledger.
+
+import io
+
+import numpy as np
+import pandas as pd
+
+
+# Named sizes accepted by the benchmark CLI
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Excel sheets stop at 1,048,576 rows, and writing large workbooks is slow
+XLSX_MAX_ROWS = 100_000
+
+DEFAULT_SEED = 2024
+DEFAULT_START = "2015-01-01"
+DEFAULT_YEARS = 10
+DATE_FORMAT = "%m/%d/%y"
+
+# Category: (share of transactions, median price, merchants)
+CATEGORIES = {
+    "GROCERIES": (0.22, 45.0, ["WHOLE FOODS", "TRADER JOES", "SAFEWAY", "COSTCO", "CORNER MARKET"]),
+    "DINING": (0.18, 28.0, ["CHIPOTLE", "SWEETGREEN", "DINNER WITH JOE", "PIZZA PLACE", "STARBUCKS"]),
+    "NIGHTLIFE": (0.06, 60.0, ["BAR TAB", "CLUB COVER", "BREWERY"]),
+    "TRANSIT": (0.12, 12.0, ["SUBWAY PASS", "UBER", "LYFT", "CITI BIKE"]),
+    "SHOPPING": (0.12, 70.0, ["AMAZON", "TARGET", "UNIQLO", "BEST BUY"]),
+    "ENTERTAINMENT": (0.08, 18.0, ["NETFLIX", "SPOTIFY", "MOVIE THEATER", "CONCERT TICKETS"]),
+    "FITNESS": (0.05, 60.0, ["GYM", "YOGA CLASS", "RUNNING STORE"]),
+    "UTILITIES": (0.06, 90.0, ["CON EDISON", "VERIZON", "WATER BILL"]),
+    "TRAVEL": (0.04, 320.0, ["DELTA", "AIRBNB", "MARRIOTT"]),
+    "HOUSING": (0.02, 1900.0, ["RENT"]),
+    "HEALTH": (0.05, 40.0, ["CVS", "DENTIST", "COPAY"]),
+}
+
+
+def make_ledger(rows, seed=DEFAULT_SEED, start=DEFAULT_START, years=DEFAULT_YEARS):
+    """A typed ledger: datetime64 DATE, str DESCRIPTION/CATEGORY, float PRICE."""
+    rng = np.random.default_rng(seed)
+    names = list(CATEGORIES)
+    shares = np.array([CATEGORIES[name][0] for name in names])
+    category_codes = rng.choice(len(names), size=rows, p=shares / shares.sum())
+
+    # Lognormal prices around each category's median, in whole cents
+    medians = np.array([CATEGORIES[name][1] for name in names])
+    prices = np.round(medians[category_codes] * rng.lognormal(0.0, 0.6, size=rows), 2)
+    prices = np.maximum(prices, 0.01)
+
+    # Merchants are drawn within each category
+    descriptions = np.empty(rows, dtype=object)
+    for code, name in enumerate(names):
+        rows_in_category = np.flatnonzero(category_codes == code)
+        merchants = np.array(CATEGORIES[name][2], dtype=object)
+        descriptions[rows_in_category] = merchants[rng.integers(0, len(merchants), rows_in_category.size)]
+
+    # Newest first
+    days = np.sort(rng.integers(0, 365 * years, size=rows))[::-1]
+    dates = np.datetime64(start, "D") + days
+
+    return pd.DataFrame({
+        "DATE": pd.to_datetime(dates),
+        "DESCRIPTION": descriptions,
+        "CATEGORY": np.array(names, dtype=object)[category_codes],
+        "PRICE": prices,
+    })
+
+
+def format_dates(dates, date_format=DATE_FORMAT):
+    """Dates as strings, formatting each distinct day once."""
+    days, inverse = np.unique(dates.values.astype("datetime64[D]"), return_inverse=True)
+    labels = pd.to_datetime(days).strftime(date_format).to_numpy(dtype=object)
+    return labels[inverse]
+
+
+def as_sheet(ledger, date_format=DATE_FORMAT):
+    """The ledger as a Google Sheets read returns it: dates as text, plus a blank fifth column."""
+    sheet = ledger.copy()
+    sheet["DATE"] = format_dates(ledger["DATE"], date_format)
+    sheet["NOTES"] = None
+    return sheet
+
+
+def to_csv_bytes(ledger, date_format=DATE_FORMAT):
+    """CSV bytes written through pyarrow, which is much faster than DataFrame.to_csv."""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    table = pa.table({
+        "DATE": pa.array(format_dates(ledger["DATE"], date_format), type=pa.string()),
+        "DESCRIPTION": pa.array(ledger["DESCRIPTION"], type=pa.string()),
+        "CATEGORY": pa.array(ledger["CATEGORY"], type=pa.string()),
+        "PRICE": pa.array(ledger["PRICE"], type=pa.float64()),
+    })
+    buffer = io.BytesIO()
+    pa_csv.write_csv(table, buffer)
+    return buffer.getvalue()
+
+
+def to_xlsx_bytes(ledger, date_format=DATE_FORMAT):
+    """XLSX bytes with text dates, as the upload example has them."""
+    if len(ledger) > XLSX_MAX_ROWS:
+        raise ValueError("XLSX ledgers are limited to {:,} rows".format(XLSX_MAX_ROWS))
+    frame = ledger.copy()
+    frame["DATE"] = format_dates(ledger["DATE"], date_format)
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def parse_size(text):
+    """Row count for a named size ("100k") or a plain integer."""
+    text = text.strip().lower()
+    return SIZES[text] if text in SIZES else int(text.replace("_", "").replace(",", ""))
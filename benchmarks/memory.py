@@ -0,0 +1,94 @@
+# Memory per million rows, by column.
+#
+#   python -m benchmarks.memory --rows 1m --output memory.json
+#
+# Compares a ledger laid out the way pages used to hold it (DATE as Python
+# date objects, CATEGORY and DESCRIPTION as one string object per row,
+# PRICE as float dollars) with the compact TransactionDataset layout
+# (datetime64 dates, categorical CATEGORY, shared description strings and
+# int64 cents), and checks that float and integer-cent totals format the
+# same way.
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from analytics import TransactionDataset, column_memory, format_dollars
+
+from benchmarks.ledger import DEFAULT_SEED, make_ledger, parse_size
+
+
+MB = 1024 * 1024
+
+
+def _distinct_strings(values):
+    # encode/decode makes a new string object for every row, as a CSV reader does
+    return np.array([value.encode().decode() for value in values], dtype=object)
+
+
+def legacy_frame(ledger):
+    """The ledger with one Python object per row in every non-numeric column."""
+    return pd.DataFrame({
+        "DATE": ledger["DATE"].dt.date,
+        "DESCRIPTION": _distinct_strings(ledger["DESCRIPTION"]),
+        "CATEGORY": _distinct_strings(ledger["CATEGORY"]),
+        "PRICE": ledger["PRICE"].astype(np.float64),
+    })
+
+
+def memory_report(rows, seed=DEFAULT_SEED):
+    """{"columns": {column: {"legacy_mb", "compact_mb"}}, ...} scaled to one million rows."""
+    ledger = make_ledger(rows, seed=seed)
+    legacy = legacy_frame(ledger)
+    dataset = TransactionDataset.from_frame(legacy)
+    scale = 1_000_000 / rows
+
+    before = column_memory(legacy)
+    after = column_memory(dataset.frame)
+    columns = {column: {"legacy_mb": before[column] * scale / MB, "compact_mb": after[column] * scale / MB}
+               for column in before.index}
+    # Integer cents are kept next to the float PRICE column
+    columns["CENTS"] = {"legacy_mb": 0.0, "compact_mb": dataset.cents.nbytes * scale / MB}
+
+    float_total = float(legacy["PRICE"].sum())
+    cents_total = dataset.select(dataset.min_date, dataset.max_date).metrics().total
+    dataset.summarize(dataset.min_date, dataset.max_date)
+    return {
+        "rows": rows,
+        "columns": columns,
+        "legacy_mb": sum(column["legacy_mb"] for column in columns.values()),
+        "compact_mb": sum(column["compact_mb"] for column in columns.values()),
+        "rollup_mb": dataset.rollup.nbytes * scale / MB,
+        "float_total": format_dollars(float_total),
+        "cents_total": format_dollars(cents_total),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report memory per million rows by column.")
+    parser.add_argument("--rows", type=parse_size, default=parse_size("1m"),
+                        help="ledger size to measure: 1k, 100k, 1m, 10m or a number")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="write the report as JSON here")
+    args = parser.parse_args(argv)
+
+    report = memory_report(args.rows, args.seed)
+    print("MB per million rows ({:,} rows measured)".format(report["rows"]))
+    print("{:<16} {:>10} {:>10}".format("column", "legacy", "compact"))
+    for column, sizes in report["columns"].items():
+        print("{:<16} {:>10.1f} {:>10.1f}".format(column, sizes["legacy_mb"], sizes["compact_mb"]))
+    print("{:<16} {:>10.1f} {:>10.1f}".format("total", report["legacy_mb"], report["compact_mb"]))
+    print("{:<16} {:>21.1f}".format("rollup", report["rollup_mb"]))
+    print("total spend: {} (float dollars), {} (integer cents)".format(report["float_total"],
+                                                                       report["cents_total"]))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
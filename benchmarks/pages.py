@@ -0,0 +1,130 @@
+# Headless end-to-end timings of the three pages.
+#
+# Each page runs through Streamlit's AppTest harness with the outside world
+# stubbed: the file uploader returns a generated ledger, Google Sheets reads
+# come from a LocalSheetBackend, and the LLM returns canned SQL and agent
+# answers instead of calling OpenAI.
+
+import contextlib
+import os
+import time
+from unittest import mock
+
+import assistant
+import sheets_sync
+import startup
+from fake_llm import FakeAgent, FakeChatModel
+from ingest import get_ingestion_cache
+
+from benchmarks.ledger import as_sheet, to_csv_bytes
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = {
+    "upload": "pages/⬆️_Upload_Your_Data.py",
+    "hk_finances": "pages/🔐_HK_Finances.py",
+    "link_sheet": "pages/🔗_Link_Your_Google_Sheet.py",
+}
+SECRET_KEY = "benchmark"
+LINKED_SHEET = "https://docs.google.com/spreadsheets/d/benchmark/edit"
+QUESTION = "which merchants look like subscriptions"
+RUN_TIMEOUT_SECONDS = 600
+
+
+class FakeUpload:
+    """Just enough of Streamlit's UploadedFile for the upload page."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.file_id = name
+        self._data = data
+
+    def getvalue(self):
+        return self._data
+
+
+class _AnySheet(dict):
+    """Serves the same sheet for every URL."""
+
+    def __init__(self, frame):
+        super().__init__()
+        self.frame = frame
+
+    def __missing__(self, key):
+        return self.frame
+
+
+@contextlib.contextmanager
+def stubbed_backends(ledger):
+    """Patch the uploader, Sheets connection and LLM for one ledger."""
+    sheet_backend = sheets_sync.LocalSheetBackend()
+    sheet_backend.sheets = _AnySheet(as_sheet(ledger))
+    upload = FakeUpload("ledger.csv", to_csv_bytes(ledger))
+    settings = startup.get_settings()._replace(secret_key=SECRET_KEY, store_path=None,
+                                               answer_cache_path=None, prewarm=False)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch("streamlit.file_uploader", return_value=[upload]))
+        stack.enter_context(mock.patch.object(sheets_sync, "connect_gsheets", return_value=None))
+        stack.enter_context(mock.patch.object(sheets_sync, "GSheetsBackend",
+                                              side_effect=lambda connection: sheet_backend))
+        stack.enter_context(mock.patch.object(sheets_sync, "_sheet_sync", None))
+        stack.enter_context(mock.patch.object(assistant, "build_chat",
+                                              side_effect=lambda api_key, streaming=False: FakeChatModel(latency=0)))
+        stack.enter_context(mock.patch.object(assistant, "build_agent",
+                                              side_effect=lambda frame, api_key, streaming=False: FakeAgent(steps=0)))
+        stack.enter_context(mock.patch.object(startup, "_settings", settings))
+        yield
+
+
+def _button(app, label):
+    return next(button for button in app.button if button.label == label)
+
+
+def _text_input(app, label_start):
+    return next(text_input for text_input in app.text_input if text_input.label.startswith(label_start))
+
+
+def _check(app, page):
+    if app.exception:
+        raise RuntimeError("{} page raised: {}".format(page, app.exception[0].value))
+
+
+def run_page(page):
+    """Seconds for the first render with data, one question and the monthly review."""
+    from streamlit.testing.v1 import AppTest
+
+    get_ingestion_cache().clear()
+    app = AppTest.from_file(os.path.join(ROOT, PAGES[page]), default_timeout=RUN_TIMEOUT_SECONDS)
+
+    # Get each page to the point where its dashboard is shown
+    started = time.perf_counter()
+    app.run()
+    if page == "hk_finances":
+        _text_input(app, "Enter Secret Key").input(SECRET_KEY).run()
+    elif page == "link_sheet":
+        _text_input(app, "Enter the Google Sheet").input(LINKED_SHEET).run()
+    first_render = time.perf_counter() - started
+    _check(app, page)
+
+    started = time.perf_counter()
+    _text_input(app, "Enter your question").input(QUESTION)
+    _button(app, "Submit").click().run()
+    question = time.perf_counter() - started
+    _check(app, page)
+
+    started = time.perf_counter()
+    _button(app, "Run review").click().run()
+    review = time.perf_counter() - started
+    _check(app, page)
+    return {"first_render": first_render, "question": question, "review": review}
+
+
+def run_pages(ledger, pages=tuple(PAGES)):
+    """{page: {step: seconds}} for every page, with backends stubbed."""
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        with stubbed_backends(ledger):
+            return {page: run_page(page) for page in pages}
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,272 @@
+# Rule-based categorization of transactions that arrive without a category.
+#
+# Merchant and keyword rules are compiled into one regular expression, so a
+# description is matched against every rule in a single pass. Matching runs
+# over the distinct normalized descriptions rather than every row (a
+# million-row export usually has a few thousand), and each description's
+# label is memoized for the life of the process. normalize_transactions()
+# calls this for rows whose CATEGORY is blank or "Uncategorized", so the
+# filters and metrics only ever see categorized rows. The few descriptions
+# no rule matches can be labelled by the LLM in one batch with
+# label_with_llm(); its answers go into a Categorizer of their own, made
+# with with_labels(), so they never change the shared one.
+
+import copy
+import json
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from analytics import UNCATEGORIZED, TransactionDataset, find_description_column
+
+
+# `kind` is "merchant" (the description starts with the pattern) or "keyword" (the pattern appears as words)
+Rule = namedtuple("Rule", ["pattern", "category", "kind"])
+
+RULE_KINDS = ("merchant", "keyword")
+
+# Rules for common merchants, using the categories of the upload example. Patterns
+# match whole words only, and names shared with unrelated businesses (e.g. "delta"
+# for Delta Dental, "steam" for steam cleaning, "club" for warehouse clubs) are
+# spelled out or left to a rules file, since a wrong default silently moves spend
+# between categories.
+DEFAULT_RULES = [
+    Rule(pattern, category, "merchant") for category, patterns in {
+        "GROCERIES": ["whole foods", "trader joe", "trader joes", "safeway", "costco", "kroger", "aldi",
+                      "wegmans", "publix", "instacart"],
+        "DINING": ["chipotle", "sweetgreen", "starbucks", "mcdonalds", "dunkin", "doordash", "grubhub",
+                   "uber eats", "seamless"],
+        "TRANSIT": ["uber", "lyft", "citi bike", "mta", "bart clipper", "clipper card", "amtrak"],
+        "SHOPPING": ["amazon", "amzn", "target com", "target store", "walmart", "uniqlo", "best buy", "ikea",
+                     "etsy"],
+        "ENTERTAINMENT": ["netflix", "spotify", "hulu", "disney plus", "hbo max", "apple music", "steampowered",
+                          "steam games"],
+        "UTILITIES": ["con edison", "coned", "verizon", "at t", "t mobile", "comcast", "xfinity", "pg e"],
+        "TRAVEL": ["delta air", "united airlines", "american airlines", "jetblue", "southwest air", "airbnb",
+                   "marriott", "hilton", "expedia"],
+        "HEALTH": ["cvs", "walgreens", "rite aid"],
+    }.items() for pattern in patterns
+] + [
+    Rule(pattern, category, "keyword") for category, patterns in {
+        "GROCERIES": ["grocery", "groceries", "market", "supermarket"],
+        "DINING": ["restaurant", "cafe", "coffee", "pizza", "dinner", "lunch", "breakfast", "bistro", "grill"],
+        "NIGHTLIFE": ["bar", "pub", "brewery", "nightclub", "cover charge", "tavern", "lounge"],
+        "TRANSIT": ["subway", "metro", "transit", "taxi", "parking", "toll", "fuel", "gas station"],
+        "ENTERTAINMENT": ["movie", "theater", "theatre", "cinema", "concert", "tickets"],
+        "FITNESS": ["gym", "yoga", "fitness", "pilates", "climbing"],
+        "UTILITIES": ["electric", "water bill", "internet", "phone bill", "utility"],
+        "TRAVEL": ["airline", "airlines", "hotel", "flight"],
+        "HOUSING": ["rent", "mortgage", "hoa"],
+        "HEALTH": ["pharmacy", "dentist", "doctor", "copay", "clinic", "hospital"],
+    }.items() for pattern in patterns
+]
+
+# Distinct descriptions remembered before the memo is reset
+MEMO_MAX_ENTRIES = 500_000
+
+# Descriptions sent to the LLM in one request, and per dataset at most
+LLM_BATCH_SIZE = 50
+LLM_MAX_DESCRIPTIONS = 200
+
+LLM_PROMPT = """Assign each bank transaction description below to one of these categories:
+{categories}
+
+Descriptions:
+{descriptions}
+
+Reply with only a JSON object mapping each description's number to its category, \
+using the category names exactly as listed, or null when none fits."""
+
+
+def normalize_descriptions(values):
+    """Lowercase words of each description, without digits or punctuation."""
+    return (pd.Series(values, dtype=object).fillna("").astype(str).str.lower()
+            .str.replace(r"[^a-z]+", " ", regex=True).str.strip())
+
+
+def _alternation(patterns):
+    # Longest first, so "uber eats" wins over "uber" at the same position
+    return "|".join(re.escape(pattern) for pattern in sorted(patterns, key=len, reverse=True))
+
+
+def load_rules(path):
+    """Rules from a CSV file with PATTERN, CATEGORY and optional KIND columns."""
+    table = pd.read_csv(path, dtype=str).rename(columns=str.upper)
+    missing = [column for column in ("PATTERN", "CATEGORY") if column not in table.columns]
+    if missing:
+        raise ValueError("Missing required columns in {}: {}".format(path, ", ".join(missing)))
+    if "KIND" not in table.columns:
+        table["KIND"] = "keyword"
+    table = table.dropna(subset=["PATTERN", "CATEGORY"])
+    kinds = table["KIND"].fillna("keyword").str.strip().str.lower()
+    unknown = sorted(set(kinds) - set(RULE_KINDS))
+    if unknown:
+        raise ValueError("Unknown rule kinds in {}: {}".format(path, ", ".join(unknown)))
+    return [Rule(pattern, category.strip(), kind)
+            for pattern, category, kind in zip(table["PATTERN"], table["CATEGORY"], kinds)]
+
+
+class Categorizer:
+    """Labels descriptions with the first matching rule; thread-safe."""
+
+    def __init__(self, rules):
+        # Later rules for the same pattern override earlier ones
+        self.merchants = {}
+        self.keywords = {}
+        for rule in rules:
+            pattern = normalize_descriptions([rule.pattern])[0]
+            if pattern:
+                (self.merchants if rule.kind == "merchant" else self.keywords)[pattern] = rule.category
+        self.categories = sorted(set(self.merchants.values()) | set(self.keywords.values()))
+
+        # A merchant at the start of the description is tried before any keyword
+        branches = []
+        if self.merchants:
+            branches.append(r"^(?P<merchant>{})\b".format(_alternation(self.merchants)))
+        if self.keywords:
+            branches.append(r"\b(?P<keyword>{})\b".format(_alternation(self.keywords)))
+        self._pattern = re.compile("|".join(branches)) if branches else None
+
+        self.learned = {}
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _match(self, normalized):
+        """Category per normalized description, or None."""
+        labels = normalized.map(self.learned)
+        if self._pattern is not None:
+            matches = normalized[labels.isna()].str.extract(self._pattern)
+            for group, lookup in (("merchant", self.merchants), ("keyword", self.keywords)):
+                if group in matches:
+                    labels = labels.fillna(matches[group].map(lookup))
+        return labels.astype(object).where(labels.notna(), None)
+
+    def categorize(self, descriptions):
+        """Category per description (None where no rule matches), as an object array."""
+        codes, uniques = pd.factorize(pd.Series(descriptions, dtype=object), use_na_sentinel=True)
+        with self._lock:
+            labels = np.array([self._memo.get(value) for value in uniques], dtype=object)
+            unknown = np.flatnonzero([value not in self._memo for value in uniques])
+            if unknown.size:
+                matched = self._match(normalize_descriptions(uniques[unknown])).to_numpy(dtype=object)
+                labels[unknown] = matched
+                if len(self._memo) + unknown.size > MEMO_MAX_ENTRIES:
+                    self._memo.clear()
+                self._memo.update(zip(uniques[unknown], matched))
+
+        # Missing descriptions (code -1) take the extra None at the end
+        return np.append(labels, None)[codes]
+
+    def with_labels(self, labels):
+        """A Categorizer with the same rules that also treats {description: category} as exact rules.
+
+        This one is left unchanged, so labels meant for one session or
+        dataset can be layered over the process-wide rules.
+        """
+        normalized = normalize_descriptions(list(labels))
+        layered = copy.copy(self)
+        layered.learned = dict(self.learned)
+        layered.learned.update((key, category) for key, category in zip(normalized, labels.values())
+                               if key and category)
+        with self._lock:
+            # Earlier misses may match now
+            layered._memo = {value: label for value, label in self._memo.items() if label is not None}
+        layered._lock = threading.Lock()
+        return layered
+
+
+def fill_categories(frame, categorizer=None):
+    """Label the "Uncategorized" rows of a normalized frame in place from their descriptions.
+
+    Returns the number of rows that were labelled.
+    """
+    description_column = find_description_column(frame)
+    missing = (frame["CATEGORY"] == UNCATEGORIZED).to_numpy()
+    if description_column is None or not missing.any():
+        return 0
+
+    categorizer = get_categorizer() if categorizer is None else categorizer
+    labels = categorizer.categorize(frame[description_column].to_numpy()[missing])
+    found = pd.notna(labels)
+    if not found.any():
+        return 0
+    category = frame["CATEGORY"].to_numpy(dtype=object, copy=True)
+    category[np.flatnonzero(missing)[found]] = labels[found]
+    frame["CATEGORY"] = category
+    return int(found.sum())
+
+
+def uncategorized_descriptions(dataset, limit=LLM_MAX_DESCRIPTIONS):
+    """Row counts of the most frequent distinct descriptions among the dataset's uncategorized rows."""
+    code = dataset.category_codes_for([UNCATEGORIZED])
+    description_column = find_description_column(dataset.frame)
+    if not code.size or description_column is None:
+        return pd.Series([], dtype=np.int64)
+    descriptions = dataset.frame[description_column][dataset.category_codes == code[0]].dropna().astype(str)
+    return descriptions[descriptions.str.strip() != ""].value_counts().head(limit)
+
+
+def _parse_labels(text, batch, categories):
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if match is None:
+        return {}
+    try:
+        reply = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    allowed = {category.lower(): category for category in categories}
+    labels = {}
+    for number, category in reply.items():
+        if str(number).isdigit() and 1 <= int(number) <= len(batch) and isinstance(category, str):
+            if category.strip().lower() in allowed:
+                labels[batch[int(number) - 1]] = allowed[category.strip().lower()]
+    return labels
+
+
+def label_with_llm(chat, descriptions, categories, batch_size=LLM_BATCH_SIZE):
+    """{description: category} for the descriptions the LLM could place in `categories`."""
+    categories = [category for category in categories if category != UNCATEGORIZED]
+    labels = {}
+    for start in range(0, len(descriptions), batch_size):
+        batch = list(descriptions[start:start + batch_size])
+        prompt = LLM_PROMPT.format(
+            categories="\n".join("- " + category for category in categories),
+            descriptions="\n".join("{}. {}".format(number, description)
+                                   for number, description in enumerate(batch, start=1)))
+        labels.update(_parse_labels(chat.invoke(prompt).content, batch, categories))
+    return labels
+
+
+def recategorize(dataset, categorizer=None):
+    """The dataset with uncategorized rows relabelled by the current rules, or itself if none changed."""
+    frame = dataset.frame.copy()
+    if not fill_categories(frame, categorizer):
+        return dataset
+    return TransactionDataset(frame)
+
+
+# Categorizer shared by every session, built on first use
+_categorizer = None
+_categorizer_lock = threading.Lock()
+
+
+def get_categorizer():
+    """The process-wide Categorizer: DEFAULT_RULES plus the rules file from the settings.
+
+    It only ever holds these rules; labels learned in a session go into
+    a copy made with Categorizer.with_labels().
+    """
+    global _categorizer
+    with _categorizer_lock:
+        if _categorizer is None:
+            from startup import get_settings
+
+            rules = list(DEFAULT_RULES)
+            path = get_settings().category_rules_path
+            if path:
+                rules += load_rules(path)
+            _categorizer = Categorizer(rules)
+        return _categorizer
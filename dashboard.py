@@ -0,0 +1,455 @@
+# Shared Streamlit sections used by the pages
+
+import math
+import time
+from collections import namedtuple
+
+import pandas as pd
+import streamlit as st
+
+from alerts import default_budgets
+from analytics import format_dollars
+from assistant import AGENT_ENGINE, SQL_ENGINE, Assistant, get_answer_cache, run_batch
+from categorize import get_categorizer, label_with_llm, recategorize, uncategorized_descriptions
+from instrumentation import span
+from registry import get_dataset_registry
+from startup import get_settings
+from text_to_sql import QueryError, QueryTimeoutError, UnsafeQueryError
+from workbook import guess_header_row, guess_table, outline
+
+
+# Filters chosen on the dashboard
+DashboardFilters = namedtuple("DashboardFilters", ["start_date", "end_date", "categories"])
+
+# What the dashboard shows for one set of filters
+SpendingView = namedtuple("SpendingView", ["summary", "timeline", "recurring"])
+
+# Page sizes offered by the raw-data viewer
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Chart captions per spending-over-time bucket
+GRANULARITY_LABELS = {"day": "Daily", "week": "Weekly (weeks start Monday)", "month": "Monthly"}
+
+# Default questions for the batch review; users can edit the list. All but the
+# last are answered locally, so by default a review sends one model request.
+MONTHLY_REVIEW_QUESTIONS = [
+    "How much did I spend last month?",
+    "How much did I spend last month by category?",
+    "What were my top 5 categories last month?",
+    "How does last month's spending compare to the month before?",
+]
+
+
+def _spending_view(source, filters):
+    start_date, end_date, categories = filters
+    with span("dashboard.filter", categories=len(categories)) as current:
+        summary = source.summarize(start_date, end_date, categories)
+        current.set(rows=summary.count)
+    if summary.count == 0:
+        return SpendingView(summary, None, None)
+    with span("dashboard.timeline") as current:
+        timeline = source.spending_over_time(start_date, end_date, categories)
+        current.set(points=len(timeline), granularity=timeline.index.name)
+    with span("dashboard.recurring") as current:
+        recurring = source.recurring_charges()
+        if categories:
+            recurring = recurring[recurring["CATEGORY"].isin(categories)]
+        current.set(charges=len(recurring))
+    return SpendingView(summary, timeline, recurring)
+
+
+def show_spending_dashboard(source, default_start, default_end, sections):
+    """Date/category filters, spend metrics and the category bar chart.
+
+    `source` is anything with `categories` and `summarize()`: a
+    TransactionDataset or a TransactionHistory, provided to `sections` as
+    the "source" section. The figures are the "dashboard" section,
+    recomputed only when the filters or the source change. Returns the
+    chosen DashboardFilters, or None when the date range is invalid.
+    """
+    # Set up date inputs
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Start date", default_start)
+    with col2:
+        end_date = st.date_input("End date", default_end)
+
+    # Selecting categories; a store looks them up with a query, so they are kept until the source changes
+    options = sections.run("categories", (), lambda: source.categories, depends_on=["source"])
+    categories = st.multiselect("Filter by Category", options, placeholder="Default: all")
+
+    # Formatting date inputs
+    formatted_start = start_date.strftime("%B %d, %Y")
+    formatted_end = end_date.strftime("%B %d, %Y")
+
+    st.divider()
+
+    # Display date range and selected categories
+    st.subheader("🗓 " + formatted_start + " to " + formatted_end)
+    if not categories:
+        st.subheader("🗂 All Categories")
+    else:
+        subheader_text = " + ".join(categories)
+        st.subheader("🗂 Categories: " + subheader_text)
+
+    if start_date > end_date:
+        st.error("End date must be after start date.")
+        return None
+
+    # Metrics, category totals, timeline and recurring charges for the date range and selected categories
+    filters = DashboardFilters(start_date, end_date, categories)
+    view = sections.run("dashboard", filters, lambda: _spending_view(source, filters), depends_on=["source"])
+    summary = view.summary
+    if summary.count == 0:
+        st.info("No transactions match these filters.")
+        return filters
+
+    # Display spending metrics
+    metrics = summary.metrics
+    column_names = ["Min Spend", "Median Spend", "Max Spend", "Total Spend"]
+    formatted_values = [format_dollars(metrics.min), format_dollars(metrics.median),
+                        format_dollars(metrics.max), format_dollars(metrics.total)]
+
+    with span("dashboard.metrics"):
+        for col, name, value in zip(st.columns(4), column_names, formatted_values):
+            with col:
+                st.metric(name, value)
+
+    # Display spending distribution by category using a bar chart
+    st.subheader("Spending Distribution")
+    with span("dashboard.chart", bars=len(summary.category_totals)):
+        st.bar_chart(summary.category_totals)
+
+    # Spending over time, bucketed so the chart never gets too many points
+    st.subheader("Spending Over Time")
+    st.bar_chart(view.timeline)
+    st.caption("{} totals".format(GRANULARITY_LABELS[view.timeline.index.name.lower()]))
+
+    # Subscriptions, rent and other charges that repeat on a schedule, over the whole history
+    st.subheader("🔁 Recurring Charges")
+    recurring = view.recurring
+    if recurring.empty:
+        st.caption("No recurring charges found.")
+    else:
+        show_recurring_charges(recurring)
+
+    return filters
+
+
+def show_recurring_charges(recurring):
+    """Recurring-charge table with dollar amounts and dates formatted for display."""
+    table = pd.DataFrame({
+        "Merchant": recurring["MERCHANT"],
+        "Category": recurring["CATEGORY"],
+        "Every": recurring["CADENCE"],
+        "Amount": recurring["AMOUNT"].map(format_dollars),
+        "Charges": recurring["CHARGES"],
+        "Last Charged": recurring["LAST_DATE"].dt.date,
+        "Next Expected": recurring["NEXT_DATE"].dt.date,
+        "Per Year": recurring["ANNUAL_COST"].map(format_dollars),
+    })
+    st.dataframe(table, hide_index=True, use_container_width=True)
+    st.caption("{:,} recurring charges, about {} a year".format(
+        len(recurring), format_dollars(recurring["ANNUAL_COST"].sum())))
+
+
+def show_alerts(engine, categories, source):
+    """Monthly budgets against month-to-date spend, and charges far above their usual amount.
+
+    `source` is the one the engine was made for (e.g. the spreadsheet URL);
+    budgets are kept per source.
+    """
+    st.subheader("🚨 Budgets and Alerts")
+
+    # Each session edits its own budgets for each source, starting from the budgets file
+    budgets_key = "budgets:" + source
+    if budgets_key not in st.session_state:
+        st.session_state[budgets_key] = default_budgets()
+    budgets = st.session_state[budgets_key]
+    with st.expander("Set monthly budgets"):
+        edited = st.data_editor(
+            pd.DataFrame({"Category": categories,
+                          "Monthly Budget": [budgets.get(category) for category in categories]}, dtype=object),
+            disabled=["Category"], hide_index=True, use_container_width=True, key="budget_editor:" + source)
+        budgets.update(zip(edited["Category"], pd.to_numeric(edited["Monthly Budget"], errors="coerce")))
+
+    status = engine.budget_status(budgets)
+    if status.empty:
+        st.caption("No monthly budgets set.")
+    else:
+        for row in status[status["STATUS"] == "Over budget"].itertuples():
+            st.warning("⚠️ {} is over budget: {} of {}".format(row.CATEGORY, format_dollars(row.SPENT),
+                                                               format_dollars(row.BUDGET)))
+        st.dataframe(pd.DataFrame({
+            "Category": status["CATEGORY"],
+            "Budget": status["BUDGET"].map(format_dollars),
+            "Spent": status["SPENT"].map(format_dollars),
+            "Used": status["USED"].map("{:.0%}".format),
+            "Status": status["STATUS"],
+        }), hide_index=True, use_container_width=True)
+        st.caption("Month to date for {}".format(engine.latest_month.strftime("%B %Y")))
+
+    alerts = engine.recent_alerts()
+    if alerts.empty:
+        st.caption("No unusual charges.")
+    else:
+        st.dataframe(pd.DataFrame({
+            "Date": alerts["DATE"].dt.date,
+            "Description": alerts["DESCRIPTION"],
+            "Category": alerts["CATEGORY"],
+            "Amount": alerts["PRICE"].map(format_dollars),
+            "Usually": alerts["TYPICAL"].map(format_dollars),
+            "Times Usual": alerts["TIMES"].map("{:.1f}×".format),
+            "Compared To": alerts["COMPARED_TO"],
+        }), hide_index=True, use_container_width=True)
+        st.caption("{:,} charges far above their merchant's (or category's) usual amount".format(len(alerts)))
+
+
+def show_raw_data(dataset, key, sections):
+    """Searchable, sortable raw rows, sending only the visible page to the browser.
+
+    `key` keeps the widgets of different pages apart. The matching rows are
+    the "raw_data" section of `sections`.
+    """
+    view = dataset.raw_view
+    col1, col2, col3 = st.columns([3, 2, 1])
+    with col1:
+        search = st.text_input("Search", key=key + "_search", placeholder="Description or category")
+    with col2:
+        sort_by = st.selectbox("Sort by", view.columns, key=key + "_sort")
+    with col3:
+        descending = st.checkbox("Descending", key=key + "_descending")
+    categories = st.multiselect("Category", dataset.categories, key=key + "_categories",
+                                placeholder="Default: all")
+
+    def query():
+        with span("raw_data.query", rows=len(dataset)) as current:
+            positions = view.query(search, categories, sort_by, ascending=not descending)
+            current.set(matches=len(positions))
+        return positions
+
+    positions = sections.run("raw_data", (search, categories, sort_by, descending), query, depends_on=["data"])
+    if len(positions) == 0:
+        st.info("No rows match.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col2:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=key + "_page_size")
+    page_count = math.ceil(len(positions) / page_size)
+    with col1:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key=key + "_page")
+
+    st.dataframe(view.page(positions, page, page_size), use_container_width=True)
+    first = (page - 1) * page_size + 1
+    st.caption("Rows {:,}–{:,} of {:,}".format(first, min(first + page_size - 1, len(positions)),
+                                              len(positions)))
+
+
+def show_categorization(dataset, sections):
+    """Offer to label the descriptions no rule matched with the LLM; returns the dataset to analyze."""
+    relabelled = st.session_state.setdefault("relabelled_datasets", {})
+    original = dataset
+    dataset = relabelled.get(original.fingerprint, original)
+    descriptions = sections.run("categorization", dataset.fingerprint,
+                                lambda: uncategorized_descriptions(dataset))
+    if descriptions.empty:
+        return dataset
+
+    with st.expander("🪄 {:,} transactions could not be categorized automatically".format(descriptions.sum())):
+        st.write("No merchant or keyword rule matched these descriptions:")
+        st.dataframe(descriptions.rename("Transactions").rename_axis("Description"), use_container_width=True)
+        if st.button("Categorize them with AI"):
+            categories = sorted(set(dataset.categories) | set(get_categorizer().categories))
+            with st.spinner("Categorizing {:,} descriptions...".format(len(descriptions))):
+                with span("categorize.llm", descriptions=len(descriptions)) as current:
+                    labels = label_with_llm(get_assistant(dataset).chat, list(descriptions.index), categories)
+                    current.set(labelled=len(labels))
+            # The labels apply to this session's uploads only, never to the shared rules
+            learned = st.session_state.setdefault("learned_labels", {})
+            learned.update(labels)
+            dataset = recategorize(dataset, get_categorizer().with_labels(learned))
+            # Only the latest upload's relabelled copy is kept
+            relabelled.clear()
+            relabelled[original.fingerprint] = dataset
+            st.success("✅ Categorized {:,} of {:,} descriptions".format(len(labels), len(descriptions)))
+    return dataset
+
+
+def show_workbook_options(data, digest):
+    """Pick the sheet and header row of an uploaded workbook; returns (sheet, 0-based header row)."""
+    # The first rows of every sheet, read once per workbook
+    outlines = st.session_state.setdefault("workbook_outlines", {})
+    if digest not in outlines:
+        outlines.clear()
+        outlines[digest] = outline(data)
+    previews = outlines[digest]
+
+    sheets = list(previews)
+    sheet = guess_table(previews)[0]
+    if len(sheets) > 1:
+        sheet = st.selectbox("📑 Sheet", sheets, index=sheets.index(sheet), key="workbook_sheet_" + digest)
+    preview = previews[sheet]
+    header_row = st.number_input("Header row", min_value=1, max_value=max(len(preview), 1),
+                                 value=guess_header_row(preview) + 1,
+                                 key="workbook_header_{}_{}".format(digest, sheet),
+                                 help="The row of the sheet that holds the column names")
+    with st.expander("Preview sheet"):
+        # Cells as text, since a column can mix dates, numbers and titles
+        preview = preview.where(preview.notna(), "").astype(str).set_axis(range(1, len(preview) + 1))
+        st.dataframe(preview, use_container_width=True)
+    return sheet, int(header_row) - 1
+
+
+def show_sheet_status(snapshot):
+    """Caption describing how fresh a synced Google Sheet snapshot is."""
+    age = int(time.time() - snapshot.fetched_at)
+    status = "🔄 Synced {}s ago ({:,} rows)".format(age, len(snapshot.data))
+    if snapshot.refreshing:
+        status += " · refreshing in the background"
+    st.caption(status)
+    if snapshot.error is not None:
+        st.warning("Showing the last good copy of this sheet; the latest refresh failed: {}".format(snapshot.error))
+
+
+def get_assistant(dataset):
+    """The Assistant for `dataset`, reused across reruns.
+
+    Datasets in the shared registry have one Assistant for every session;
+    others get one per session.
+    """
+    assistant = get_dataset_registry().shared(
+        dataset, "assistant", lambda: Assistant(dataset, get_settings().openai_api_key, get_answer_cache()))
+    if assistant is not None:
+        return assistant
+
+    assistants = st.session_state.setdefault("assistants", {})
+    assistant = assistants.get(dataset.fingerprint)
+    if assistant is None:
+        # Keep only a few datasets' agents per session
+        while len(assistants) >= 3:
+            assistants.pop(next(iter(assistants)))
+        assistant = Assistant(dataset, get_settings().openai_api_key, get_answer_cache())
+        assistants[dataset.fingerprint] = assistant
+    return assistant
+
+
+def show_answer(answer):
+    """Text, table and SQL of an Answer."""
+    if answer.text:
+        st.write(answer.text)
+    if answer.table is not None:
+        st.dataframe(answer.table)
+    if answer.sql:
+        st.code(answer.sql, language="sql")
+    if answer.source == "local":
+        st.caption("⚡ Answered locally in {:,.0f} ms".format(answer.seconds * 1000))
+
+
+def stream_answer(assistant, question, engine):
+    """Show agent steps and model tokens as they arrive; returns the final Answer."""
+    status = None
+    output = st.empty()
+    text = ""
+    for kind, value in assistant.stream(question, engine):
+        if kind == "token":
+            text += value
+            if engine == SQL_ENGINE:
+                output.code(text, language="sql")
+            else:
+                output.markdown(text + "▌")
+        elif kind in ("step", "observation"):
+            if status is None:
+                status = st.status("🧠 Working on it...")
+            # Tokens so far were the agent's reasoning for this step
+            if text:
+                status.write(text)
+                text = ""
+            status.write(value if kind == "step" else "`{}`".format(value))
+            output.empty()
+        elif kind == "answer":
+            output.empty()
+            if status is not None:
+                status.update(label="🧠 Done in {:,.1f}s".format(value.seconds), state="complete",
+                              expanded=False)
+            return value
+
+
+def show_review_section(dataset, engine):
+    """Run a saved list of questions concurrently and show answers as they finish."""
+    with st.expander("📋 Monthly review"):
+        questions_text = st.text_area("One question per line", "\n".join(MONTHLY_REVIEW_QUESTIONS),
+                                      key="review_questions", height=180)
+        questions = [line.strip() for line in questions_text.splitlines() if line.strip()]
+        assistant = get_assistant(dataset)
+        # Each question without a local or cached answer is one model request
+        requests = sum(assistant.needs_model(question, engine) for question in questions)
+        st.caption("{} of {} questions need the model: running the review sends {} request{}.".format(
+            requests, len(questions), requests, "" if requests == 1 else "s"))
+        if not st.button("Run review", disabled=not questions):
+            return
+
+        progress = st.progress(0.0, "Answering {} questions...".format(len(questions)))
+        slots = []
+        for question in questions:
+            st.markdown("**{}**".format(question))
+            slots.append(st.empty())
+        finished = []
+
+        def on_result(index, result):
+            finished.append(result)
+            progress.progress(len(finished) / len(questions),
+                              "Answered {} of {}".format(len(finished), len(questions)))
+            with slots[index].container():
+                if result.error is not None:
+                    st.error("Could not answer: {}".format(result.error))
+                else:
+                    show_answer(result.answer)
+
+        started = time.perf_counter()
+        results = run_batch(assistant, questions, engine=engine, on_result=on_result)
+        wall = time.perf_counter() - started
+        progress.empty()
+        st.caption("⏱ {} questions in {:,.1f}s ({:,.1f}s if asked one at a time)".format(
+            len(results), wall, sum(result.seconds for result in results)))
+
+
+def show_ai_section(dataset, sections):
+    """Plain-English question box answered locally, by the agent, or with SQL.
+
+    The last answer is the "ai" section of `sections`: it stays on the page
+    while other sections rerun, until the question, engine or data change.
+    """
+    st.subheader("📝 Query financial data in plain English")
+    st.subheader("😎 No need for SQL or Python data skills")
+
+    # User input for the question
+    user_question = st.text_input("Enter your question:")
+    engines = {"🧠 Pandas agent": AGENT_ENGINE, "🦆 SQL (schema only)": SQL_ENGINE}
+    engine = st.radio("Answer with", list(engines), horizontal=True)
+
+    # Submit button to trigger Langchain interaction
+    inputs = (user_question, engines[engine])
+    if st.button("Submit"):
+        if user_question:
+            try:
+                answer = stream_answer(get_assistant(dataset), user_question, engines[engine])
+            except (UnsafeQueryError, QueryError, QueryTimeoutError) as error:
+                st.error("Could not answer with SQL: {}".format(error))
+                return
+            sections.put("ai", inputs, answer, depends_on=["data"])
+        else:
+            st.warning("Please enter a question.")
+
+    answer = sections.get("ai", inputs, depends_on=["data"])
+    if answer is not None:
+        show_answer(answer)
+        st.button("Clear Output", on_click=sections.discard, args=("ai",))
+
+    show_review_section(dataset, engines[engine])
+
+    # Report how often answers came from the cache
+    cache_stats = get_answer_cache().stats()
+    if cache_stats["hits"]:
+        st.caption("⚡ {} cached answers ({:.0%} hit rate), ~{:,.1f}s of agent time saved".format(
+            cache_stats["hits"], cache_stats["hit_rate"], cache_stats["saved_seconds"]))
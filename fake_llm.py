@@ -0,0 +1,121 @@
+# Local stand-ins for the OpenAI chat model and the LangChain pandas agent.
+#
+# They follow the small part of the LangChain interface the assistant uses
+# (invoke/ainvoke/stream, callbacks passed through `config`) and take a
+# configurable time to answer, so streaming, batching and retries can be
+# exercised without an API key. Pass them to Assistant(..., chat=, agent=).
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+
+# What the agent reports before running a tool, as LangChain's AgentAction does
+FakeAgentAction = namedtuple("FakeAgentAction", ["tool", "tool_input", "log"])
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class TransientLLMError(ConnectionError):
+    """A failure worth retrying, like a rate limit or dropped connection."""
+
+
+class _FailFirst:
+    """Raises TransientLLMError for the first `failures` calls, across threads."""
+
+    def __init__(self, failures):
+        self._calls = itertools.count()
+        self._failures = failures
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            call = next(self._calls)
+        if call < self._failures:
+            raise TransientLLMError("Simulated transient failure {} of {}".format(call + 1, self._failures))
+
+
+def _tokens(text):
+    """Word-sized pieces that join back into `text`."""
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + words[-1:]
+
+
+def _callbacks(config):
+    return list((config or {}).get("callbacks") or [])
+
+
+class FakeChatModel:
+    """Replies with `reply` (a string or a function of the prompt) after `latency` seconds."""
+
+    def __init__(self, reply="SELECT count(*) FROM transactions", latency=0.5, token_delay=0.01, failures=0):
+        self.reply = reply
+        self.latency = latency
+        self.token_delay = token_delay
+        self.calls = 0
+        self._fail_first = _FailFirst(failures)
+
+    def _text(self, prompt):
+        self.calls += 1
+        self._fail_first.check()
+        return self.reply(prompt) if callable(self.reply) else self.reply
+
+    def invoke(self, prompt, config=None):
+        text = self._text(prompt)
+        time.sleep(self.latency)
+        return FakeMessage(text)
+
+    async def ainvoke(self, prompt, config=None):
+        text = self._text(prompt)
+        await asyncio.sleep(self.latency)
+        return FakeMessage(text)
+
+    def stream(self, prompt, config=None):
+        text = self._text(prompt)
+        for token in _tokens(text):
+            time.sleep(self.token_delay)
+            yield FakeMessage(token)
+
+
+class FakeAgent:
+    """Runs `steps` pretend tool calls, then answers with `answer` (a string or a function of the question)."""
+
+    def __init__(self, answer=None, steps=1, step_latency=0.5, token_delay=0.01, failures=0):
+        self.answer = answer or (lambda question: "Here is what I found about: " + question)
+        self.steps = steps
+        self.step_latency = step_latency
+        self.token_delay = token_delay
+        self.calls = 0
+        self._fail_first = _FailFirst(failures)
+
+    def _output(self, question):
+        self.calls += 1
+        self._fail_first.check()
+        return self.answer(question) if callable(self.answer) else self.answer
+
+    def invoke(self, question, config=None):
+        output = self._output(question)
+        callbacks = _callbacks(config)
+        for step in range(self.steps):
+            action = FakeAgentAction("python_repl_ast", "df.describe()  # step {}".format(step + 1), "")
+            for callback in callbacks:
+                callback.on_agent_action(action)
+            time.sleep(self.step_latency)
+            for callback in callbacks:
+                callback.on_tool_end("(step {} result)".format(step + 1))
+        for token in _tokens(output):
+            for callback in callbacks:
+                callback.on_llm_new_token(token)
+            if callbacks:
+                time.sleep(self.token_delay)
+        return {"input": question, "output": output}
+
+    async def ainvoke(self, question, config=None):
+        output = self._output(question)
+        await asyncio.sleep(self.step_latency * self.steps)
+        return {"input": question, "output": output}
@@ -0,0 +1,777 @@
+# Ingestion of uploaded ledgers.
+#
+# Files are parsed in chunks with a schema inferred from a sample, rows that
+# fail validation are reported rather than aborting the load, and results
+# live in a content-addressed cache so a file is parsed once no matter how
+# many reruns or sessions see it. Several statements uploaded together are
+# parsed in parallel worker processes and merged, keeping transactions that
+# appear in more than one statement only once. XLSX workbooks are streamed
+# from the chosen sheet and header row and, when a workbook cache directory
+# is configured, written to Parquet the first time they are parsed, so later
+# loads in any session or process read the columnar copy instead.
+
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from analytics import (TransactionDataset, find_description_column, missing_columns,
+                       transaction_fingerprints)
+from instrumentation import span
+from startup import get_settings
+from workbook import guess_header_row, guess_table, iter_sheet, outline, preview_rows
+
+
+# Supported upload formats
+SUPPORTED_EXTENSIONS = ("csv", "xlsx")
+
+# Default memory budget for cached datasets, in megabytes
+DEFAULT_CACHE_MB = 1024
+
+# Rows sampled to infer column types and the date format
+SAMPLE_ROWS = 1000
+
+# Bytes per pyarrow CSV block and rows per chunk for workbooks
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+CHUNK_ROWS = 250_000
+
+# Bad rows kept for display; the rest are only counted
+MAX_BAD_ROWS = 1000
+
+# Worker processes used to parse several statements at once
+MAX_PARSE_WORKERS = 8
+
+# Bumped when the Parquet copies of workbooks change layout or content, so old copies are not read
+PARQUET_COPY_VERSION = 4
+
+# Columns every imported statement is mapped to before merging
+STATEMENT_COLUMNS = ["DATE", "DESCRIPTION", "CATEGORY", "PRICE", "FILE"]
+
+# Date formats tried, in order, when inferring the DATE column's format
+DATE_FORMATS = [
+    "%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d/%m/%y", "%Y/%m/%d",
+    "%m-%d-%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M",
+    "%b %d, %Y", "%B %d, %Y", "%d %b %Y", "%d %B %Y",
+]
+
+# Plain decimal numbers, once currency symbols and separators are removed
+NUMBER_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+# Inferred column kinds plus the DATE format (None when it must be guessed)
+Schema = namedtuple("Schema", ["columns", "date_format"])
+
+
+class IngestResult(namedtuple("IngestResult", ["dataset", "rows_read", "bad_row_count",
+                                               "bad_rows", "date_format"])):
+    """A parsed dataset plus a report of the rows that failed validation."""
+
+    @property
+    def nbytes(self):
+        bad_bytes = 0 if self.bad_rows is None else int(self.bad_rows.memory_usage(deep=True).sum())
+        return self.dataset.nbytes + bad_bytes
+
+
+def content_digest(data):
+    """Stable hash of uploaded bytes."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def file_extension(file_name):
+    return file_name.rsplit(".", 1)[-1].lower()
+
+
+def infer_date_format(values):
+    """Candidate format that parses the most sampled dates, or None."""
+    values = pd.Series(values).dropna().astype(str).str.strip()
+    values = values[values != ""]
+    if values.empty:
+        return None
+    best_format, best_count = None, 0
+    for candidate in DATE_FORMATS:
+        count = int(pd.to_datetime(values, format=candidate, errors="coerce").notna().sum())
+        if count > best_count:
+            best_format, best_count = candidate, count
+        if count == len(values):
+            break
+    return best_format
+
+
+def infer_schema(sample):
+    """Column kinds ("date", "float" or "string") and the DATE format from a sample."""
+    missing = missing_columns(sample)
+    if missing:
+        raise ValueError("Missing required columns: " + ", ".join(missing))
+
+    columns = {}
+    for column in sample.columns:
+        if column == "DATE":
+            columns[column] = "date"
+        elif column == "PRICE":
+            columns[column] = "float"
+        elif column == "CATEGORY":
+            columns[column] = "string"
+        else:
+            values = sample[column].dropna()
+            numeric = pd.to_numeric(values, errors="coerce")
+            is_numeric = len(values) > 0 and numeric.notna().all()
+            columns[column] = "float" if is_numeric else "string"
+
+    date_format = None
+    if not pd.api.types.is_datetime64_any_dtype(sample["DATE"]):
+        date_format = infer_date_format(sample["DATE"])
+    return Schema(columns, date_format)
+
+
+def _parse_numbers(values):
+    """Numbers as floats; currency symbols and thousands separators are stripped."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64")
+    cleaned = values.astype("string").str.replace(r"[$,\s]", "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+
+def _parse_dates(values, date_format):
+    """Dates as datetime64, trying `date_format` first and pandas' guess for the rest."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_object_dtype(values):
+        # Cells that are not strings (e.g. datetimes from a workbook) come back as NaN from .str
+        values = values.str.strip().fillna(values)
+    parsed = pd.to_datetime(values, format=date_format, errors="coerce")
+    unmatched = parsed.isna() & values.notna()
+    if date_format is not None and unmatched.any():
+        parsed[unmatched] = pd.to_datetime(values[unmatched], errors="coerce")
+    return parsed
+
+
+def _arrow_numbers(values):
+    """Arrow strings to float64, with unparseable values as nulls."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    # Clean columns take the direct cast; the regex path handles the rest
+    try:
+        return values.cast(pa.float64())
+    except pa.ArrowInvalid:
+        pass
+    cleaned = pc.replace_substring_regex(values, pattern=r"[$,\s]", replacement="")
+    valid = pc.match_substring_regex(cleaned, pattern=NUMBER_PATTERN)
+    return pc.if_else(valid, cleaned, pa.scalar(None, pa.string())).cast(pa.float64())
+
+
+def _arrow_dates(values, date_format):
+    """Arrow strings to timestamps, with unparseable values as nulls.
+
+    Values are trimmed first. Those not in the inferred format (a time
+    among plain dates, a second format in the same file) are parsed the
+    way pandas guesses dates before they count as invalid.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pc.utf8_trim_whitespace(values)
+    if date_format is None:
+        parsed = pd.to_datetime(values.to_pandas(), errors="coerce")
+        return pa.array(parsed, type=pa.timestamp("ns"))
+    parsed = pc.strptime(values, format=date_format, unit="ns", error_is_null=True)
+    unmatched = pc.and_(pc.is_null(parsed), pc.invert(pc.is_null(values)))
+    if not pc.any(unmatched).as_py():
+        return parsed
+    guessed = pd.to_datetime(values.filter(unmatched).to_pandas(), errors="coerce")
+    parsed = parsed.to_pandas()
+    parsed[unmatched.to_numpy(zero_copy_only=False)] = guessed.to_numpy()
+    return pa.array(parsed, type=pa.timestamp("ns"))
+
+
+def split_invalid(raw, typed, first_line):
+    """Split typed rows into valid rows and a report of rows failing validation.
+
+    `raw` is the chunk as read (a DataFrame or Arrow batch) and `first_line`
+    the file line of its first row, so bad rows are numbered the way a
+    spreadsheet would show them.
+    """
+    bad_date = typed["DATE"].isna().to_numpy()
+    bad_price = typed["PRICE"].isna().to_numpy()
+    bad = bad_date | bad_price
+    if not bad.any():
+        return typed, None
+
+    reasons = np.where(bad_date & bad_price, "invalid DATE and PRICE",
+                       np.where(bad_date, "invalid DATE", "invalid PRICE"))
+    if isinstance(raw, pd.DataFrame):
+        bad_rows = raw[bad].reset_index(drop=True)
+    else:
+        bad_rows = raw.filter(bad).to_pandas()
+    bad_rows.insert(0, "REASON", reasons[bad])
+    bad_rows.insert(0, "LINE", first_line + np.flatnonzero(bad))
+    return typed[~bad].reset_index(drop=True), bad_rows
+
+
+def convert_frame_chunk(chunk, schema):
+    """Type one chunk of a DataFrame (e.g. a worksheet) using the schema."""
+    typed = {}
+    for column, kind in schema.columns.items():
+        values = chunk[column]
+        if kind == "date":
+            typed[column] = _parse_dates(values, schema.date_format)
+        elif kind == "float":
+            typed[column] = _parse_numbers(values)
+        else:
+            typed[column] = values.astype(object)
+    return pd.DataFrame(typed, index=chunk.index)
+
+
+def convert_arrow_batch(batch, schema):
+    """Type one Arrow record batch of string columns using the schema."""
+    typed = {}
+    for column, kind in schema.columns.items():
+        values = batch.column(column)
+        if kind == "date":
+            values = _arrow_dates(values, schema.date_format)
+            typed[column] = values.to_pandas().astype("datetime64[ns]")
+        elif kind == "float":
+            typed[column] = _arrow_numbers(values).to_pandas()
+        else:
+            typed[column] = values.to_pandas()
+    return pd.DataFrame(typed)
+
+
+def _csv_header(data):
+    """Column names of a CSV file's header line, named the way pandas names them.
+
+    Blank names (e.g. from a trailing comma) become "Unnamed: N" so the
+    sample and the Arrow reader agree on every column. Raises ValueError
+    for a name that appears more than once.
+    """
+    header = pd.read_csv(io.BytesIO(data), header=None, nrows=1, dtype=str).iloc[0]
+    names = ["Unnamed: {}".format(position) if pd.isna(name) or not name.strip() else name
+             for position, name in enumerate(header)]
+    repeated = sorted({name for name in names if names.count(name) > 1})
+    if repeated:
+        raise ValueError("The CSV header names a column more than once: " + ", ".join(repeated))
+    return names
+
+
+def _csv_convert_options(names):
+    from pyarrow import csv, string
+
+    return csv.ConvertOptions(column_types={name: string() for name in names},
+                              strings_can_be_null=True)
+
+
+def _csv_batches(data, names, block_size, short, malformed):
+    """Raw CSV record batches with every column read as a string.
+
+    The header line is replaced by `names`. Lines with too many fields are
+    skipped and appended to `malformed` as (line, text) pairs; lines with
+    too few are padded with empty fields and appended to `short` for
+    `_padded_batch` to read afterwards.
+    Raises ValueError when the first block cannot be read.
+    """
+    from pyarrow import ArrowInvalid, csv
+
+    def hold_back(row):
+        if row.actual_columns < row.expected_columns:
+            short.append((row.number, row.text + "," * (row.expected_columns - row.actual_columns)))
+        else:
+            malformed.append((row.number, row.text))
+        return "skip"
+
+    try:
+        return csv.open_csv(
+            io.BytesIO(data),
+            read_options=csv.ReadOptions(block_size=block_size, column_names=names, skip_rows=1),
+            parse_options=csv.ParseOptions(invalid_row_handler=hold_back),
+            convert_options=_csv_convert_options(names),
+        )
+    except ArrowInvalid as error:
+        raise ValueError("The CSV file could not be read: {}".format(error)) from error
+
+
+def _padded_batch(short, names):
+    """The padded short CSV lines as one batch, their missing fields null."""
+    from pyarrow import csv
+
+    text = "\n".join(line for _, line in short)
+    table = csv.read_csv(io.BytesIO(text.encode()),
+                         read_options=csv.ReadOptions(column_names=names),
+                         convert_options=_csv_convert_options(names))
+    return table.combine_chunks().to_batches()[0]
+
+
+def ingest_transactions(data, file_name, block_size=CSV_BLOCK_SIZE, chunk_rows=CHUNK_ROWS,
+                        max_bad_rows=MAX_BAD_ROWS, sheet=None, header_row=None):
+    """Parse uploaded bytes chunk by chunk into a validated IngestResult.
+
+    The schema and date format are inferred once from a sample; every chunk
+    is then converted with those explicit types. Rows with an unreadable
+    DATE or PRICE are dropped and reported instead of aborting the load.
+    Workbooks are read from `sheet` below the 0-based `header_row`; either
+    is guessed from the first rows of the sheets when not given.
+    """
+    extension = file_extension(file_name)
+    short = []
+    malformed = []
+    # File line of the header
+    header_line = 1
+    if extension == "csv":
+        names = _csv_header(data)
+        sample = pd.read_csv(io.BytesIO(data), names=names, skiprows=1, nrows=SAMPLE_ROWS,
+                             dtype=str, on_bad_lines="skip")
+        schema = infer_schema(sample)
+        batches = _csv_batches(data, names, block_size, short, malformed)
+    elif extension == "xlsx":
+        if sheet is None and header_row is None:
+            sheet, header_row = guess_table(outline(data))
+        elif header_row is None:
+            header_row = guess_header_row(preview_rows(data, sheet))
+        header_line = header_row + 1
+        batches = iter_sheet(data, sheet, header_row, chunk_rows)
+        with span("ingest.read_sheet") as current:
+            first = next(batches)
+            current.set(rows=len(first))
+        schema = infer_schema(first.head(SAMPLE_ROWS))
+        batches = itertools.chain([first], batches)
+    else:
+        raise ValueError("Unsupported file format. Please upload a CSV or XLSX file.")
+
+    typed_chunks = []
+    bad_chunks = []
+    bad_row_count = 0
+    rows_read = 0
+    with span("ingest.convert", format=extension) as current:
+        for chunk in batches:
+            if extension == "csv":
+                typed = convert_arrow_batch(chunk, schema)
+            else:
+                typed = convert_frame_chunk(chunk, schema)
+
+            # File line of the chunk's first row
+            typed, bad_rows = split_invalid(chunk, typed, header_line + rows_read + 1)
+            rows_read += chunk.num_rows if extension == "csv" else len(chunk)
+            typed_chunks.append(typed)
+            if bad_rows is not None:
+                bad_row_count += len(bad_rows)
+                kept = sum(len(frame) for frame in bad_chunks)
+                if kept < max_bad_rows:
+                    bad_chunks.append(bad_rows.head(max_bad_rows - kept))
+
+        # Lines with trailing fields missing, read once the file is done
+        if short:
+            chunk = _padded_batch(short, names)
+            typed, bad_rows = split_invalid(chunk, convert_arrow_batch(chunk, schema), 0)
+            rows_read += chunk.num_rows
+            typed_chunks.append(typed)
+            if bad_rows is not None:
+                lines = np.array([line for line, _ in short])
+                bad_rows["LINE"] = lines[bad_rows["LINE"].to_numpy()]
+                bad_row_count += len(bad_rows)
+                kept = sum(len(frame) for frame in bad_chunks)
+                if kept < max_bad_rows:
+                    bad_chunks.append(bad_rows.head(max_bad_rows - kept))
+        current.set(rows=rows_read, chunks=len(typed_chunks))
+
+    # Lines the CSV parser could not split into the header's columns
+    if malformed:
+        bad_row_count += len(malformed)
+        kept = sum(len(frame) for frame in bad_chunks)
+        if kept < max_bad_rows:
+            lines, texts = zip(*malformed[:max_bad_rows - kept])
+            bad_chunks.append(pd.DataFrame({"LINE": lines, "REASON": "wrong number of columns",
+                                            "TEXT": texts}))
+
+    if typed_chunks:
+        frame = pd.concat(typed_chunks, ignore_index=True)
+    else:
+        frame = pd.DataFrame({column: [] for column in schema.columns})
+    bad_rows = pd.concat(bad_chunks, ignore_index=True) if bad_chunks else None
+
+    return IngestResult(
+        dataset=TransactionDataset.from_frame(frame),
+        rows_read=rows_read,
+        bad_row_count=bad_row_count,
+        bad_rows=bad_rows,
+        date_format=schema.date_format,
+    )
+
+
+def _parquet_copy_path(cache_dir, digest, sheet, header_row):
+    key = repr((PARQUET_COPY_VERSION, digest, sheet, header_row)).encode()
+    return os.path.join(cache_dir, content_digest(key) + ".parquet")
+
+
+def _bad_rows_path(path):
+    return path[:-len(".parquet")] + ".bad.parquet"
+
+
+def _as_strings(frame):
+    """Object columns as strings (missing values kept), since Parquet needs one type per column."""
+    frame = frame.copy()
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            values = frame[column]
+            frame[column] = values.astype(str).where(values.notna(), None)
+    return frame
+
+
+def _write_parquet_copy(path, result):
+    """Write the parsed rows, with the bad-row report alongside, replacing any earlier copy atomically."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    report = {"rows_read": result.rows_read, "bad_row_count": result.bad_row_count,
+              "date_format": result.date_format}
+    # The bad rows go first, so a complete copy always has them
+    for target, frame in ((_bad_rows_path(path), result.bad_rows), (path, result.dataset.frame)):
+        if frame is None:
+            continue
+        table = pa.Table.from_pandas(_as_strings(frame), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               b"pocketbook": json.dumps(report).encode()})
+        # Written under a temporary name first, so readers never see half a file
+        temporary = "{}.{}-{}.tmp".format(target, os.getpid(), threading.get_ident())
+        pq.write_table(table, temporary)
+        os.replace(temporary, target)
+
+
+def _read_parquet_copy(path):
+    """The IngestResult saved at `path`, or None when there is no readable copy."""
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(path):
+        return None
+    try:
+        table = pq.read_table(path)
+        report = json.loads(table.schema.metadata[b"pocketbook"])
+        bad_rows = pq.read_table(_bad_rows_path(path)).to_pandas() if report["bad_row_count"] else None
+    except (OSError, KeyError, ValueError):
+        return None
+    return IngestResult(
+        dataset=TransactionDataset.from_frame(table.to_pandas()),
+        rows_read=report["rows_read"],
+        bad_row_count=report["bad_row_count"],
+        bad_rows=bad_rows,
+        date_format=report["date_format"],
+    )
+
+
+def ingest_workbook(data, file_name, sheet=None, header_row=None, digest=None, cache_dir=None):
+    """ingest_transactions() for an XLSX workbook, through a Parquet copy of the result.
+
+    The first load of a sheet streams it from the workbook and writes the
+    parsed rows to Parquet in the workbook cache directory; later loads of
+    the same bytes, sheet and header row read the copy instead. The copies
+    go in `cache_dir`, by default POCKETBOOK_WORKBOOK_CACHE_DIR; without
+    one nothing is written.
+    """
+    cache_dir = get_settings().workbook_cache_dir if cache_dir is None else cache_dir
+    if cache_dir is None:
+        return ingest_transactions(data, file_name, sheet=sheet, header_row=header_row)
+    digest = content_digest(data) if digest is None else digest
+    path = _parquet_copy_path(cache_dir, digest, sheet, header_row)
+    with span("ingest.parquet_copy") as current:
+        result = _read_parquet_copy(path)
+        current.set(hit=result is not None)
+    if result is None:
+        result = ingest_transactions(data, file_name, sheet=sheet, header_row=header_row)
+        try:
+            with span("ingest.write_parquet_copy", rows=len(result.dataset)):
+                _write_parquet_copy(path, result)
+        except (OSError, TypeError, ValueError):
+            # The copy only speeds up later loads; without it they parse the workbook again
+            pass
+    return result
+
+
+# One statement of a multi-file import, parsed into the common columns
+StatementPart = namedtuple("StatementPart", ["file_name", "frame", "fingerprints", "rows_read",
+                                             "bad_row_count", "bad_rows", "seconds"])
+
+# Per-file outcome of a multi-file import; `error` is set when the file was rejected
+StatementReport = namedtuple("StatementReport", ["file_name", "rows", "bad_row_count", "duplicates",
+                                                 "error", "seconds"])
+
+
+class ImportResult(namedtuple("ImportResult", ["dataset", "rows_read", "bad_row_count", "bad_rows",
+                                               "duplicate_count", "files"])):
+    """Several statements merged into one dataset, with a report per file."""
+
+    @property
+    def nbytes(self):
+        bad_bytes = 0 if self.bad_rows is None else int(self.bad_rows.memory_usage(deep=True).sum())
+        return self.dataset.nbytes + bad_bytes
+
+
+def parse_statement(data, file_name):
+    """Parse one statement into STATEMENT_COLUMNS plus transaction fingerprints.
+
+    Runs in a worker process, so everything it returns is picklable.
+    """
+    started = time.perf_counter()
+    if file_extension(file_name) == "xlsx":
+        result = ingest_workbook(data, file_name)
+    else:
+        result = ingest_transactions(data, file_name)
+    frame = result.dataset.frame
+    description_column = find_description_column(frame)
+    common = pd.DataFrame({
+        "DATE": frame["DATE"],
+        "DESCRIPTION": frame[description_column].astype(object) if description_column else "",
+        "CATEGORY": frame["CATEGORY"],
+        "PRICE": frame["PRICE"],
+        "FILE": file_name,
+    }, columns=STATEMENT_COLUMNS)
+    bad_rows = result.bad_rows
+    if bad_rows is not None:
+        bad_rows = bad_rows.assign(FILE=file_name)
+    return StatementPart(file_name, common, transaction_fingerprints(frame), result.rows_read,
+                         result.bad_row_count, bad_rows, time.perf_counter() - started)
+
+
+# Process pool shared by every import, started on first use
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """The shared statement-parsing ProcessPoolExecutor."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn: forking a process that runs the Streamlit server's threads is unsafe
+            workers = min(os.cpu_count() or 1, MAX_PARSE_WORKERS)
+            _parse_pool = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return _parse_pool
+
+
+def _reset_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+def _parse_all(files, parallel):
+    """Yield (index, StatementPart or exception) as each file finishes."""
+    if not parallel:
+        for index, (file_name, data) in enumerate(files):
+            try:
+                yield index, parse_statement(data, file_name)
+            except Exception as error:
+                yield index, error
+        return
+
+    futures = {get_parse_pool().submit(parse_statement, data, file_name): index
+               for index, (file_name, data) in enumerate(files)}
+    for future in as_completed(futures):
+        index = futures[future]
+        try:
+            yield index, future.result()
+        except BrokenProcessPool:
+            # A worker died; parse this file here and start a new pool next time
+            _reset_parse_pool()
+            file_name, data = files[index]
+            try:
+                yield index, parse_statement(data, file_name)
+            except Exception as error:
+                yield index, error
+        except Exception as error:
+            yield index, error
+
+
+def import_statements(files, on_file=None, parallel=None):
+    """Parse `files` ([(file_name, bytes)]) in parallel and merge them into one dataset.
+
+    Transactions found in more than one statement (same fingerprint) are
+    kept once, from the earliest file in `files`. `on_file(report)` is
+    called as each file finishes parsing. Rejected files are reported and
+    skipped; a ValueError is raised only if every file was rejected.
+    """
+    if parallel is None:
+        parallel = len(files) > 1 and (os.cpu_count() or 1) > 1
+    parts = [None] * len(files)
+    errors = [None] * len(files)
+    with span("ingest.statements", files=len(files), parallel=parallel) as current:
+        for index, outcome in _parse_all(files, parallel):
+            if isinstance(outcome, Exception):
+                errors[index] = outcome
+                report = StatementReport(files[index][0], 0, 0, 0, str(outcome), 0.0)
+            else:
+                parts[index] = outcome
+                report = StatementReport(outcome.file_name, len(outcome.frame), outcome.bad_row_count,
+                                         0, None, outcome.seconds)
+            if on_file is not None:
+                on_file(report)
+
+        parsed = [part for part in parts if part is not None]
+        if not parsed:
+            raise ValueError("None of the {} files could be imported: {}".format(
+                len(files), "; ".join(str(error) for error in errors if error is not None)))
+
+        # Drop transactions already seen in an earlier statement
+        fingerprints = np.concatenate([part.fingerprints for part in parsed])
+        keep = ~pd.Series(fingerprints).duplicated().to_numpy()
+        merged = pd.concat([part.frame for part in parsed], ignore_index=True)[keep]
+        bad_parts = [part.bad_rows for part in parsed if part.bad_rows is not None]
+
+        sizes = np.cumsum([len(part.frame) for part in parsed])[:-1]
+        kept_counts = iter([int(chunk.sum()) for chunk in np.split(keep, sizes)])
+        reports = []
+        for (file_name, _), part, error in zip(files, parts, errors):
+            if part is None:
+                reports.append(StatementReport(file_name, 0, 0, 0, str(error), 0.0))
+            else:
+                kept = next(kept_counts)
+                reports.append(StatementReport(file_name, kept, part.bad_row_count,
+                                               len(part.frame) - kept, None, part.seconds))
+
+        result = ImportResult(
+            dataset=TransactionDataset.from_frame(merged),
+            rows_read=sum(part.rows_read for part in parsed),
+            bad_row_count=sum(part.bad_row_count for part in parsed),
+            bad_rows=pd.concat(bad_parts, ignore_index=True).head(MAX_BAD_ROWS) if bad_parts else None,
+            duplicate_count=int((~keep).sum()),
+            files=reports,
+        )
+        current.set(rows=len(result.dataset), duplicates=result.duplicate_count)
+    return result
+
+
+class IngestionCache:
+    """Thread-safe LRU cache of parsed datasets bounded by a memory budget."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Cached value for `key`, or None. Counts as a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Store `value`, evicting least recently used entries to fit the budget."""
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Values larger than the whole budget are never cached
+            if size > self.max_bytes:
+                return
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value, getattr(value, "nbytes", 0))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and memory usage."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Process-wide cache shared by every session
+_ingestion_cache = None
+_ingestion_cache_lock = threading.Lock()
+
+
+def get_ingestion_cache(max_mb=None):
+    """The shared ingestion cache, sized by POCKETBOOK_INGEST_CACHE_MB by default."""
+    global _ingestion_cache
+    with _ingestion_cache_lock:
+        if _ingestion_cache is None:
+            budget_mb = get_settings().ingest_cache_mb if max_mb is None else max_mb
+            _ingestion_cache = IngestionCache(budget_mb * 1024 * 1024)
+        return _ingestion_cache
+
+
+def ingest_upload(data, file_name, digest=None, cache=None, sheet=None, header_row=None):
+    """Ingest uploaded bytes, reusing a cached IngestResult when possible.
+
+    `sheet` and `header_row` choose the table of an XLSX workbook, as in
+    ingest_transactions().
+    """
+    cache = get_ingestion_cache() if cache is None else cache
+    digest = content_digest(data) if digest is None else digest
+    extension = file_extension(file_name)
+    key = (digest, extension) if extension != "xlsx" else (digest, extension, sheet, header_row)
+
+    def load():
+        if extension == "xlsx":
+            return ingest_workbook(data, file_name, sheet, header_row, digest=digest)
+        return ingest_transactions(data, file_name)
+
+    with span("ingest.upload", format=extension, bytes=len(data)) as current:
+        result = cache.get_or_load(key, load)
+        current.set(rows=len(result.dataset), bad_rows=result.bad_row_count)
+    return result
+
+
+def ingest_uploads(files, digests=None, cache=None, on_file=None):
+    """import_statements() for uploaded files, reusing a cached ImportResult when possible.
+
+    The file names are part of the key, since they are stamped on the rows
+    and the reports. On a cache hit `on_file` is still called for each file.
+    """
+    cache = get_ingestion_cache() if cache is None else cache
+    digests = digests or [content_digest(data) for _, data in files]
+    key = ("statements",) + tuple((digest, file_name) for digest, (file_name, _) in zip(digests, files))
+    result = cache.get(key)
+    if result is None:
+        result = import_statements(files, on_file=on_file)
+        cache.put(key, result, result.nbytes)
+    elif on_file is not None:
+        for report in result.files:
+            on_file(report)
+    return result
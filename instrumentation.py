@@ -0,0 +1,163 @@
+# Named timing spans around each stage of a page rerun.
+#
+#     with span("ingest.parse", file=name) as current:
+#         result = ingest_transactions(...)
+#         current.set(rows=len(result.dataset))
+#
+# A span records wall time, the growth of the process's peak memory and
+# any fields set on it (row counts, token usage). Finished spans are logged
+# as one JSON line each and collected into the current rerun's trace, which
+# the pages can show in a sidebar panel. Instrumentation is switched on with
+# POCKETBOOK_INSTRUMENT; when it is off, span() returns a shared no-op
+# object without timing anything.
+
+import contextlib
+import json
+import sys
+import threading
+import time
+
+from streamlit.logger import get_logger
+
+from startup import get_settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Get logger
+LOGGER = get_logger(__name__)
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_MAXRSS_TO_MB = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+
+_local = threading.local()
+
+
+def _peak_memory_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_TO_MB
+
+
+class _NullSpan:
+    """Stands in for a span when instrumentation is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed stage; use through span()."""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.seconds = None
+        self.memory_mb = None
+        self.depth = 0
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.depth = getattr(_local, "depth", 0)
+        _local.depth = self.depth + 1
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.append(self)
+        self._memory = _peak_memory_mb()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.seconds = time.perf_counter() - self._started
+        _local.depth = self.depth
+        if self._memory is not None:
+            self.memory_mb = _peak_memory_mb() - self._memory
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        LOGGER.info(json.dumps(self.as_dict(), default=str))
+        return False
+
+    def as_dict(self):
+        record = {"span": self.name, "seconds": round(self.seconds, 6), "depth": self.depth}
+        if self.memory_mb is not None:
+            record["peak_memory_delta_mb"] = round(self.memory_mb, 2)
+        record.update(self.fields)
+        return record
+
+
+def span(name, **fields):
+    """A context manager timing `name`, or a no-op when instrumentation is off."""
+    if not get_settings().instrument:
+        return NULL_SPAN
+    return Span(name, fields)
+
+
+@contextlib.contextmanager
+def llm_usage(current):
+    """Adds OpenAI token counts and cost to `current` for the LLM calls inside the block."""
+    callback_context = None
+    if current is not NULL_SPAN:
+        try:
+            from langchain_community.callbacks import get_openai_callback
+        except ImportError:
+            pass
+        else:
+            callback_context = get_openai_callback()
+
+    if callback_context is None:
+        yield
+        return
+    with callback_context as callback:
+        yield
+    current.set(prompt_tokens=callback.prompt_tokens,
+                completion_tokens=callback.completion_tokens,
+                total_tokens=callback.total_tokens,
+                cost_usd=round(callback.total_cost, 6))
+
+
+def start_trace(page):
+    """Start collecting this thread's spans for one rerun of `page`."""
+    if not get_settings().instrument:
+        return
+    _local.trace = []
+    _local.depth = 0
+    _local.page = page
+
+
+def current_trace():
+    """Spans finished so far in this rerun, in the order they started."""
+    return [span for span in getattr(_local, "trace", None) or [] if span.seconds is not None]
+
+
+def show_trace_panel():
+    """Sidebar table of this rerun's spans, when instrumentation is on."""
+    if not get_settings().instrument:
+        return
+    import pandas as pd
+    import streamlit as st
+
+    if not st.sidebar.checkbox("⏱ Show stage timings"):
+        return
+    spans = current_trace()
+    if not spans:
+        st.sidebar.caption("No spans recorded in this rerun.")
+        return
+    rows = [dict(span.as_dict(), span="· " * span.depth + span.name) for span in spans]
+    table = pd.DataFrame(rows).drop(columns=["depth"])
+    st.sidebar.caption("⏱ {} · {:,.0f} ms in {} spans".format(
+        getattr(_local, "page", "page"), sum(s.seconds for s in spans if s.depth == 0) * 1000, len(spans)))
+    st.sidebar.dataframe(table, hide_index=True)
@@ -0,0 +1,377 @@
+# Deterministic fast path for routine spending questions.
+#
+# Questions such as "how much did I spend on groceries in March" or "top 5
+# categories this year" are parsed into an Intent (aggregation, categories,
+# date range, top-N, grouping) and answered directly from the dataset. The
+# parser is deliberately strict: if any word is not understood the question
+# is left to the LangChain agent.
+
+import calendar
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analytics import find_description_column, format_dollars
+
+
+# Parsed question; `ascending` ranks categories from the smallest value up
+Intent = namedtuple("Intent", ["aggregation", "categories", "start_date", "end_date",
+                               "period_label", "top_n", "group_by", "ascending"], defaults=(False,))
+
+# Answer computed locally; `table` is an optional DataFrame to show with it
+FastAnswer = namedtuple("FastAnswer", ["text", "table"])
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "twelve": 12, "fifteen": 15, "twenty": 20}
+
+UNITS = {"day": "days", "days": "days", "week": "weeks", "weeks": "weeks",
+         "month": "months", "months": "months", "year": "years", "years": "years"}
+
+# Words that may appear in a question without changing its meaning
+FILLER_WORDS = set("""
+what whats which how much many did do does i we my me our us the a an on in at for of to
+from during over is was were are be been have has had it its that there with and or all
+spend spent spending total totals sum cost costs paid pay amount money overall altogether
+transaction transactions purchase purchases expense expenses charge charges payment
+payments item items category categories by per each breakdown broken down month months
+monthly top biggest largest highest most expensive smallest lowest cheapest least min max
+minimum maximum average avg mean median typical count number show list give tell please
+so far up
+""".split())
+
+# Words that signal analysis the fast path should not attempt
+AGENT_WORDS = {"why", "compare", "comparison", "trend", "trends", "predict", "forecast",
+               "should", "could", "would", "plot", "chart", "graph", "correlation", "percent",
+               "percentage", "ratio", "vs", "versus", "save", "budget", "recommend"}
+
+DATE_PATTERN = r"(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/\d{2,4})"
+MONTH_PATTERN = r"(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")"
+
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def _category_forms(name):
+    """Lowercase spellings a question might use for a category."""
+    base = " ".join(_tokens(name.lower()))
+    forms = {base}
+    if base.endswith("ies"):
+        forms.add(base[:-3] + "y")
+    elif base.endswith("s"):
+        forms.add(base[:-1])
+    if base.endswith("y"):
+        forms.add(base[:-1] + "ies")
+    else:
+        forms.add(base + "s")
+    return forms
+
+
+def _month_range(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _previous_month(today):
+    previous = today.replace(day=1) - timedelta(days=1)
+    return _month_range(previous.year, previous.month)
+
+
+def _shift_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _parse_date(text):
+    try:
+        return pd.Timestamp(text).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def _parse_period(text, today, latest):
+    """(start, end, label, remaining text) for the first date expression found."""
+    match = re.search(r"\b(?:between|from)\s+" + DATE_PATTERN + r"\s+(?:and|to)\s+" + DATE_PATTERN, text)
+    if match:
+        start, end = _parse_date(match.group(1)), _parse_date(match.group(2))
+        if start and end:
+            label = "from {} to {}".format(start.strftime("%B %d, %Y"), end.strftime("%B %d, %Y"))
+            return start, end, label, text[:match.start()] + text[match.end():]
+
+    match = re.search(r"\b(?:last|past|previous)\s+(\d+|" + "|".join(NUMBER_WORDS) +
+                      r")\s+(days?|weeks?|months?|years?)\b", text)
+    if match:
+        amount = match.group(1)
+        amount = int(amount) if amount.isdigit() else NUMBER_WORDS[amount]
+        unit = UNITS[match.group(2)]
+        if unit == "days":
+            start = today - timedelta(days=amount - 1)
+        elif unit == "weeks":
+            start = today - timedelta(weeks=amount) + timedelta(days=1)
+        elif unit == "months":
+            start = _shift_months(today, -amount) + timedelta(days=1)
+        else:
+            start = _shift_months(today, -12 * amount) + timedelta(days=1)
+        label = "in the last {} {}".format(amount, unit if amount != 1 else unit[:-1])
+        return start, today, label, text[:match.start()] + text[match.end():]
+
+    relative = [
+        (r"\b(?:this year|year to date|ytd|so far this year)\b",
+         lambda: (date(today.year, 1, 1), today, "this year")),
+        (r"\b(?:last|previous|past) year\b",
+         lambda: (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31), "last year")),
+        (r"\bthis month\b",
+         lambda: (today.replace(day=1), today, "this month")),
+        (r"\b(?:last|previous|past) month\b",
+         lambda: _previous_month(today) + ("last month",)),
+        (r"\bthis week\b",
+         lambda: (today - timedelta(days=today.weekday()), today, "this week")),
+        (r"\b(?:last|previous|past) week\b",
+         lambda: (today - timedelta(days=today.weekday() + 7),
+                  today - timedelta(days=today.weekday() + 1), "last week")),
+        (r"\btoday\b", lambda: (today, today, "today")),
+        (r"\byesterday\b",
+         lambda: (today - timedelta(days=1), today - timedelta(days=1), "yesterday")),
+    ]
+    for pattern, resolve in relative:
+        match = re.search(pattern, text)
+        if match:
+            start, end, label = resolve()
+            return start, end, label, text[:match.start()] + text[match.end():]
+
+    match = re.search(r"\bsince\s+" + DATE_PATTERN, text)
+    if match and _parse_date(match.group(1)):
+        start = _parse_date(match.group(1))
+        label = "since " + start.strftime("%B %d, %Y")
+        return start, today, label, text[:match.start()] + text[match.end():]
+
+    match = re.search(r"\bsince\s+" + MONTH_PATTERN + r"(?:\s+(\d{4}))?\b", text)
+    if match:
+        month = MONTHS[match.group(1)]
+        year = int(match.group(2)) if match.group(2) else (today.year if month <= today.month else today.year - 1)
+        start = date(year, month, 1)
+        label = "since " + start.strftime("%B %Y")
+        return start, today, label, text[:match.start()] + text[match.end():]
+
+    match = re.search(r"\b" + MONTH_PATTERN + r"(?:\s+(\d{4}))?\b", text)
+    if match:
+        month = MONTHS[match.group(1)]
+        if match.group(2):
+            year = int(match.group(2))
+        else:
+            # A bare month means its most recent occurrence in the data
+            year = latest.year if month <= latest.month else latest.year - 1
+        start, end = _month_range(year, month)
+        label = "in " + start.strftime("%B %Y")
+        return start, end, label, text[:match.start()] + text[match.end():]
+
+    match = re.search(r"\b(19\d{2}|20\d{2})\b", text)
+    if match:
+        year = int(match.group(1))
+        return date(year, 1, 1), date(year, 12, 31), "in {}".format(year), text[:match.start()] + text[match.end():]
+
+    return None, None, None, text
+
+
+def parse_question(question, categories, today=None, latest=None):
+    """Intent for a routine spending question, or None if it needs the agent.
+
+    `categories` are the dataset's category names; `today` anchors relative
+    periods and `latest` (the last transaction date) resolves bare month names.
+    """
+    today = today or date.today()
+    latest = latest or today
+    text = " " + question.lower().replace("'", "").replace("’", "") + " "
+    text = re.sub(r"[?!,;:]", " ", text)
+
+    if AGENT_WORDS & set(_tokens(text)):
+        return None
+
+    start, end, period_label, text = _parse_period(text, today, latest)
+
+    # Categories, longest names first so "eating out" beats "out"
+    matched = []
+    forms = sorted(((form, name) for name in categories for form in _category_forms(name)),
+                   key=lambda item: len(item[0]), reverse=True)
+    for form, name in forms:
+        pattern = r"\b" + re.escape(form) + r"\b"
+        if re.search(pattern, text):
+            if name not in matched:
+                matched.append(name)
+            text = re.sub(pattern, " ", text)
+
+    words = _tokens(text)
+    word_set = set(words)
+
+    # Top-N, optionally spelled out
+    top_n = None
+    match = re.search(r"\btop\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\b", text)
+    if match:
+        value = match.group(1)
+        top_n = int(value) if value.isdigit() else NUMBER_WORDS[value]
+        words = _tokens(text[:match.start()] + text[match.end():])
+        word_set = set(words) | {"top"}
+
+    # Every remaining word must be understood
+    unknown = [word for word in words if word not in FILLER_WORDS]
+    if unknown:
+        return None
+
+    wants_categories = bool({"category", "categories"} & word_set)
+    wants_transactions = bool({"transaction", "transactions", "purchase", "purchases", "expense",
+                               "expenses", "charge", "charges", "payment", "payments", "item",
+                               "items"} & word_set)
+    group_by = None
+    ascending = False
+    if {"monthly"} & word_set or re.search(r"\b(?:by|per|each) month\b", text):
+        group_by = "month"
+    elif wants_categories and ({"by", "per", "each", "breakdown"} & word_set or top_n is None
+                               and {"biggest", "largest", "top", "most"} & word_set):
+        group_by = "category"
+
+    if {"how many", "number of"} & {" ".join(pair) for pair in zip(words, words[1:])} or "count" in word_set:
+        aggregation = "count"
+    elif {"average", "avg", "mean"} & word_set:
+        aggregation = "mean"
+    elif {"median", "typical"} & word_set:
+        aggregation = "median"
+    elif top_n is not None or {"top", "biggest", "largest", "highest", "most", "maximum", "max"} & word_set:
+        if wants_categories:
+            aggregation, group_by = "sum", "category"
+            top_n = top_n or 1
+        else:
+            aggregation = "top"
+            top_n = top_n or 1
+    elif {"smallest", "lowest", "cheapest", "least", "minimum", "min"} & word_set:
+        if wants_categories:
+            aggregation, group_by, ascending = "sum", "category", True
+            top_n = top_n or 1
+        else:
+            aggregation = "bottom"
+            top_n = 1
+    elif {"much", "total", "totals", "sum", "spend", "spent", "spending", "cost", "costs",
+          "paid", "breakdown"} & word_set or group_by is not None:
+        aggregation = "sum"
+    elif wants_transactions and {"show", "list"} & word_set:
+        aggregation = "top"
+        top_n = 10
+    else:
+        return None
+
+    # Only totals and averages are computed per month, and no medians per category
+    if group_by == "month" and aggregation not in ("sum", "mean") or \
+            group_by == "category" and aggregation == "median":
+        return None
+
+    return Intent(aggregation, matched, start, end, period_label, top_n, group_by, ascending)
+
+
+def _transactions(count):
+    return "{:,} transaction{}".format(count, "" if count == 1 else "s")
+
+
+def _describe(intent, dataset):
+    scope = " + ".join(intent.categories) if intent.categories else "all categories"
+    period = intent.period_label or "from {} to {}".format(
+        dataset.min_date.strftime("%B %d, %Y"), dataset.max_date.strftime("%B %d, %Y"))
+    return scope, period
+
+
+def answer_intent(intent, dataset):
+    """Compute a FastAnswer for a parsed intent over a TransactionDataset."""
+    start = intent.start_date or dataset.min_date
+    end = intent.end_date or dataset.max_date
+    scope, period = _describe(intent, dataset)
+    if start > end:
+        return FastAnswer("That date range is empty.", None)
+
+    summary = dataset.summarize(start, end, intent.categories)
+    if summary.count == 0:
+        return FastAnswer("There are no transactions for {} {}.".format(scope, period), None)
+
+    if intent.group_by == "category":
+        totals = summary.category_totals
+        if intent.aggregation == "count" or intent.aggregation == "mean":
+            selection = dataset.select(start, end, intent.categories)
+            codes = selection.category_codes
+            counts = np.bincount(codes, minlength=len(dataset.categories))
+            counts = pd.Series(counts[counts > 0], index=totals.index)
+            totals = counts if intent.aggregation == "count" else totals / counts
+        totals = totals.sort_values(ascending=intent.ascending)
+        if intent.top_n:
+            totals = totals.head(intent.top_n)
+        label = {"count": "Transactions", "mean": "Average"}.get(intent.aggregation, "Total")
+        table = totals.rename(label).to_frame()
+        if label != "Transactions":
+            table[label] = table[label].map(format_dollars)
+        measure = {"count": "transactions", "mean": "average transaction"}.get(intent.aggregation, "spending")
+        rank = "Lowest" if intent.ascending else "Top"
+        if intent.top_n == 1:
+            lead = "{} category by {}".format(rank, measure)
+        elif intent.top_n:
+            lead = "{} {} categories by {}".format(rank, len(table), measure)
+        else:
+            lead = "{} by category".format(measure.capitalize())
+        return FastAnswer("{} {}:".format(lead, period), table)
+
+    if intent.group_by == "month":
+        selection = dataset.select(start, end, intent.categories)
+        months = selection.dataset.dates[selection.start:selection.stop]
+        if selection.mask is not None:
+            months = months[selection.mask]
+        valid = ~np.isnan(selection.prices)
+        series = pd.Series(selection.cents[valid], index=pd.DatetimeIndex(months[valid]).to_period("M"))
+        monthly = series.groupby(level=0).sum() / 100
+        if intent.aggregation == "mean":
+            return FastAnswer("Your average monthly spending on {} {} was **{}** over {} months.".format(
+                scope, period, format_dollars(monthly.mean()), len(monthly)), None)
+        table = monthly.map(format_dollars).rename("Total").to_frame()
+        table.index = table.index.strftime("%B %Y")
+        return FastAnswer("Monthly spending on {} {}:".format(scope, period), table)
+
+    metrics = summary.metrics
+    if intent.aggregation == "sum":
+        text = "You spent **{}** on {} {} across {}.".format(
+            format_dollars(metrics.total), scope, period, _transactions(summary.count))
+    elif intent.aggregation == "count":
+        text = "You had **{}** in {} {}.".format(_transactions(summary.count), scope, period)
+    elif intent.aggregation == "mean":
+        text = "Your average transaction in {} {} was **{}**.".format(
+            scope, period, format_dollars(metrics.total / summary.count))
+    elif intent.aggregation == "median":
+        text = "Your median transaction in {} {} was **{}**.".format(scope, period, format_dollars(metrics.median))
+    else:
+        selection = dataset.select(start, end, intent.categories)
+        frame = selection.frame
+        largest = intent.aggregation == "top"
+        rows = frame.nlargest(intent.top_n, "PRICE") if largest else frame.nsmallest(intent.top_n, "PRICE")
+        columns = ["DATE", "CATEGORY", "PRICE"]
+        description_column = find_description_column(frame)
+        if description_column:
+            columns.insert(1, description_column)
+        table = rows[columns].reset_index(drop=True)
+        table["DATE"] = table["DATE"].dt.date
+        table["PRICE"] = table["PRICE"].map(format_dollars)
+        if intent.top_n == 1:
+            text = "Your {} transaction in {} {} was **{}**.".format(
+                "largest" if largest else "smallest", scope, period, table["PRICE"].iloc[0])
+        else:
+            text = "Your {} {} transactions in {} {}:".format(
+                "largest" if largest else "smallest", len(table), scope, period)
+        return FastAnswer(text, table)
+    return FastAnswer(text, None)
+
+
+def answer_question(question, dataset, today=None):
+    """FastAnswer for a routine question, or None when the agent is needed."""
+    intent = parse_question(question, dataset.categories, today=today, latest=dataset.max_date)
+    if intent is None:
+        return None
+    return answer_intent(intent, dataset)
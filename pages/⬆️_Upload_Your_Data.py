@@ -1,164 +1,133 @@
 # Import necessary libraries
+import uuid
 import pandas as pd
 import streamlit as st
-from datetime import datetime
-import os
-from dotenv import load_dotenv, find_dotenv
-
+from ingest import content_digest, file_extension, get_ingestion_cache, ingest_upload, ingest_uploads
+from dashboard import (show_ai_section, show_categorization, show_raw_data, show_spending_dashboard,
+                       show_workbook_options)
+from instrumentation import show_trace_panel, start_trace
+from sections import PageSections
+from startup import prewarm
+from store import get_store
+
+# Import LangChain in the background, if enabled
+prewarm()
+
+# Time this rerun's stages (shown in the sidebar when instrumentation is on)
+start_trace("upload")
+# Each section below redoes its work only when its own inputs or the data change
+sections = PageSections("upload")
 
 # Set title and instructions for data upload
 st.title("⬆️ Upload Your Data")
 st.divider()
 st.subheader("😎 Upload your financial data for AI-powered insights")
-
 # Provide guidelines for data upload
 with st.expander("👉 File Upload Example"):
     st.image("./screenshots/file_example.png")
     st.write("**File must contain these columns, case sensitive**")
+    st.caption("CATEGORY may be left out or blank: those rows are categorized from their DESCRIPTION.")
 
-
-# Allow user to upload file
-uploaded_file = st.file_uploader("⬆️ Upload Here", type=['csv', 'xlsx'])
+# Allow user to upload one or more files, e.g. a statement per account per month
+uploaded_files = st.file_uploader("⬆️ Upload Here", type=['csv', 'xlsx'], accept_multiple_files=True)
 st.divider()
 
-# Process uploaded file
-if uploaded_file is not None:
+# Process uploaded files
+if uploaded_files:
     try:
-        # Read the uploaded file based on its extension
-        file_extension = uploaded_file.name.split('.')[-1]
-        if file_extension == 'csv':
-            pandas_data = pd.read_csv(uploaded_file)
-        elif file_extension == 'xlsx':
-            pandas_data = pd.read_excel(uploaded_file)
+        # Hash each upload once per file; later reruns reuse the digests
+        digests = st.session_state.setdefault("upload_digests", {})
+        upload_ids = [getattr(uploaded_file, "file_id", uploaded_file.name) for uploaded_file in uploaded_files]
+        for upload_id, uploaded_file in zip(upload_ids, uploaded_files):
+            if upload_id not in digests:
+                digests[upload_id] = content_digest(uploaded_file.getvalue())
+        file_digests = [digests[upload_id] for upload_id in upload_ids]
+        st.session_state["upload_digest"] = content_digest("".join(file_digests).encode())
+
+        if len(uploaded_files) == 1:
+            # Parse and validate the file, or reuse the cached result for these bytes
+            uploaded_file = uploaded_files[0]
+            sheet, header_row = None, None
+            if file_extension(uploaded_file.name) == "xlsx":
+                # Workbooks may hold several sheets, or a title block above the table
+                sheet, header_row = show_workbook_options(uploaded_file.getvalue(), file_digests[0])
+            ingest_result = ingest_upload(uploaded_file.getvalue(), uploaded_file.name,
+                                          digest=file_digests[0], sheet=sheet, header_row=header_row)
+            upload_name = uploaded_file.name
         else:
-            st.write("Unsupported file format. Please upload a CSV or XLSX file.")
+            # Parse the statements in parallel and merge them, reporting each file as it finishes
+            progress = st.progress(0.0, "Importing {} files...".format(len(uploaded_files)))
+            finished = []
+            def on_file(report):
+                finished.append(report)
+                progress.progress(len(finished) / len(uploaded_files),
+                                  "Parsed {} of {} files".format(len(finished), len(uploaded_files)))
+
+            ingest_result = ingest_uploads([(uploaded_file.name, uploaded_file.getvalue())
+                                            for uploaded_file in uploaded_files],
+                                           digests=file_digests, on_file=on_file)
+            progress.empty()
+            upload_name = "{} files".format(len(uploaded_files))
+
+            # Per-file results
+            failed = [report for report in ingest_result.files if report.error]
+            st.success("✅ Imported {:,} transactions from {} files ({:,} duplicates across statements removed)".format(
+                len(ingest_result.dataset), len(uploaded_files) - len(failed), ingest_result.duplicate_count))
+            for report in failed:
+                st.error("❌ {}: {}".format(report.file_name, report.error))
+            with st.expander("View File Details"):
+                st.dataframe(pd.DataFrame(ingest_result.files).rename(columns={
+                    "file_name": "File", "rows": "Transactions", "bad_row_count": "Skipped Rows",
+                    "duplicates": "Duplicates", "error": "Error", "seconds": "Parse Seconds"}),
+                    hide_index=True)
+        dataset = ingest_result.dataset
+        # Report rows that were skipped because they failed validation
+        if ingest_result.bad_row_count:
+            st.warning("⚠️ Skipped {:,} of {:,} rows with an invalid DATE or PRICE".format(
+                ingest_result.bad_row_count, ingest_result.rows_read))
+            with st.expander("View Skipped Rows"):
+                st.write(ingest_result.bad_rows)
+
+        # Rows no categorization rule matched can be labelled by the LLM
+        dataset = show_categorization(dataset, sections)
+        pandas_data = dataset.frame
+
+        # Data source section: everything below depends on this dataset
+        sections.provide("data", dataset.fingerprint)
+        # Report ingestion cache usage
+        cache_stats = get_ingestion_cache().stats()
+        st.sidebar.caption("📦 Ingestion cache: {} hits, {} misses, {:,.1f} MB used".format(
+            cache_stats["hits"], cache_stats["misses"], cache_stats["bytes"] / 1024 / 1024))
 
         # Display uploaded data
         st.subheader("⚙️ Filter data and visualize spending totals")
         with st.expander("View Uploaded Data"):
-            st.write(pandas_data)
-
-        # Convert 'DATE' column to datetime objects
-        pandas_data['DATE'] = pd.to_datetime(pandas_data['DATE']).dt.date
-
-        # Compute min and max dates
-        min_date = pandas_data['DATE'].min()
-        max_date = pandas_data['DATE'].max()
-
-        # Set up date inputs
-        col1, col2 = st.columns(2)
-        with col1:
-            start_date = st.date_input("Start date", min_date)
-        with col2:
-            end_date = st.date_input("End date", max_date)
-
-        # Selecting categories
-        categories = st.multiselect("Filter by Category", pandas_data['CATEGORY'].unique(), placeholder="Default: all")
-
-        # Formatting date inputs
-        formatted_start = start_date.strftime("%B %d, %Y")
-        formatted_end = end_date.strftime("%B %d, %Y")
-
-        st.divider()
-
-        # Display date range and selected categories
-        st.subheader("🗓 " + formatted_start + " to " + formatted_end)
-        if not categories:
-            st.subheader("🗂 All Categories")
-        else:
-            subheader_text = " + ".join(categories)
-            st.subheader("🗂 Categories: " + subheader_text)
-
-        # Filter data based on date range and selected categories
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
-
-        if start_datetime <= end_datetime:
-            if not categories:
-                filtered_df = pandas_data[(pandas_data['DATE'] >= start_datetime.date()) & 
-                                          (pandas_data['DATE'] <= end_datetime.date())]
-            else:
-                filtered_df = pandas_data[(pandas_data['DATE'] >= start_datetime.date()) & 
-                                          (pandas_data['DATE'] <= end_datetime.date()) & 
-                                          (pandas_data['CATEGORY'].isin(categories))]
-        else:
-            st.error("End date must be after start date.")
-
-        # Calculate spending metrics
-        total_spend = sum(filtered_df['PRICE'])
-        median_spend = filtered_df['PRICE'].median()
-        min_spend = min(filtered_df['PRICE'])
-        max_spend = max(filtered_df['PRICE'])
-
-        # Format spending metrics as dollars
-        total_spend_formatted = "${:,.2f}".format(total_spend)
-        median_spend_formatted = "${:,.2f}".format(median_spend)
-        min_spend_formatted = "${:,.2f}".format(min_spend)
-        max_spend_formatted = "${:,.2f}".format(max_spend)
-
-        # Display spending metrics
-        column_names = ["Min Spend", "Median Spend", "Max Spend", "Total Spend"]
-        formatted_values = [min_spend_formatted, median_spend_formatted, max_spend_formatted, total_spend_formatted]
-
-        for i, (col, value) in enumerate(zip(st.columns(4), formatted_values)):
-            with col:
-                st.metric(column_names[i], value)
-
-        # Display spending distribution by category using a bar chart
-        st.subheader("Spending Distribution")
-        category_spend = filtered_df.groupby('CATEGORY')['PRICE'].sum()
-        st.bar_chart(category_spend)
-
+            show_raw_data(dataset, "upload", sections)
+        # Optionally keep the upload in the local transaction history. Visitors are
+        # anonymous, so the history belongs to this browser session only.
+        source = dataset
+        store = get_store()
+        if store is not None and st.checkbox("💾 Save to my local history and analyze all saved transactions"):
+            history_id = st.session_state.setdefault("history_id", uuid.uuid4().hex)
+            history = store.history("session:" + history_id)
+            if st.session_state.get("saved_digest") != st.session_state["upload_digest"]:
+                st.session_state["saved_digest"] = st.session_state["upload_digest"]
+                st.session_state["saved_rows"] = history.append(pandas_data, source=upload_name)
+            st.caption("{:,} new transactions saved, {:,} in this session's history".format(
+                st.session_state["saved_rows"], len(history)))
+            source = history
+        sections.provide("source", ("history", len(source)) if source is not dataset else dataset.fingerprint)
+
+        # Filters, spending metrics and category chart
+        show_spending_dashboard(source, source.min_date, source.max_date, sections)
         #####################################################################################
-
         # AI Interaction Section
         st.divider()
-        st.subheader("📝 Query financial data in plain English")
-        st.subheader("😎 No need for SQL or Python data skills")
-
-        # Load OpenAI API key from environment variables
-        load_dotenv(find_dotenv())
-        my_key = os.getenv('OPEN_AI_API_KEY')
-
-        # Importing Langchain-related modules
-        from langchain_openai import ChatOpenAI
-        from langchain_experimental.agents import create_pandas_dataframe_agent
-
-        # Create Langchain agent
-        chat = ChatOpenAI(model_name='gpt-3.5-turbo', 
-                        temperature=0, 
-                        openai_api_key=my_key)
-        agent = create_pandas_dataframe_agent(chat, pandas_data, verbose=True)
-
-        # Function to interact with Langchain agent
-        def interact_with_langchain(question):
-            response = agent.invoke(question)
-            return response['output']
-
-        # User input for the question
-        user_question = st.text_input("Enter your question:")
-        question_asked = False
-
-        # Submit button to trigger Langchain interaction
-        if st.button("Submit"):
-            if user_question:
-                question_asked = True
-                langchain_response = interact_with_langchain(user_question)
-                st.write(langchain_response)
-            else:
-                st.warning("Please enter a question.")
-
-        # Show the "Clear" button only if a question has been asked and answered
-        if question_asked:
-            if st.button("Clear Output"):
-                user_question = ""
-                langchain_response = ""
-                st.text_input("Enter your question:", value="Enter your question:")
-                st.write("()()")
-                st.write(langchain_response)
-
+        show_ai_section(dataset, sections)
     except ValueError as ve:
         st.error("An error occurred: Please make sure the uploaded file is not empty or in the correct CSV format.")
 
     except ValueError as ve:
         st.error("An error occurred: Please make sure the uploaded file is not empty or in the correct CSV or XLSX format.")
+# Stage timings for this rerun, when instrumentation is on
+show_trace_panel()
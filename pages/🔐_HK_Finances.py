@@ -1,14 +1,21 @@
 # Import necessary libraries
 import streamlit as st
-import os
-from dotenv import load_dotenv, find_dotenv
-import pandas as pd
-from streamlit_gsheets import GSheetsConnection
 from datetime import datetime
+from alerts import get_alert_engine
+from dashboard import show_ai_section, show_alerts, show_raw_data, show_sheet_status, show_spending_dashboard
+from sheets_sync import GSheetsBackend, connect_gsheets, get_sheet_sync
+from instrumentation import show_trace_panel, start_trace
+from sections import PageSections
+from registry import get_dataset_registry
+from startup import get_settings, prewarm
+from store import get_store
 
 
-# Load environment variables
-load_dotenv(find_dotenv())
+# Import LangChain and the Sheets client in the background, if enabled
+prewarm()
+
+# Time this rerun's stages (shown in the sidebar when instrumentation is on)
+start_trace("hk_finances")
 
 # Set up Streamlit app title and caption
 st.title("🔐 My Personal Finances")
@@ -18,7 +25,7 @@ st.divider()
 # Define main function
 def main():
     # Retrieve secret key from environment variables
-    secret_key = os.getenv('SECRET_KEY')
+    secret_key = get_settings().secret_key
 
     # Get user input for secret key
     user_secret_key = st.text_input("Enter Secret Key", type="password")
@@ -39,131 +46,52 @@ def show_main_screen():
     url = "https://docs.google.com/spreadsheets/d/1n-hcvcfR4yMxqcolyOq2rBauGH1nFtCkWYYZgUgyEDs/edit?usp=sharing"
 
     # Establish connection to Google Sheets
-    conn = st.connection("gsheets", type=GSheetsConnection)
-
-    # Read data from Google Sheets
-    google_data = conn.read(spreadsheet=url, usecols=[0, 1, 2, 3, 4])
-    pandas_data = pd.DataFrame(google_data)
-
-    # Convert 'DATE' column to datetime objects
-    pandas_data['DATE'] = pd.to_datetime(pandas_data['DATE']).dt.date
-
-    # Create two columns for date inputs
-    col1, col2 = st.columns(2)
-
-    # Add date inputs to the columns
-    with col1:
-        start_date = st.date_input("Start date", datetime(2024, 1, 1))
-
-    with col2:
-        end_date = st.date_input("End date", datetime.now().date())
-
-    # Selecting categories
-    categories = st.multiselect("Filter by Category", pandas_data['CATEGORY'].unique(), placeholder="Default: all")
-
-    # Formatting date inputs
-    formatted_start = start_date.strftime("%B %d, %Y")
-    formatted_end = end_date.strftime("%B %d, %Y")
-
-    st.divider()
-
-    # Display date range and selected categories
-    st.subheader("🗓 " + formatted_start + " to " + formatted_end)
-    if not categories:
-        st.subheader("🗂 All Categories")
-    else:
-        subheader_text = " + ".join(categories)
-        st.subheader("🗂 Categories: " + subheader_text)
-
-    # Filter data based on date range and selected categories
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
-
-    if start_datetime <= end_datetime:
-        if not categories:
-            filtered_df = pandas_data[(pandas_data['DATE'] >= start_datetime.date()) & 
-                                (pandas_data['DATE'] <= end_datetime.date())]
-        else:
-            filtered_df = pandas_data[(pandas_data['DATE'] >= start_datetime.date()) & 
-                                    (pandas_data['DATE'] <= end_datetime.date()) & 
-                                    (pandas_data['CATEGORY'].isin(categories))]
-    else:
-        st.error("End date must be after start date.")
-
-    # Calculating spending metrics
-    total_spend = sum(filtered_df['PRICE'])
-    median_spend = filtered_df['PRICE'].median()
-    min_spend = min(filtered_df['PRICE'])
-    max_spend = max(filtered_df['PRICE'])
-
-    # Formatting spending metrics as dollars
-    total_spend_formatted = "${:,.2f}".format(total_spend)
-    median_spend_formatted = "${:,.2f}".format(median_spend)
-    min_spend_formatted = "${:,.2f}".format(min_spend)
-    max_spend_formatted = "${:,.2f}".format(max_spend)
-
-    # Displaying spending metrics
-    column_names = ["Min Spend", "Median Spend", "Max Spend", "Total Spend"]
-    formatted_values = [min_spend_formatted, median_spend_formatted, max_spend_formatted, total_spend_formatted]
-
-    for i, (col, value) in enumerate(zip(st.columns(4), formatted_values)):
-        with col:
-            st.metric(column_names[i], value)
-
-    # Displaying spending distribution by category using a bar chart
-    st.subheader("Spending Distribution")
-    category_spend = filtered_df.groupby('CATEGORY')['PRICE'].sum()
-    st.bar_chart(category_spend)
+    conn = connect_gsheets()
+
+    # Read data from Google Sheets, served from the synced snapshot; every
+    # session shares the same read-only dataset from the registry
+    snapshot = get_sheet_sync().snapshot(url, GSheetsBackend(conn))
+    show_sheet_status(snapshot)
+    dataset = snapshot.dataset
+
+    # Data source section: each section below redoes its work only when its
+    # own inputs or this sheet version change
+    sections = PageSections("hk_finances")
+    sections.provide("data", (url, snapshot.version))
+
+    # Keep the sheet in the local transaction history when a store is configured,
+    # and let DuckDB do the filtering and aggregation
+    source = dataset
+    store = get_store()
+    if store is not None:
+        # The sheet's own history, never mixed with uploads from the public page
+        history = store.history("sheet:" + url)
+        # Saved once per sheet version, whichever session sees it first
+        saved = get_dataset_registry().shared(dataset, "saved_to_store",
+                                              lambda: history.append(dataset.frame, source=url))
+        if saved is None and st.session_state.get("saved_sheet_version") != snapshot.version:
+            history.append(dataset.frame, source=url)
+            st.session_state["saved_sheet_version"] = snapshot.version
+        source = history
+    sections.provide("source", ("history", len(source)) if source is not dataset else (url, snapshot.version))
+
+    # Filters, spending metrics and category chart
+    show_spending_dashboard(source, datetime(2024, 1, 1), datetime.now().date(), sections)
+
+    # Budgets and unusual charges, updated from only the rows new since the last sync
+    alert_engine = get_alert_engine(url)
+    alert_engine.sync(snapshot)
+    show_alerts(alert_engine, dataset.categories, url)
 
     # AI Interaction Section
     st.divider()
-    st.subheader("📝 Query financial data in plain English")
-    st.subheader("😎 No need for SQL or Python data skills")
-
-    # Load OpenAI API key from environment variables
-    my_key = os.getenv('OPEN_AI_API_KEY')
-
-    # Importing Langchain-related modules
-    from langchain_openai import ChatOpenAI
-    from langchain_experimental.agents import create_pandas_dataframe_agent
-
-    # Create Langchain agent with verbose output
-    chat = ChatOpenAI(model_name='gpt-3.5-turbo', 
-                    temperature=0, 
-                    openai_api_key=my_key)
-    agent = create_pandas_dataframe_agent(chat, pandas_data, verbose=True)
-
-    # Function to interact with Langchain agent
-    def interact_with_langchain(question):
-        response = agent.invoke(question)
-        return response['output']
-
-    # User input for the question
-    user_question = st.text_input("Enter your question:")
-    question_asked = False
-
-    # Submit button to trigger Langchain interaction
-    if st.button("Submit"):
-        if user_question:
-            question_asked = True
-            langchain_response = interact_with_langchain(user_question)
-            st.write(langchain_response)
-        else:
-            st.warning("Please enter a question.")
-
-    # Show the "Clear" button only if a question has been asked and answered
-    if question_asked:
-        if st.button("Clear Output"):
-            user_question = ""
-            langchain_response = ""
-            st.text_input("Enter your question:", value="Enter your question:")
-            st.write("()()")
-            st.write(langchain_response)
+    show_ai_section(dataset, sections)
 
     # Expander to display raw data
     with st.expander("See Raw Data"):
-        st.write(pandas_data)
+        show_raw_data(dataset, "hk_finances", sections)
 
 # Run the main function if the script is executed directly
 if __name__ == "__main__":
     main()
+    show_trace_panel()
@@ -0,0 +1,105 @@
+# Server-side paging, sorting and searching of a dataset's raw rows.
+#
+# The raw-data expanders used to send the whole frame to the browser on
+# every rerun. A RawDataView instead answers each (search, categories,
+# sort) query with an array of row positions, and only the visible page of
+# rows is sliced out and rendered. Sort orders are computed once per column,
+# searches run over the distinct descriptions rather than every row, and the
+# last few queries are kept so paging through a result is just a slice.
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from analytics import find_description_column
+
+
+# Query results kept per dataset
+QUERY_CACHE_SIZE = 8
+
+
+class RawDataView:
+    """Row positions for filtered, sorted views of one TransactionDataset."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.description_column = find_description_column(dataset.frame)
+        self._orders = {}
+        self._descriptions = None
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self):
+        return list(self.dataset.frame.columns)
+
+    def _order(self, column):
+        """Row positions sorted by `column`, ascending with missing values last,
+        and the number of missing values."""
+        if column not in self._orders:
+            missing = 0
+            if column == "DATE":
+                # The frame is already sorted by date
+                order = np.arange(len(self.dataset))
+            elif column == "CATEGORY":
+                order = np.argsort(self.dataset.category_codes, kind="stable")
+            elif column == "PRICE":
+                # argsort puts NaN last
+                order = np.argsort(self.dataset.prices, kind="stable")
+                missing = int(np.isnan(self.dataset.prices).sum())
+            else:
+                codes, _ = pd.factorize(self.dataset.frame[column], sort=True)
+                # Missing values are coded -1; move them to the end
+                order = np.argsort(np.where(codes < 0, np.iinfo(np.int64).max, codes), kind="stable")
+                missing = int((codes < 0).sum())
+            self._orders[column] = (order, missing)
+        return self._orders[column]
+
+    def _search_mask(self, search):
+        """Rows whose description or category contains `search`, ignoring case."""
+        categories = pd.Series(self.dataset.categories, dtype=object)
+        matching_categories = np.flatnonzero(categories.str.contains(search, case=False, regex=False))
+        mask = np.isin(self.dataset.category_codes, matching_categories)
+
+        if self.description_column is not None:
+            if self._descriptions is None:
+                codes, uniques = pd.factorize(self.dataset.frame[self.description_column])
+                self._descriptions = (codes, pd.Series(uniques, dtype=object).astype(str))
+            codes, uniques = self._descriptions
+            matching = np.flatnonzero(uniques.str.contains(search, case=False, regex=False))
+            mask |= np.isin(codes, matching)
+        return mask
+
+    def query(self, search="", categories=None, sort_by="DATE", ascending=True):
+        """Positions of the matching rows in display order."""
+        search = search.strip()
+        key = (search.lower(), tuple(sorted(categories or ())), sort_by, ascending)
+        with self._lock:
+            if key in self._queries:
+                self._queries.move_to_end(key)
+                return self._queries[key]
+
+            mask = None
+            if categories:
+                mask = np.isin(self.dataset.category_codes, self.dataset.category_codes_for(categories))
+            if search:
+                search_mask = self._search_mask(search)
+                mask = search_mask if mask is None else mask & search_mask
+
+            order, missing = self._order(sort_by)
+            if not ascending:
+                present = len(order) - missing
+                order = np.concatenate([order[:present][::-1], order[present:]])
+            positions = order if mask is None else order[mask[order]]
+
+            self._queries[key] = positions
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+            return positions
+
+    def page(self, positions, page, page_size):
+        """Rows of one 1-based page of `positions`."""
+        start = (page - 1) * page_size
+        return self.dataset.frame.iloc[positions[start:start + page_size]]
@@ -0,0 +1,146 @@
+# Recurring-charge detection over a whole transaction history.
+#
+# Transactions are grouped by normalized merchant and amount band (amounts
+# within about 15% of each other), then sorted by group and day so the gaps
+# between consecutive charges of a group are one np.diff. A group recurs
+# when its median gap is close to a known cadence and most gaps agree with
+# it. Everything is done with sorts and bincounts over the whole ledger,
+# so a ten-year history takes a fraction of a second.
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from categorize import normalize_descriptions
+
+
+# A charge schedule; `months` is set for schedules that fall on the same day of the month
+Cadence = namedtuple("Cadence", ["name", "days", "tolerance", "min_charges", "per_year", "months"])
+
+CADENCES = [
+    Cadence("Weekly", 7.0, 1, 4, 52, None),
+    Cadence("Every 2 weeks", 14.0, 2, 4, 26, None),
+    Cadence("Monthly", 30.44, 3, 3, 12, 1),
+    Cadence("Quarterly", 91.31, 8, 3, 4, 3),
+    Cadence("Yearly", 365.25, 15, 2, 1, 12),
+]
+
+# Charges whose amounts differ by less than this ratio share a band
+AMOUNT_BAND = 0.15
+
+# Share of a group's gaps that must match its cadence
+MIN_REGULAR_SHARE = 0.75
+
+RECURRING_COLUMNS = ["MERCHANT", "CATEGORY", "CADENCE", "AMOUNT", "CHARGES", "FIRST_DATE",
+                     "LAST_DATE", "NEXT_DATE", "ANNUAL_COST"]
+
+
+def _empty_table():
+    return pd.DataFrame({column: [] for column in RECURRING_COLUMNS})
+
+
+def _group_starts(sorted_groups, group_count):
+    """First position and size of each group in an array sorted by group."""
+    sizes = np.bincount(sorted_groups, minlength=group_count)
+    return np.concatenate([[0], np.cumsum(sizes)[:-1]]), sizes
+
+
+def find_recurring(dates, descriptions, prices, categories=None, as_of=None, include_ended=False):
+    """Table of recurring charges, most expensive per year first.
+
+    `dates`, `descriptions`, `prices` and the optional `categories` are
+    row-aligned. Charges are ended when the next one is overdue by more than
+    half a period at `as_of` (default: the last date in the ledger); they are
+    left out unless `include_ended` is true.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    prices = np.asarray(prices, dtype=np.float64)
+    descriptions = np.asarray(descriptions, dtype=object)
+    valid = ~np.isnat(dates) & (prices > 0)
+    if not valid.any():
+        return _empty_table()
+    rows = np.flatnonzero(valid)
+
+    # Merchants: distinct descriptions normalized once, then mapped back to rows
+    description_codes, unique_descriptions = pd.factorize(descriptions[rows])
+    normalized = normalize_descriptions(unique_descriptions)
+    merchant_of_description, _ = pd.factorize(normalized.mask(normalized == ""))
+    # Missing descriptions (code -1) take the extra -1 at the end
+    merchants = np.append(merchant_of_description, -1)[description_codes]
+    bands = np.floor(np.log(prices[rows]) / np.log1p(AMOUNT_BAND)).astype(np.int64)
+    known = merchants >= 0
+    rows, merchants, bands = rows[known], merchants[known], bands[known]
+    if not rows.size:
+        return _empty_table()
+
+    groups, _ = pd.factorize(merchants.astype(np.int64) * 4096 + (bands - bands.min()))
+    group_count = int(groups.max()) + 1
+    days = dates[rows].astype(np.int64)
+
+    # Rows sorted by group, then day
+    order = np.lexsort((days, groups))
+    rows, groups, days = rows[order], groups[order], days[order]
+    starts, sizes = _group_starts(groups, group_count)
+    ends = starts + sizes - 1
+
+    # Gaps between consecutive charges of the same group
+    same_group = groups[1:] == groups[:-1]
+    gaps = np.diff(days)[same_group]
+    gap_groups = groups[1:][same_group]
+    gap_order = np.lexsort((gaps, gap_groups))
+    gap_starts, gap_sizes = _group_starts(gap_groups[gap_order], group_count)
+    has_gaps = gap_sizes > 0
+    median_gaps = np.zeros(group_count)
+    median_gaps[has_gaps] = gaps[gap_order][gap_starts[has_gaps] + (gap_sizes[has_gaps] - 1) // 2]
+
+    # The cadence each group's median gap is closest to, if any
+    cadence_of_group = np.full(group_count, -1)
+    for index, cadence in enumerate(CADENCES):
+        close = has_gaps & (np.abs(median_gaps - cadence.days) <= cadence.tolerance)
+        cadence_of_group[close & (cadence_of_group < 0)] = index
+    cadence_days = np.array([cadence.days for cadence in CADENCES] + [np.nan])
+    cadence_tolerance = np.array([cadence.tolerance for cadence in CADENCES] + [0])
+    min_charges = np.array([cadence.min_charges for cadence in CADENCES] + [np.iinfo(np.int64).max])
+
+    gap_cadence = cadence_of_group[gap_groups]
+    regular = np.abs(gaps - cadence_days[gap_cadence]) <= cadence_tolerance[gap_cadence]
+    regular_share = np.bincount(gap_groups, weights=regular, minlength=group_count) / np.maximum(gap_sizes, 1)
+    recurring = ((cadence_of_group >= 0) & (sizes >= min_charges[cadence_of_group])
+                 & (regular_share >= MIN_REGULAR_SHARE))
+    if not recurring.any():
+        return _empty_table()
+
+    found = np.flatnonzero(recurring)
+    cadences = cadence_of_group[found]
+    last_rows = rows[ends[found]]
+    last_dates = days[ends[found]].astype("datetime64[D]")
+
+    # Monthly and longer schedules land on the same day of the month
+    next_dates = pd.DatetimeIndex(last_dates)
+    next_dates = pd.Series(next_dates + pd.to_timedelta(np.round(median_gaps[found]), unit="D"))
+    for index, cadence in enumerate(CADENCES):
+        if cadence.months:
+            matching = cadences == index
+            if matching.any():
+                next_dates[matching] = (pd.DatetimeIndex(last_dates[matching])
+                                        + pd.DateOffset(months=cadence.months)).to_numpy()
+
+    amounts = prices[last_rows]
+    table = pd.DataFrame({
+        "MERCHANT": descriptions[last_rows],
+        "CATEGORY": np.asarray(categories, dtype=object)[last_rows] if categories is not None else None,
+        "CADENCE": np.array([cadence.name for cadence in CADENCES], dtype=object)[cadences],
+        "AMOUNT": amounts,
+        "CHARGES": sizes[found],
+        "FIRST_DATE": pd.DatetimeIndex(days[starts[found]].astype("datetime64[D]")),
+        "LAST_DATE": pd.DatetimeIndex(last_dates),
+        "NEXT_DATE": next_dates.to_numpy(),
+        "ANNUAL_COST": amounts * np.array([cadence.per_year for cadence in CADENCES])[cadences],
+    }, columns=RECURRING_COLUMNS)
+
+    if not include_ended:
+        as_of = pd.Timestamp(as_of) if as_of is not None else pd.Timestamp(dates[valid].max())
+        grace = pd.to_timedelta(cadence_days[cadences] / 2, unit="D")
+        table = table[table["NEXT_DATE"] + grace >= as_of]
+    return table.sort_values("ANNUAL_COST", ascending=False, kind="mergesort").reset_index(drop=True)
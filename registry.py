@@ -0,0 +1,186 @@
+# Process-wide registry of shared, read-only datasets.
+#
+# Every session viewing the same source (a synced Google Sheet) gets the
+# same TransactionDataset object instead of building its own copy, and
+# objects derived from a dataset that are safe to share (the Assistant and
+# its agent) are kept with it. There is one entry per source version: a new
+# version of a source replaces the old one. Entries unused for a while are
+# dropped, and the least recently used ones go first when the registry is
+# over its memory budget; a session still holding an evicted dataset keeps
+# it until its next rerun, which loads the source again.
+
+import threading
+import time
+from collections import OrderedDict
+
+from startup import get_settings
+
+
+# Seconds an entry may go unused before it is dropped
+DEFAULT_IDLE_SECONDS = 30 * 60
+
+
+class _Entry:
+    def __init__(self, dataset, nbytes):
+        self.dataset = dataset
+        self.nbytes = nbytes
+        self.shared = {}
+        self.last_used = time.monotonic()
+
+
+def freeze(dataset):
+    """Make the dataset's columnar arrays read-only, so no session can change them for the others."""
+    for array in (dataset.dates, dataset.prices, dataset.cents, dataset.category_codes):
+        array.flags.writeable = False
+    return dataset
+
+
+class DatasetRegistry:
+    """Thread-safe map of (source, version) to one shared dataset, bounded by memory and idle time.
+
+    Versions of a source must increase, so that a late request for an old
+    version cannot replace a newer one.
+    """
+
+    def __init__(self, max_bytes, idle_seconds=DEFAULT_IDLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        # One loader per key at a time; other sessions wait for its result
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.nbytes
+        if self._versions.get(key[0]) == key[1]:
+            del self._versions[key[0]]
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if key != keep and now - entry.last_used > self.idle_seconds:
+                self._drop(key)
+                self.evictions += 1
+        for key in list(self._entries):
+            if self.current_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                self._drop(key)
+                self.evictions += 1
+
+    def _touch(self, key):
+        entry = self._entries[key]
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_or_load(self, source, version, loader):
+        """The shared dataset for this version of `source`, calling `loader()` if it is not held."""
+        key = (source, version)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._evict(keep=key)
+                return self._touch(key).dataset
+            self.misses += 1
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                if key in self._entries:
+                    return self._touch(key).dataset
+            dataset = freeze(loader())
+            # Every page summarizes from the rollup, so it is built here and counted with the dataset
+            dataset.rollup
+            nbytes = dataset.nbytes
+            with self._lock:
+                self._loading.pop(key, None)
+                # A newer version replaces the previous one of the same source
+                previous = self._versions.get(source)
+                if previous is not None:
+                    if previous > version:
+                        return dataset
+                    self._drop((source, previous))
+                self._entries[key] = _Entry(dataset, nbytes)
+                self._versions[source] = version
+                self.current_bytes += nbytes
+                self._evict(keep=key)
+            return dataset
+
+    def _key_of(self, dataset):
+        for key, entry in self._entries.items():
+            if entry.dataset is dataset:
+                return key
+        return None
+
+    def holds(self, dataset):
+        with self._lock:
+            return self._key_of(dataset) is not None
+
+    def shared(self, dataset, name, factory):
+        """A `name` object derived from a registered dataset, made by `factory()` once for every session.
+
+        Returns None when `dataset` is not (or no longer) registered.
+        """
+        with self._lock:
+            key = self._key_of(dataset)
+            if key is None:
+                return None
+            entry = self._touch(key)
+            if name in entry.shared:
+                return entry.shared[name]
+        # Made outside the lock; if two sessions race, the first result is kept
+        value = factory()
+        with self._lock:
+            return entry.shared.setdefault(name, value)
+
+    def evict_idle(self):
+        """Drop entries unused for longer than idle_seconds."""
+        with self._lock:
+            before = len(self._entries)
+            self._evict()
+            return before - len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and memory usage."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Process-wide registry shared by every session
+_dataset_registry = None
+_dataset_registry_lock = threading.Lock()
+
+
+def get_dataset_registry():
+    """The shared registry, sized by POCKETBOOK_REGISTRY_MB and POCKETBOOK_REGISTRY_IDLE_SECONDS."""
+    global _dataset_registry
+    with _dataset_registry_lock:
+        if _dataset_registry is None:
+            settings = get_settings()
+            _dataset_registry = DatasetRegistry(settings.registry_mb * 1024 * 1024,
+                                                settings.registry_idle_seconds)
+        return _dataset_registry
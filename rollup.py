@@ -0,0 +1,226 @@
+# Pre-aggregated date x category rollup for a TransactionDataset.
+#
+# Each (day, category) cell holds the sum (in whole cents), count, min and max of its prices,
+# and log-bucketed histograms of the prices (a DDSketch-style quantile
+# sketch) are kept per day and per month. Any date range and category subset is answered from the cells:
+# totals, mins and maxes exactly, and the median either exactly from the raw
+# rows (small selections) or from the sketch to within MEDIAN_RELATIVE_ERROR.
+
+import numpy as np
+import pandas as pd
+
+from analytics import SpendMetrics, SpendSummary, bucket_days, spending_series
+
+
+# Relative error bound of sketch medians: the estimate m' of the true median
+# m satisfies |m' - m| <= MEDIAN_RELATIVE_ERROR * |m| (prices under
+# MIN_SKETCH_VALUE in magnitude are treated as zero).
+MEDIAN_RELATIVE_ERROR = 0.005
+MIN_SKETCH_VALUE = 0.005
+
+# Selections with at most this many rows get an exact median from raw rows
+EXACT_MEDIAN_ROWS = 50_000
+
+_GAMMA = (1 + MEDIAN_RELATIVE_ERROR) / (1 - MEDIAN_RELATIVE_ERROR)
+_LOG_GAMMA = np.log(_GAMMA)
+_MIN_INDEX = int(np.ceil(np.log(MIN_SKETCH_VALUE) / _LOG_GAMMA))
+
+
+def sketch_keys(values):
+    """Order-preserving sketch bucket keys: 0 for ~zero, +/- log buckets otherwise."""
+    magnitude = np.abs(values)
+    keys = np.zeros(len(values), dtype=np.int64)
+    nonzero = magnitude >= MIN_SKETCH_VALUE
+    buckets = np.ceil(np.log(magnitude[nonzero]) / _LOG_GAMMA).astype(np.int64) - _MIN_INDEX + 1
+    keys[nonzero] = np.where(values[nonzero] > 0, buckets, -buckets)
+    return keys
+
+
+def sketch_values(keys):
+    """Representative value of each sketch bucket key."""
+    keys = np.asarray(keys, dtype=np.int64)
+    magnitude = np.abs(keys)
+    values = 2 * _GAMMA ** (magnitude - 1 + _MIN_INDEX) / (_GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * values)
+
+
+class SketchLayer:
+    """Quantile sketch entries (cell, bucket key, count) grouped by period x category cell."""
+
+    def __init__(self, periods, codes, bucket_keys, key_offset, num_keys, num_categories):
+        # Cells ordered by period, then category
+        cell_keys = periods * num_categories + codes
+        cell_ids, cell_index = np.unique(cell_keys, return_inverse=True)
+        self.cell_periods = cell_ids // num_categories
+        self.cell_codes = cell_ids % num_categories
+
+        entries, counts = np.unique(cell_index * num_keys + (bucket_keys - key_offset),
+                                    return_counts=True)
+        self.entry_cells = entries // num_keys
+        self.entry_keys = entries % num_keys
+        self.entry_counts = counts.astype(np.int64)
+        self.offsets = np.searchsorted(self.entry_cells, np.arange(len(cell_ids) + 1))
+
+    @property
+    def nbytes(self):
+        arrays = [self.cell_periods, self.cell_codes, self.entry_cells, self.entry_keys,
+                  self.entry_counts, self.offsets]
+        return sum(array.nbytes for array in arrays)
+
+    def histogram(self, first_period, last_period, wanted, num_keys):
+        """Bucket counts for periods [first_period, last_period], optionally by category."""
+        start = int(np.searchsorted(self.cell_periods, first_period, side="left"))
+        stop = int(np.searchsorted(self.cell_periods, last_period, side="right"))
+        entries = slice(self.offsets[start], self.offsets[max(start, stop)])
+        keys = self.entry_keys[entries]
+        counts = self.entry_counts[entries]
+        if wanted is not None:
+            keep = np.isin(self.cell_codes[self.entry_cells[entries]], wanted)
+            keys, counts = keys[keep], counts[keep]
+        return np.bincount(keys, weights=counts, minlength=num_keys)
+
+
+class RollupCube:
+    """Per-day, per-category aggregates and quantile sketches for one dataset."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.num_categories = max(len(dataset.categories), 1)
+
+        prices = dataset.prices
+        valid = ~np.isnan(prices)
+        prices = prices[valid]
+        cents = dataset.cents[valid]
+        days = dataset.dates[valid].astype("datetime64[D]")
+        months = days.astype("datetime64[M]").astype(np.int64)
+        days = days.astype(np.int64)
+        codes = dataset.category_codes[valid].astype(np.int64)
+
+        # Day x category cells ordered by day, then category
+        cell_keys = days * self.num_categories + codes
+        order = np.argsort(cell_keys, kind="stable")
+        cell_keys = cell_keys[order]
+        boundaries = np.ones(len(cell_keys), dtype=bool)
+        boundaries[1:] = cell_keys[1:] != cell_keys[:-1]
+        starts = np.flatnonzero(boundaries)
+
+        unique_keys = cell_keys[starts]
+        self.cell_days = unique_keys // self.num_categories
+        self.cell_codes = unique_keys % self.num_categories
+        self.cell_counts = np.diff(np.r_[starts, len(cell_keys)]).astype(np.int64)
+        if len(prices):
+            sorted_prices = prices[order]
+            self.cell_cents = np.add.reduceat(cents[order], starts)
+            self.cell_mins = np.minimum.reduceat(sorted_prices, starts)
+            self.cell_maxes = np.maximum.reduceat(sorted_prices, starts)
+        else:
+            self.cell_cents = np.array([], dtype=np.int64)
+            self.cell_mins = self.cell_maxes = np.array([], dtype=np.float64)
+
+        # Median sketches per day (for partial months) and per month
+        bucket_keys = sketch_keys(prices)
+        self.key_offset = int(bucket_keys.min()) if len(bucket_keys) else 0
+        self.num_keys = int(bucket_keys.max()) - self.key_offset + 1 if len(bucket_keys) else 1
+        self.daily_sketch = SketchLayer(days, codes, bucket_keys, self.key_offset,
+                                        self.num_keys, self.num_categories)
+        self.monthly_sketch = SketchLayer(months, codes, bucket_keys, self.key_offset,
+                                          self.num_keys, self.num_categories)
+
+    @property
+    def nbytes(self):
+        arrays = [self.cell_days, self.cell_codes, self.cell_counts, self.cell_cents,
+                  self.cell_mins, self.cell_maxes]
+        return (sum(array.nbytes for array in arrays) + self.daily_sketch.nbytes
+                + self.monthly_sketch.nbytes)
+
+    def _cell_range(self, first_day, last_day):
+        start = int(np.searchsorted(self.cell_days, first_day, side="left"))
+        stop = int(np.searchsorted(self.cell_days, last_day, side="right"))
+        return start, max(start, stop)
+
+    def _sketch_median(self, first_day, last_day, wanted, count):
+        # Whole months come from the monthly layer, the partial edges from days
+        first = np.datetime64(int(first_day), "D")
+        first_month = first.astype("datetime64[M]")
+        if first_month.astype("datetime64[D]") != first:
+            first_month += 1
+        last_month = np.datetime64(int(last_day) + 1, "D").astype("datetime64[M]") - 1
+        full_first = int(first_month.astype("datetime64[D]").astype(np.int64))
+        full_last = int((last_month + 1).astype("datetime64[D]").astype(np.int64)) - 1
+
+        if first_month <= last_month:
+            histogram = self.monthly_sketch.histogram(first_month.astype(np.int64),
+                                                      last_month.astype(np.int64),
+                                                      wanted, self.num_keys)
+            histogram += self.daily_sketch.histogram(first_day, full_first - 1, wanted, self.num_keys)
+            histogram += self.daily_sketch.histogram(full_last + 1, last_day, wanted, self.num_keys)
+        else:
+            histogram = self.daily_sketch.histogram(first_day, last_day, wanted, self.num_keys)
+
+        # Pandas-style median: mean of the two middle ranks for even counts
+        cumulative = np.cumsum(histogram)
+        ranks = np.array([(count - 1) // 2, count // 2])
+        buckets = np.searchsorted(cumulative, ranks, side="right")
+        return float(sketch_values(buckets + self.key_offset).mean())
+
+    def summarize(self, start_date, end_date, categories=None):
+        """Count, spend metrics and per-category totals for a date range."""
+        first_day = np.datetime64(start_date, "D").astype(np.int64)
+        last_day = np.datetime64(end_date, "D").astype(np.int64)
+        start, stop = self._cell_range(first_day, last_day)
+        cells = slice(start, stop)
+        codes = self.cell_codes[cells]
+        wanted = None
+        mask = np.ones(stop - start, dtype=bool)
+        if categories:
+            wanted = self.dataset.category_codes_for(categories)
+            mask = np.isin(codes, wanted)
+
+        counts = self.cell_counts[cells][mask]
+        count = int(counts.sum())
+        if count == 0:
+            empty = pd.Series([], index=pd.Index([], name="CATEGORY", dtype=object),
+                              name="PRICE", dtype="float64")
+            return SpendSummary(0, SpendMetrics(0.0, float("nan"), float("nan"), float("nan")), empty)
+
+        cents = self.cell_cents[cells][mask]
+        codes = codes[mask]
+
+        if count <= EXACT_MEDIAN_ROWS:
+            prices = self.dataset.select(start_date, end_date, categories).prices
+            median = float(np.median(prices[~np.isnan(prices)]))
+        else:
+            median = self._sketch_median(first_day, last_day, wanted, count)
+
+        metrics = SpendMetrics(
+            total=int(cents.sum()) / 100,
+            median=median,
+            min=float(self.cell_mins[cells][mask].min()),
+            max=float(self.cell_maxes[cells][mask].max()),
+        )
+
+        num_categories = len(self.dataset.categories)
+        # float64 weights add whole cents exactly
+        totals = np.bincount(codes, weights=cents, minlength=num_categories)
+        present = np.bincount(codes, weights=counts, minlength=num_categories) > 0
+        index = pd.Index(np.asarray(self.dataset.categories, dtype=object)[present], name="CATEGORY")
+        category_totals = pd.Series(totals[present] / 100, index=index, name="PRICE")
+        return SpendSummary(count, metrics, category_totals)
+
+    def spending_over_time(self, start_date, end_date, categories, granularity):
+        """Total spend per bucket from the day cells, with empty buckets as 0."""
+        first_day = np.datetime64(start_date, "D").astype(np.int64)
+        last_day = np.datetime64(end_date, "D").astype(np.int64)
+        start, stop = self._cell_range(first_day, last_day)
+        days = self.cell_days[start:stop]
+        cents = self.cell_cents[start:stop]
+        if categories:
+            mask = np.isin(self.cell_codes[start:stop], self.dataset.category_codes_for(categories))
+            days, cents = days[mask], cents[mask]
+
+        # Cells are ordered by day, so bucket boundaries are where the bucket changes
+        buckets = bucket_days(days, granularity)
+        if len(buckets):
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            buckets, cents = buckets[starts], np.add.reduceat(cents, starts)
+        return spending_series(buckets, cents / 100, start_date, end_date, granularity)
@@ -0,0 +1,77 @@
+# Page sections that redo their work only when their own inputs change.
+#
+# Streamlit reruns a page script from the top on every interaction, and the
+# Streamlit this app pins has no fragments to rerun part of a page. Pages are
+# therefore split into sections (data source, filters/metrics/charts, AI
+# query, raw data), each declaring the widget values it reads and the
+# sections it depends on. A section's key is a hash of its inputs and its
+# dependencies' keys, and its results are kept in session state under that
+# key: a rerun caused by another section's widget reuses them and only
+# redraws, while a new dataset changes the data section's key and so
+# invalidates every section downstream of it.
+
+import hashlib
+
+import streamlit as st
+
+from instrumentation import span
+
+
+def _digest(value):
+    return hashlib.blake2b(repr(value).encode(), digest_size=16).hexdigest()
+
+
+class PageSections:
+    """This session's section results for one page, in the order the sections run."""
+
+    def __init__(self, page):
+        self.page = page
+        # {section: (key, result)}, kept across reruns
+        self._results = st.session_state.setdefault("sections_" + page, {})
+        # Keys of the sections that ran in this rerun, and which of them did their work
+        self.keys = {}
+        self.recomputed = []
+
+    def provide(self, name, key):
+        """Declare a source section (e.g. the dataset) identified by `key`, with nothing to compute."""
+        self.keys[name] = _digest(key)
+        previous = self._results.get(name)
+        if previous is None or previous[0] != self.keys[name]:
+            self._results[name] = (self.keys[name], None)
+            self.recomputed.append(name)
+
+    def key(self, name, inputs, depends_on=()):
+        """The key of section `name` for these inputs; every dependency must have run earlier in this rerun."""
+        missing = [dependency for dependency in depends_on if dependency not in self.keys]
+        if missing:
+            raise KeyError("Section {!r} runs before {}".format(name, ", ".join(missing)))
+        return _digest((inputs, [self.keys[dependency] for dependency in depends_on]))
+
+    def run(self, name, inputs, compute, depends_on=()):
+        """`compute()`'s result for section `name`, reused while its inputs and dependencies are unchanged."""
+        key = self.key(name, inputs, depends_on)
+        self.keys[name] = key
+        previous = self._results.get(name)
+        if previous is not None and previous[0] == key:
+            return previous[1]
+        with span("section." + name):
+            result = compute()
+        self._results[name] = (key, result)
+        self.recomputed.append(name)
+        return result
+
+    def get(self, name, inputs, depends_on=()):
+        """The result kept for section `name` if it was computed for these inputs, else None."""
+        previous = self._results.get(name)
+        if previous is not None and previous[0] == self.key(name, inputs, depends_on):
+            return previous[1]
+        return None
+
+    def put(self, name, inputs, result, depends_on=()):
+        """Keep `result` for section `name` and these inputs, e.g. an answer computed on a button click."""
+        self.keys[name] = self.key(name, inputs, depends_on)
+        self._results[name] = (self.keys[name], result)
+        self.recomputed.append(name)
+
+    def discard(self, name):
+        self._results.pop(name, None)
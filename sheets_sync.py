@@ -0,0 +1,214 @@
+# Background sync of Google Sheets data.
+#
+# Each spreadsheet has a snapshot: the last good read and its version.
+# Pages are served the snapshot immediately; once it is older than the TTL a
+# background thread refreshes it, fetching only the rows appended since the
+# last sync (with a periodic full read to pick up edits and deletions). Invalidating a spreadsheet drops only that snapshot.
+# Normalized datasets are kept in the shared DatasetRegistry rather than in
+# the snapshots, so every session gets the same copy and idle sheets can be
+# evicted; an evicted dataset is rebuilt from the snapshot's data on demand.
+# A snapshot records how many of its rows were appended to the previous
+# version, so consumers such as the alert engine can read only those.
+
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from analytics import TransactionDataset
+from instrumentation import span
+from registry import get_dataset_registry
+
+
+# Seconds a snapshot is served before a background refresh starts
+DEFAULT_TTL_SECONDS = 60
+
+# Every Nth refresh re-reads the whole sheet instead of only appended rows
+FULL_REFRESH_EVERY = 10
+
+# Columns read from each sheet, as on the pages
+SHEET_COLUMNS = [0, 1, 2, 3, 4]
+
+# Snapshot versions, unique across spreadsheets, invalidations and SheetSync instances
+_versions = itertools.count(1)
+
+
+class SheetSnapshot(namedtuple("SheetSnapshot", ["spreadsheet", "data", "fetched_at", "version",
+                                                 "refreshing", "error", "previous_version", "appended",
+                                                 "sheet_rows"])):
+    """Last good read of one spreadsheet.
+
+    `appended` is the number of rows at the end of `data` that
+    `previous_version` did not have, or None when the rows before them
+    changed too (or there is no previous version). `sheet_rows` counts the
+    rows read from the sheet, blank ones included, which `data` leaves out;
+    the next incremental read starts after them.
+    """
+
+    @property
+    def dataset(self):
+        """The shared TransactionDataset for this version, rebuilt if it was evicted."""
+        return get_dataset_registry().get_or_load(self.spreadsheet, self.version,
+                                                  lambda: TransactionDataset.from_frame(self.data))
+
+
+def connect_gsheets():
+    """The app's streamlit-gsheets connection, importing the client on first use."""
+    import streamlit as st
+    from streamlit_gsheets import GSheetsConnection
+
+    return st.connection("gsheets", type=GSheetsConnection)
+
+
+class GSheetsBackend:
+    """Reads spreadsheets through a streamlit-gsheets GSheetsConnection."""
+
+    def __init__(self, connection, usecols=SHEET_COLUMNS):
+        self.connection = connection
+        self.usecols = usecols
+
+    def read(self, spreadsheet, skip_rows=0):
+        with span("sheets.read", skip_rows=skip_rows) as current:
+            frame = self._read(spreadsheet, skip_rows)
+            current.set(rows=None if frame is None else len(frame))
+        return frame
+
+    def _read(self, spreadsheet, skip_rows):
+        # ttl=0: the sync layer, not the connection, decides when data is stale
+        if skip_rows:
+            try:
+                return pd.DataFrame(self.connection.read(spreadsheet=spreadsheet, usecols=self.usecols,
+                                                         ttl=0, skiprows=range(1, skip_rows + 1)))
+            except TypeError:
+                # This client cannot skip rows; fall back to a full read
+                return None
+        return pd.DataFrame(self.connection.read(spreadsheet=spreadsheet, usecols=self.usecols, ttl=0))
+
+
+class LocalSheetBackend:
+    """Stand-in backend serving DataFrames (or CSV paths) keyed by spreadsheet."""
+
+    def __init__(self, sheets=None, delay=0.0):
+        self.sheets = dict(sheets or {})
+        self.delay = delay
+        self.reads = 0
+
+    def read(self, spreadsheet, skip_rows=0):
+        self.reads += 1
+        if self.delay:
+            time.sleep(self.delay)
+        sheet = self.sheets[spreadsheet]
+        frame = pd.read_csv(sheet) if isinstance(sheet, str) else sheet
+        return frame.iloc[skip_rows:].reset_index(drop=True)
+
+
+class _SheetEntry:
+    def __init__(self):
+        self.snapshot = None
+        self.syncs = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+
+class SheetSync:
+    """Per-spreadsheet snapshots with TTL-based background refresh."""
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, full_refresh_every=FULL_REFRESH_EVERY):
+        self.ttl = ttl
+        self.full_refresh_every = full_refresh_every
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, spreadsheet):
+        with self._lock:
+            return self._entries.setdefault(spreadsheet, _SheetEntry())
+
+    def _fetch(self, spreadsheet, backend, entry):
+        """Read new data for `spreadsheet` and store a new snapshot."""
+        previous = entry.snapshot
+        entry.syncs += 1
+        incremental = previous is not None and entry.syncs % self.full_refresh_every != 0
+        appended = backend.read(spreadsheet, skip_rows=previous.sheet_rows) if incremental else None
+
+        if appended is None:
+            data = backend.read(spreadsheet)
+            sheet_rows = len(data)
+            data = data.dropna(how="all").reset_index(drop=True)
+            changed = previous is None or not data.equals(previous.data)
+            # A full read may still only have added rows at the end
+            added = None
+            if changed and previous is not None and len(data) >= len(previous.data):
+                if data.iloc[:len(previous.data)].equals(previous.data):
+                    added = len(data) - len(previous.data)
+        else:
+            sheet_rows = previous.sheet_rows + len(appended)
+            appended = appended.dropna(how="all")
+            data = pd.concat([previous.data, appended], ignore_index=True) if len(appended) else previous.data
+            changed = len(appended) > 0
+            added = len(appended)
+
+        if changed:
+            snapshot = SheetSnapshot(spreadsheet, data, time.time(), next(_versions), False, None,
+                                     None if previous is None else previous.version, added, sheet_rows)
+        else:
+            snapshot = previous._replace(fetched_at=time.time(), refreshing=False, error=None,
+                                         sheet_rows=sheet_rows)
+        if changed:
+            # Normalize here, on the sync thread, rather than in the first session that asks
+            snapshot.dataset
+        entry.snapshot = snapshot
+
+    def _refresh_in_background(self, spreadsheet, backend, entry):
+        def run():
+            try:
+                with span("sheets.background_sync", sync=entry.syncs + 1) as current:
+                    self._fetch(spreadsheet, backend, entry)
+                    current.set(rows=len(entry.snapshot.data))
+            except Exception as error:
+                # Keep serving the last good snapshot, but remember the failure
+                entry.snapshot = entry.snapshot._replace(refreshing=False, error=error)
+            finally:
+                entry.thread = None
+
+        entry.snapshot = entry.snapshot._replace(refreshing=True)
+        entry.thread = threading.Thread(target=run, name="sheet-sync", daemon=True)
+        entry.thread.start()
+
+    def snapshot(self, spreadsheet, backend):
+        """The current snapshot, blocking only when none exists yet."""
+        entry = self._entry(spreadsheet)
+        with entry.lock:
+            if entry.snapshot is None:
+                with span("sheets.first_sync") as current:
+                    self._fetch(spreadsheet, backend, entry)
+                    current.set(rows=len(entry.snapshot.data))
+            elif entry.thread is None and time.time() - entry.snapshot.fetched_at > self.ttl:
+                self._refresh_in_background(spreadsheet, backend, entry)
+            return entry.snapshot
+
+    def invalidate(self, spreadsheet):
+        """Forget one spreadsheet's snapshot so the next read fetches it in full."""
+        with self._lock:
+            self._entries.pop(spreadsheet, None)
+
+    def wait(self, spreadsheet, timeout=None):
+        """Block until a running background refresh of `spreadsheet` finishes."""
+        thread = self._entry(spreadsheet).thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+# Process-wide sync shared by every session
+_sheet_sync = None
+_sheet_sync_lock = threading.Lock()
+
+
+def get_sheet_sync():
+    """The shared SheetSync, created on first use."""
+    global _sheet_sync
+    with _sheet_sync_lock:
+        if _sheet_sync is None:
+            _sheet_sync = SheetSync()
+        return _sheet_sync
@@ -0,0 +1,139 @@
+# Process startup: settings read once, heavy imports deferred or prewarmed.
+#
+# LangChain, the OpenAI client and the Google Sheets connection take seconds
+# to import but are only needed once a user reaches the AI or Sheets
+# sections, so no page imports them at the top. Settings (including .env)
+# are read once per process instead of on every rerun. When
+# POCKETBOOK_PREWARM is set, the first page render starts a daemon thread
+# that imports the heavy modules in the background, so the first question
+# does not pay for them either.
+#
+# `python startup.py` prints how long each module takes to import in a
+# fresh interpreter.
+
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+
+# Modules imported by the prewarm thread, cheapest first
+PREWARM_MODULES = [
+    "duckdb",
+    "sqlparse",
+    "pyarrow.csv",
+    "streamlit_gsheets",
+    "langchain_openai",
+    "langchain_experimental.agents",
+]
+
+# Process-wide configuration, read from the environment (and .env) once
+Settings = namedtuple("Settings", ["openai_api_key", "secret_key", "store_path", "answer_cache_path",
+                                   "ingest_cache_mb", "prewarm", "instrument", "llm_concurrency",
+                                   "category_rules_path", "registry_mb", "registry_idle_seconds",
+                                   "workbook_cache_dir", "budgets_path"])
+
+_settings = None
+_settings_lock = threading.Lock()
+
+_prewarm_thread = None
+_prewarm_timings = {}
+_prewarm_lock = threading.Lock()
+
+
+def _env_path(name):
+    path = os.getenv(name)
+    return os.path.expanduser(path) if path else None
+
+
+def _env_flag(name):
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+def get_settings():
+    """The process settings, loading .env on first use."""
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            from dotenv import find_dotenv, load_dotenv
+
+            load_dotenv(find_dotenv(usecwd=True))
+            _settings = Settings(
+                openai_api_key=os.getenv("OPEN_AI_API_KEY"),
+                secret_key=os.getenv("SECRET_KEY"),
+                store_path=_env_path("POCKETBOOK_STORE_PATH"),
+                answer_cache_path=_env_path("POCKETBOOK_ANSWER_CACHE_PATH"),
+                ingest_cache_mb=int(os.getenv("POCKETBOOK_INGEST_CACHE_MB", "1024")),
+                prewarm=_env_flag("POCKETBOOK_PREWARM"),
+                instrument=_env_flag("POCKETBOOK_INSTRUMENT"),
+                llm_concurrency=int(os.getenv("POCKETBOOK_LLM_CONCURRENCY", "4")),
+                category_rules_path=_env_path("POCKETBOOK_CATEGORY_RULES"),
+                registry_mb=int(os.getenv("POCKETBOOK_REGISTRY_MB", "1024")),
+                registry_idle_seconds=int(os.getenv("POCKETBOOK_REGISTRY_IDLE_SECONDS", "1800")),
+                workbook_cache_dir=_env_path("POCKETBOOK_WORKBOOK_CACHE_DIR"),
+                budgets_path=_env_path("POCKETBOOK_BUDGETS"),
+            )
+        return _settings
+
+
+def _prewarm(modules):
+    for name in modules:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # Missing optional dependency; its section reports the error when used
+            continue
+        _prewarm_timings[name] = time.perf_counter() - started
+
+
+def prewarm(modules=PREWARM_MODULES, force=False):
+    """Import heavy modules in a background thread, once per process.
+
+    Does nothing unless POCKETBOOK_PREWARM is set or `force` is true.
+    Returns the thread, or None when prewarming is disabled.
+    """
+    global _prewarm_thread
+    if not (force or get_settings().prewarm):
+        return None
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm, args=(list(modules),),
+                                               name="prewarm", daemon=True)
+            _prewarm_thread.start()
+        return _prewarm_thread
+
+
+def prewarm_timings():
+    """Seconds each module took in the prewarm thread so far."""
+    return dict(_prewarm_timings)
+
+
+def measure_import(module, python=sys.executable):
+    """Seconds to import `module` in a fresh interpreter, or None if it is missing."""
+    code = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)".format(module)
+    completed = subprocess.run([python, "-c", code], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode != 0:
+        return None
+    return float(completed.stdout.strip())
+
+
+def import_time_report(modules, repeat=3):
+    """Best-of-`repeat` cold import time per module, in seconds."""
+    report = {}
+    for module in modules:
+        timings = [measure_import(module) for _ in range(repeat)]
+        report[module] = None if None in timings else min(timings)
+    return report
+
+
+if __name__ == "__main__":
+    page_modules = ["streamlit", "pandas", "analytics", "ingest", "dashboard", "sheets_sync", "store"]
+    modules = sys.argv[1:] or page_modules + PREWARM_MODULES
+    for module, seconds in import_time_report(modules).items():
+        timing = "not installed" if seconds is None else "{:8.3f} s".format(seconds)
+        print("{:<32} {}".format(module, timing))
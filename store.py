@@ -0,0 +1,231 @@
+# Persistent local transaction store backed by DuckDB.
+#
+# Ingested ledgers are appended to a single on-disk table; rows already in
+# the store (same transaction fingerprint) are skipped, so re-uploading an
+# overlapping statement only adds what is new. Filters and aggregates run as
+# SQL inside DuckDB instead of in pandas. Every row belongs to an owner (a
+# synced sheet, or one browser session on the public upload page) and is
+# only ever read, deduplicated or exported through that owner's
+# TransactionHistory, so one visitor never sees another's transactions.
+
+import os
+import threading
+from datetime import date
+
+import pandas as pd
+
+from analytics import (SpendMetrics, SpendSummary, choose_granularity, find_description_column,
+                       spending_series, transaction_fingerprints)
+from startup import get_settings
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    FINGERPRINT UBIGINT NOT NULL,
+    DATE DATE NOT NULL,
+    CATEGORY VARCHAR,
+    PRICE DOUBLE,
+    DESCRIPTION VARCHAR,
+    SOURCE VARCHAR,
+    ADDED_AT TIMESTAMP DEFAULT current_timestamp,
+    OWNER VARCHAR
+)
+"""
+
+# Stores created before rows had owners gain the column; their rows belong to no one
+ADD_OWNER = "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS OWNER VARCHAR"
+
+
+# Sum of PRICE added up in whole cents, as the in-memory engine does, so totals do not drift
+SUM_PRICE = "CAST(sum(CAST(round(PRICE * 100) AS BIGINT)) AS DOUBLE) / 100"
+
+
+class TransactionStore:
+    """An on-disk DuckDB table of deduplicated transactions, read and written per owner."""
+
+    def __init__(self, path):
+        import duckdb
+
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = duckdb.connect(path)
+        self._connection.execute(SCHEMA)
+        self._connection.execute(ADD_OWNER)
+        # One DuckDB connection is shared, so statements are serialized
+        self._lock = threading.Lock()
+        # {owner: (row count, table)} of the last recurring-charge scan
+        self._recurring = {}
+
+    def _query(self, sql, parameters=None):
+        with self._lock:
+            return self._connection.execute(sql, parameters or []).fetchall()
+
+    def _query_frame(self, sql, parameters=None):
+        with self._lock:
+            return self._connection.execute(sql, parameters or []).df()
+
+    def history(self, owner):
+        """The TransactionHistory of `owner`, e.g. "sheet:<url>" or "session:<id>"."""
+        if not owner:
+            raise ValueError("A transaction history needs an owner")
+        return TransactionHistory(self, owner)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class TransactionHistory:
+    """One owner's rows of a TransactionStore; every query is limited to them."""
+
+    def __init__(self, store, owner):
+        self.store = store
+        self.owner = owner
+
+    def append(self, frame, source=""):
+        """Insert rows whose fingerprint this owner has not stored yet; returns how many were added."""
+        if frame.empty:
+            return 0
+        description_column = find_description_column(frame)
+        incoming = pd.DataFrame({
+            "FINGERPRINT": transaction_fingerprints(frame),
+            "DATE": pd.to_datetime(frame["DATE"]).dt.normalize(),
+            "CATEGORY": frame["CATEGORY"].astype(object),
+            "PRICE": pd.to_numeric(frame["PRICE"], errors="coerce"),
+            "DESCRIPTION": frame[description_column].astype(object) if description_column else None,
+            # Merged multi-file imports say which statement each row came from
+            "SOURCE": frame["FILE"].astype(object) if "FILE" in frame.columns else source,
+        })
+        store = self.store
+        with store._lock:
+            count = "SELECT count(*) FROM transactions WHERE OWNER = ?"
+            before = store._connection.execute(count, [self.owner]).fetchone()[0]
+            store._connection.register("incoming", incoming)
+            try:
+                store._connection.execute(
+                    """
+                    INSERT INTO transactions (FINGERPRINT, DATE, CATEGORY, PRICE, DESCRIPTION, SOURCE, OWNER)
+                    SELECT FINGERPRINT, CAST(DATE AS DATE), CATEGORY, PRICE, DESCRIPTION, SOURCE, ?
+                    FROM incoming
+                    WHERE FINGERPRINT NOT IN (SELECT FINGERPRINT FROM transactions WHERE OWNER = ?)
+                    """,
+                    [self.owner, self.owner],
+                )
+            finally:
+                store._connection.unregister("incoming")
+            after = store._connection.execute(count, [self.owner]).fetchone()[0]
+        return after - before
+
+    def __len__(self):
+        return self.store._query("SELECT count(*) FROM transactions WHERE OWNER = ?", [self.owner])[0][0]
+
+    @property
+    def categories(self):
+        rows = self.store._query("SELECT DISTINCT CATEGORY FROM transactions "
+                                 "WHERE OWNER = ? AND CATEGORY IS NOT NULL ORDER BY CATEGORY", [self.owner])
+        return [row[0] for row in rows]
+
+    @property
+    def min_date(self):
+        value = self.store._query("SELECT min(DATE) FROM transactions WHERE OWNER = ?", [self.owner])[0][0]
+        return value if value is not None else date.today()
+
+    @property
+    def max_date(self):
+        value = self.store._query("SELECT max(DATE) FROM transactions WHERE OWNER = ?", [self.owner])[0][0]
+        return value if value is not None else date.today()
+
+    def _where(self, start_date, end_date, categories):
+        clause = "OWNER = ? AND DATE BETWEEN ? AND ? AND PRICE IS NOT NULL"
+        parameters = [self.owner, start_date, end_date]
+        if categories:
+            clause += " AND CATEGORY IN (" + ", ".join("?" * len(categories)) + ")"
+            parameters += list(categories)
+        return clause, parameters
+
+    def summarize(self, start_date, end_date, categories=None):
+        """SpendSummary for a date range, computed inside DuckDB."""
+        where, parameters = self._where(start_date, end_date, categories)
+        count, total, median, minimum, maximum = self.store._query(
+            "SELECT count(*), " + SUM_PRICE + ", median(PRICE), min(PRICE), max(PRICE) "
+            "FROM transactions WHERE " + where,
+            parameters,
+        )[0]
+        if count == 0:
+            empty = pd.Series([], index=pd.Index([], name="CATEGORY", dtype=object),
+                              name="PRICE", dtype="float64")
+            return SpendSummary(0, SpendMetrics(0.0, float("nan"), float("nan"), float("nan")), empty)
+
+        totals = self.store._query_frame(
+            "SELECT CATEGORY, " + SUM_PRICE + " AS PRICE FROM transactions WHERE " + where +
+            " GROUP BY CATEGORY ORDER BY CATEGORY",
+            parameters,
+        )
+        category_totals = totals.set_index("CATEGORY")["PRICE"]
+        return SpendSummary(count, SpendMetrics(total, median, minimum, maximum), category_totals)
+
+    def spending_over_time(self, start_date, end_date, categories=None, granularity=None):
+        """Total spend per day, week or month, grouped inside DuckDB."""
+        granularity = granularity or choose_granularity(start_date, end_date)
+        where, parameters = self._where(start_date, end_date, categories)
+        totals = self.store._query_frame(
+            "SELECT CAST(date_trunc('" + granularity + "', DATE) AS DATE) AS BUCKET, " + SUM_PRICE + " AS PRICE "
+            "FROM transactions WHERE " + where + " GROUP BY BUCKET ORDER BY BUCKET",
+            parameters,
+        )
+        return spending_series(totals["BUCKET"].to_numpy(dtype="datetime64[D]"), totals["PRICE"],
+                               start_date, end_date, granularity)
+
+    def recurring_charges(self):
+        """Table of recurring charges over this owner's rows, rescanned only after new rows are added."""
+        from recurring import find_recurring
+
+        rows = len(self)
+        cached = self.store._recurring.get(self.owner)
+        if cached is None or cached[0] != rows:
+            frame = self.store._query_frame(
+                "SELECT DATE, DESCRIPTION, CATEGORY, PRICE FROM transactions WHERE OWNER = ?", [self.owner])
+            cached = (rows, find_recurring(frame["DATE"].to_numpy(), frame["DESCRIPTION"].to_numpy(),
+                                           frame["PRICE"].to_numpy(), frame["CATEGORY"].to_numpy()))
+            self.store._recurring[self.owner] = cached
+        return cached[1]
+
+    def fetch(self, start_date=None, end_date=None, categories=None):
+        """Stored rows as a DataFrame, optionally filtered, ordered by date."""
+        start_date = start_date or date.min
+        end_date = end_date or date.max
+        where, parameters = self._where(start_date, end_date, categories)
+        return self.store._query_frame(
+            "SELECT DATE, CATEGORY, PRICE, DESCRIPTION, SOURCE FROM transactions WHERE " + where +
+            " ORDER BY DATE",
+            parameters,
+        )
+
+    def export_parquet(self, path):
+        """Write this owner's rows to a Parquet file."""
+        quoted = "'" + str(path).replace("'", "''") + "'"
+        # COPY takes no parameters; the owner is quoted the same way as the path
+        owner = "'" + self.owner.replace("'", "''") + "'"
+        with self.store._lock:
+            self.store._connection.execute(
+                "COPY (SELECT * EXCLUDE (OWNER) FROM transactions WHERE OWNER = " + owner +
+                " ORDER BY DATE) TO " + quoted + " (FORMAT PARQUET)"
+            )
+
+
+# Process-wide store, opened on first use
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The shared TransactionStore, or None when POCKETBOOK_STORE_PATH is unset."""
+    global _store
+    path = get_settings().store_path
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = TransactionStore(path)
+        return _store
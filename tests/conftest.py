@@ -0,0 +1,26 @@
+# The app's modules live at the repository root rather than in a package.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import TransactionDataset  # noqa: E402
+from benchmarks.ledger import make_ledger  # noqa: E402
+
+
+def csv_bytes(*lines):
+    return ("\n".join(lines) + "\n").encode()
+
+
+@pytest.fixture(scope="session")
+def ledger():
+    """A seeded 20k-row ledger as the pages would load it."""
+    return make_ledger(20_000, seed=7, years=3)
+
+
+@pytest.fixture(scope="session")
+def dataset(ledger):
+    return TransactionDataset.from_frame(ledger)
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+from alerts import AlertEngine, load_budgets
+from sheets_sync import SheetSnapshot
+
+COFFEE = [3.5, 4.0, 4.5, 4.0, 3.8, 4.2, 4.1, 3.9]
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=["DATE", "DESCRIPTION", "CATEGORY", "PRICE"])
+
+
+HISTORY = _frame([("2024-01-{:02d}".format(day), "BLUE BOTTLE COFFEE #{}".format(day), "DINING", price)
+                  for day, price in enumerate(COFFEE, start=1)]
+                 + [("2024-01-10", "RENT", "HOUSING", 1900.0)])
+
+MARCH = _frame([("2024-03-02", "BLUE BOTTLE COFFEE #12", "DINING", 40.0),
+                ("2024-03-03", "BLUE BOTTLE COFFEE #12", "DINING", 4.0),
+                ("2024-03-04", "NEW CAFE", "DINING", 45.0)])
+
+
+def _snapshot(data, version, previous_version=None, appended=None):
+    return SheetSnapshot("sheet", data, 0.0, version, False, None, previous_version, appended, len(data))
+
+
+@pytest.fixture
+def engine():
+    engine = AlertEngine()
+    assert engine.sync(_snapshot(HISTORY, 1)) == 0
+    return engine
+
+
+def test_appended_charges_are_checked_against_earlier_history(engine):
+    assert engine.sync(_snapshot(pd.concat([HISTORY, MARCH], ignore_index=True), 2, 1, len(MARCH))) == 2
+    assert engine.rows_seen == len(HISTORY) + len(MARCH)
+    alerts = engine.recent_alerts()
+    # Newest first; a merchant without history is compared with its category
+    assert alerts["DESCRIPTION"].tolist() == ["NEW CAFE", "BLUE BOTTLE COFFEE #12"]
+    assert alerts["COMPARED_TO"].tolist() == ["category", "merchant"]
+    assert alerts["TYPICAL"].iloc[1] == pytest.approx(sum(COFFEE) / len(COFFEE))
+
+
+def test_the_same_version_is_not_read_twice(engine):
+    assert engine.sync(_snapshot(HISTORY, 1)) == 0
+    assert engine.rows_seen == len(HISTORY)
+
+
+def test_changed_rows_start_the_engine_over(engine):
+    engine.sync(_snapshot(pd.concat([HISTORY, MARCH], ignore_index=True), 2, 1, len(MARCH)))
+    engine.sync(_snapshot(HISTORY, 3, 2, None))
+    assert engine.rows_seen == len(HISTORY)
+    assert engine.recent_alerts().empty
+    assert engine.latest_month == pd.Timestamp("2024-01-01")
+
+
+def test_budgets_use_the_latest_month(engine):
+    engine.sync(_snapshot(pd.concat([HISTORY, MARCH], ignore_index=True), 2, 1, len(MARCH)))
+    assert engine.month_to_date() == {"DINING": 89.0}
+    status = engine.budget_status({"HOUSING": 1000.0, "DINING": 100.0, "TRAVEL": None, "FUN": 80.0})
+    # Categories without a budget are left out; ties keep the order they were given in
+    assert status["CATEGORY"].tolist() == ["DINING", "HOUSING", "FUN"]
+    assert status["STATUS"].tolist() == ["Nearly spent", "On track", "On track"]
+    assert status["USED"].iloc[0] == pytest.approx(0.89)
+
+
+def test_budgets_file_needs_category_and_budget(tmp_path):
+    path = tmp_path / "budgets.csv"
+    path.write_text("category,budget\nDINING,300\nTRAVEL,\n")
+    assert load_budgets(path) == {"DINING": 300.0}
+    path.write_text("category,limit\nDINING,300\n")
+    with pytest.raises(ValueError, match="BUDGET"):
+        load_budgets(path)
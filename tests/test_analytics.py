@@ -0,0 +1,11 @@
+import numpy as np
+
+from analytics import to_cents
+
+
+def test_each_price_is_rounded_to_the_cent_before_summing():
+    assert to_cents([0.333, 0.333, 0.333]).sum() == 99
+
+
+def test_halves_round_away_from_zero():
+    assert to_cents([0.005, -0.005, 0.125, -0.125, 2.675, np.nan]).tolist() == [1, -1, 13, -13, 268, 0]
@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import contextvars
+import sys
+import types
+
+import pytest
+
+import startup
+from assistant import AGENT_ENGINE, SQL_ENGINE, AnswerCache, Assistant, run_batch
+from fake_llm import FakeAgent, FakeChatModel, TransientLLMError
+from instrumentation import current_trace, start_trace
+from text_to_sql import QueryError
+
+# Questions the local intent parser leaves to the model
+QUESTIONS = ["Write me a poem about my budget", "Should I budget less for travel?",
+             "Why is my budget so tight?"]
+
+# Stands in for LangChain's OpenAI callback: the handler of the innermost usage block
+_usage = contextvars.ContextVar("usage", default=None)
+
+
+class Usage:
+    prompt_tokens = completion_tokens = total_tokens = 0
+    total_cost = 0.0
+
+
+@contextlib.contextmanager
+def get_openai_callback():
+    callback = Usage()
+    token = _usage.set(callback)
+    try:
+        yield callback
+    finally:
+        _usage.reset(token)
+
+
+def _count_call():
+    callback = _usage.get()
+    if callback is not None:
+        callback.prompt_tokens += 7
+        callback.completion_tokens += 3
+        callback.total_tokens += 10
+
+
+class CountingChat(FakeChatModel):
+    def _text(self, prompt):
+        _count_call()
+        return super()._text(prompt)
+
+
+class CountingAgent(FakeAgent):
+    def _output(self, question):
+        _count_call()
+        return super()._output(question)
+
+
+@pytest.fixture
+def usage(monkeypatch):
+    """Instrumentation on, with token counts reported through get_openai_callback()."""
+    monkeypatch.setattr(startup, "_settings", startup.get_settings()._replace(instrument=True))
+    callbacks = types.ModuleType("langchain_community.callbacks")
+    callbacks.get_openai_callback = get_openai_callback
+    monkeypatch.setitem(sys.modules, "langchain_community", types.ModuleType("langchain_community"))
+    monkeypatch.setitem(sys.modules, "langchain_community.callbacks", callbacks)
+    start_trace("test")
+
+
+def make_assistant(dataset, chat=None, agent=None):
+    return Assistant(dataset, None, AnswerCache(),
+                     chat=chat or FakeChatModel(latency=0, token_delay=0),
+                     agent=agent or FakeAgent(step_latency=0, token_delay=0))
+
+
+def counted_tokens():
+    return sum(span.fields.get("total_tokens", 0) for span in current_trace())
+
+
+@pytest.mark.parametrize("engine", [SQL_ENGINE, AGENT_ENGINE])
+@pytest.mark.parametrize("call", [
+    lambda assistant, engine: assistant.ask(QUESTIONS[0], engine),
+    lambda assistant, engine: asyncio.run(assistant.aask(QUESTIONS[0], engine)),
+    lambda assistant, engine: list(assistant.stream(QUESTIONS[0], engine)),
+    lambda assistant, engine: run_batch(assistant, QUESTIONS, engine=engine),
+], ids=["ask", "aask", "stream", "batch"])
+def test_model_calls_are_counted(dataset, usage, engine, call):
+    assistant = make_assistant(dataset, CountingChat(latency=0, token_delay=0),
+                               CountingAgent(step_latency=0, token_delay=0))
+    call(assistant, engine)
+    calls = assistant.chat.calls if engine == SQL_ENGINE else assistant.agent.calls
+    assert calls > 0
+    assert counted_tokens() == 10 * calls
+
+
+def test_batch_retries_transient_errors(dataset):
+    assistant = make_assistant(dataset, chat=FakeChatModel(latency=0, token_delay=0, failures=2))
+    result, = run_batch(assistant, QUESTIONS[:1], engine=SQL_ENGINE, backoff=0)
+    assert result.error is None and result.attempts == 3
+    assert result.answer.source == "sql"
+
+
+def test_batch_reports_errors_once_attempts_run_out(dataset):
+    assistant = make_assistant(dataset, chat=FakeChatModel(latency=0, token_delay=0, failures=5))
+    result, = run_batch(assistant, QUESTIONS[:1], engine=SQL_ENGINE, attempts=2, backoff=0)
+    assert isinstance(result.error, TransientLLMError) and result.attempts == 2
+
+
+def test_batch_does_not_retry_other_errors(dataset):
+    assistant = make_assistant(dataset, chat=FakeChatModel("SELECT nope FROM transactions", latency=0))
+    results = run_batch(assistant, QUESTIONS, engine=SQL_ENGINE, backoff=0)
+    assert [type(result.error) for result in results] == [QueryError] * len(QUESTIONS)
+    assert [result.attempts for result in results] == [1] * len(QUESTIONS)
+    assert assistant.chat.calls == len(QUESTIONS)
+
+
+def test_batch_keeps_question_order(dataset):
+    finished = []
+    results = run_batch(make_assistant(dataset), QUESTIONS, on_result=lambda index, result: finished.append(index))
+    assert [result.question for result in results] == QUESTIONS
+    assert sorted(finished) == [0, 1, 2]
+
+
+def test_sql_stream_yields_tokens_then_the_answer(dataset):
+    events = list(make_assistant(dataset).stream(QUESTIONS[0], SQL_ENGINE))
+    kinds = [kind for kind, _ in events]
+    assert kinds[-1] == "answer" and set(kinds[:-1]) == {"token"}
+    answer = events[-1][1]
+    assert "".join(value for kind, value in events[:-1]) == answer.sql == "SELECT count(*) FROM transactions"
+    assert answer.text == "{:,}".format(len(dataset))
+
+
+def test_agent_stream_yields_steps_then_the_answer(dataset):
+    assistant = make_assistant(dataset, agent=FakeAgent(answer="Plenty.", steps=2, step_latency=0, token_delay=0))
+    events = list(assistant.stream(QUESTIONS[0]))
+    kinds = [kind for kind, _ in events]
+    assert kinds[:4] == ["step", "observation", "step", "observation"]
+    assert kinds[-1] == "answer" and events[-1][1].text == "Plenty."
+    # Asked again, the answer comes from the cache without calling the agent
+    (kind, answer), = assistant.stream(QUESTIONS[0])
+    assert (kind, answer.text, answer.source) == ("answer", "Plenty.", "cache")
+    assert assistant.agent.calls == 1
@@ -0,0 +1,60 @@
+import json
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from batch_report import ledger_files, run_batch_reports
+from conftest import csv_bytes
+
+HEADER = "DATE,DESCRIPTION,CATEGORY,PRICE"
+
+
+@pytest.fixture
+def ledgers(tmp_path):
+    directory = tmp_path / "ledgers"
+    directory.mkdir()
+    (directory / "a.csv").write_bytes(csv_bytes(HEADER, "2024-01-02,A,DINING,10.25", "2024-02-03,B,TRAVEL,200",
+                                                "2024-03-04,C,DINING,4.75"))
+    (directory / "b.csv").write_bytes(csv_bytes(HEADER, "2024-01-15,D,DINING,30", "2024-01-16,E,RENT,1500",
+                                                "not a date,F,DINING,1"))
+    (directory / "broken.csv").write_bytes(csv_bytes("WHEN,AMOUNT", "2024-01-01,5"))
+    (directory / "notes.txt").write_text("not a ledger")
+    return directory
+
+
+def test_only_supported_ledgers_are_listed(ledgers):
+    assert [path.rsplit("/", 1)[-1] for path in ledger_files(str(ledgers))] == ["a.csv", "b.csv", "broken.csv"]
+
+
+def test_reports_cover_every_ledger(ledgers, tmp_path):
+    output = tmp_path / "reports"
+    finished = []
+    summary = run_batch_reports(str(ledgers), str(output), workers=1, on_report=finished.append)
+    assert sorted(report["file"] for report in finished) == ["a.csv", "b.csv", "broken.csv"]
+
+    a, b, broken = summary["files"]
+    assert a["metrics"] == {"min": 4.75, "median": 10.25, "max": 200.0, "total": 215.0}
+    assert b["bad_rows"] == 1 and b["transactions"] == 2
+    assert broken["error"] and "metrics" not in broken
+    assert summary["throughput"]["failed"] == 1 and summary["throughput"]["rows"] == 5
+    combined = summary["combined"]
+    assert combined["transactions"] == 5 and combined["metrics"]["total"] == 1745.0
+    assert combined["category_totals"] == {"RENT": 1500.0, "TRAVEL": 200.0, "DINING": 45.0}
+
+    assert json.loads((output / "summary.json").read_text())["combined"] == combined
+    table = pd.read_csv(output / "summary.csv")
+    assert table["FILE"].tolist() == ["a.csv", "b.csv", "broken.csv"]
+    assert table["ERROR"].notna().tolist() == [False, False, True]
+    for name in ["a.csv.json", "a.csv.categories.csv", "a.csv.png", "broken.csv.json"]:
+        assert (output / "files" / name).exists()
+    assert (output / "categories.png").exists()
+
+
+def test_date_range_and_categories_filter_every_ledger(ledgers, tmp_path):
+    summary = run_batch_reports(str(ledgers), str(tmp_path / "reports"), start_date=date(2024, 1, 1),
+                                end_date=date(2024, 1, 31), categories=["DINING"], workers=1, charts=False)
+    assert [report.get("transactions") for report in summary["files"]] == [1, 1, None]
+    assert summary["combined"]["metrics"]["total"] == 40.25
+    assert summary["combined"]["start"] == "2024-01-01" and summary["combined"]["categories"] == ["DINING"]
+    assert not (tmp_path / "reports" / "categories.png").exists()
@@ -0,0 +1,48 @@
+import pytest
+
+from categorize import DEFAULT_RULES, Categorizer, Rule
+
+
+@pytest.fixture
+def categorizer():
+    return Categorizer(DEFAULT_RULES)
+
+
+@pytest.mark.parametrize("description, category", [
+    ("WHOLE FOODS #123", "GROCERIES"),
+    ("UBER EATS 8805", "DINING"),
+    ("UBER TRIP 1234", "TRANSIT"),
+    ("DELTA AIR 0062345", "TRAVEL"),
+    ("JOE'S BAR & GRILL", "NIGHTLIFE"),
+    ("COSTCO CLUB RENEWAL", "GROCERIES"),
+])
+def test_default_rules(categorizer, description, category):
+    assert categorizer.categorize([description]).tolist() == [category]
+
+
+@pytest.mark.parametrize("description", [
+    "BARBER SHOP", "BARNES & NOBLE", "DELTA DENTAL", "STEAM CARPET CLEANING", "SOUTHWEST GAS",
+    "BOOK CLUB DUES", "TARGET OPTICAL",
+])
+def test_ambiguous_names_stay_uncategorized(categorizer, description):
+    assert categorizer.categorize([description]).tolist() == [None]
+
+
+def test_merchant_rules_win_over_keywords():
+    categorizer = Categorizer([Rule("market", "GROCERIES", "keyword"), Rule("stock", "INVESTING", "merchant")])
+    assert categorizer.categorize(["STOCK MARKET APP", "CORNER MARKET"]).tolist() == ["INVESTING", "GROCERIES"]
+
+
+def test_learned_labels_apply_to_earlier_misses(categorizer):
+    assert categorizer.categorize(["LOCAL PLACE 42"]).tolist() == [None]
+    layered = categorizer.with_labels({"LOCAL PLACE 42": "DINING"})
+    assert layered.categorize(["LOCAL PLACE 42", "WHOLE FOODS #9"]).tolist() == ["DINING", "GROCERIES"]
+
+
+def test_learned_labels_leave_the_shared_rules_alone(categorizer):
+    first = categorizer.with_labels({"LOCAL PLACE 42": "DINING"})
+    second = categorizer.with_labels({"LOCAL PLACE 42": "NIGHTLIFE"})
+    assert first.categorize(["LOCAL PLACE 42"]).tolist() == ["DINING"]
+    assert second.categorize(["LOCAL PLACE 42"]).tolist() == ["NIGHTLIFE"]
+    assert categorizer.categorize(["LOCAL PLACE 42"]).tolist() == [None]
+    assert categorizer.learned == {}
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+from conftest import csv_bytes
+from ingest import ingest_transactions
+
+HEADER = "DATE,DESCRIPTION,CATEGORY,PRICE"
+
+
+def test_padded_dates_load():
+    result = ingest_transactions(csv_bytes(HEADER, " 2024-01-02 ,A,FOOD,1", "  2024-01-03,B,FOOD,2"), "x.csv")
+    assert result.bad_row_count == 0
+    assert list(result.dataset.frame["DATE"]) == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
+
+
+def test_dates_outside_the_inferred_format_fall_back_to_pandas():
+    result = ingest_transactions(csv_bytes(
+        HEADER,
+        "2024-01-02,A,FOOD,1",
+        "2024-01-03 10:30:00,B,FOOD,2",
+        "01/04/2024,C,FOOD,3",
+        "2024-01-05,D,FOOD,4",
+        "not a date,E,FOOD,5",
+    ), "x.csv")
+    assert result.date_format == "%Y-%m-%d"
+    assert list(result.dataset.frame["DATE"].dt.day) == [2, 3, 4, 5]
+    assert result.bad_row_count == 1
+    assert result.bad_rows["REASON"].tolist() == ["invalid DATE"]
+    assert result.bad_rows["LINE"].tolist() == [6]
+
+
+def test_bad_prices_are_reported_not_fatal():
+    result = ingest_transactions(csv_bytes(HEADER, '2024-01-02,A,FOOD,"$1,200.50"', "2024-01-03,B,FOOD,n/a"),
+                                 "x.csv")
+    assert result.dataset.frame["PRICE"].tolist() == [1200.5]
+    assert result.bad_rows["REASON"].tolist() == ["invalid PRICE"]
+
+
+@pytest.mark.parametrize("header", ["DATE,DATE,CATEGORY,PRICE", "DATE,DESCRIPTION,CATEGORY,PRICE,PRICE"])
+def test_duplicate_header_raises_value_error(header):
+    with pytest.raises(ValueError, match="more than once"):
+        ingest_transactions(csv_bytes(header, "2024-01-02,A,FOOD,1,2"), "x.csv")
+
+
+def test_missing_columns_raise_value_error():
+    with pytest.raises(ValueError, match="PRICE"):
+        ingest_transactions(csv_bytes("DATE,CATEGORY", "2024-01-02,FOOD"), "x.csv")
+
+
+def test_trailing_comma_in_header_loads_every_row():
+    result = ingest_transactions(csv_bytes(HEADER + ",", "2024-01-02,A,FOOD,1,", "2024-01-03,B,FOOD,2"), "x.csv")
+    assert result.bad_row_count == 0
+    assert result.dataset.frame["PRICE"].tolist() == [1.0, 2.0]
+
+
+def test_short_rows_are_padded_not_dropped():
+    result = ingest_transactions(csv_bytes("DATE,PRICE,DESCRIPTION,CATEGORY", "2024-01-02,1,A,FOOD",
+                                           "2024-01-03,2,B", "2024-01-04"), "x.csv")
+    assert result.rows_read == 3
+    assert result.dataset.frame["PRICE"].tolist() == [1.0, 2.0]
+    assert result.dataset.frame["CATEGORY"].tolist() == ["FOOD", "Uncategorized"]
+    assert result.bad_rows["REASON"].tolist() == ["invalid PRICE"]
+    assert result.bad_rows["LINE"].tolist() == [4]
@@ -0,0 +1,70 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from analytics import TransactionDataset
+from intents import answer_question, parse_question
+
+CATEGORIES = ["DINING", "GROCERIES", "EATING OUT", "TRAVEL"]
+TODAY = date(2024, 3, 15)
+
+
+@pytest.mark.parametrize("question, aggregation, categories, start, end, top_n, group_by", [
+    ("How much did I spend last month?", "sum", [], date(2024, 2, 1), date(2024, 2, 29), None, None),
+    ("How much did I spend on dining in January?", "sum", ["DINING"], date(2024, 1, 1), date(2024, 1, 31),
+     None, None),
+    ("What were my top 3 categories last month?", "sum", [], date(2024, 2, 1), date(2024, 2, 29), 3, "category"),
+    ("How many transactions did I have this year?", "count", [], date(2024, 1, 1), TODAY, None, None),
+    ("What was my biggest purchase?", "top", [], None, None, 1, None),
+    ("Average eating out spend last month", "mean", ["EATING OUT"], date(2024, 2, 1), date(2024, 2, 29),
+     None, None),
+    ("Monthly spending on groceries", "sum", ["GROCERIES"], None, None, None, "month"),
+    ("Which category did I spend the least on last month?", "sum", [], date(2024, 2, 1), date(2024, 2, 29),
+     1, "category"),
+    ("What was my smallest purchase?", "bottom", [], None, None, 1, None),
+])
+def test_routine_questions_are_parsed(question, aggregation, categories, start, end, top_n, group_by):
+    intent = parse_question(question, CATEGORIES, today=TODAY, latest=TODAY)
+    assert intent is not None
+    assert intent.aggregation == aggregation
+    assert intent.categories == categories
+    assert (intent.start_date, intent.end_date) == (start, end)
+    assert intent.top_n == top_n
+    assert intent.group_by == group_by
+
+
+@pytest.mark.parametrize("question", [
+    "Why did my spending go up?",
+    "How does last month's spending compare to the month before?",
+    "Which merchants did I spend the most at last month?",
+    "Write me a poem about my budget",
+    "Median spending by category",
+    "How many transactions per month?",
+])
+def test_other_questions_go_to_the_model(question):
+    assert parse_question(question, CATEGORIES, today=TODAY, latest=TODAY) is None
+
+
+def test_answers_match_the_data():
+    dataset = TransactionDataset.from_frame(pd.DataFrame({
+        "DATE": ["2024-02-01", "2024-02-10", "2024-02-20", "2024-03-01"],
+        "DESCRIPTION": ["A", "B", "C", "D"],
+        "CATEGORY": ["DINING", "DINING", "TRAVEL", "DINING"],
+        "PRICE": [10.10, 20.20, 300.0, 5.0],
+    }))
+    assert "**$330.30**" in answer_question("How much did I spend last month?", dataset, today=TODAY).text
+    assert "**$30.30**" in answer_question("How much did I spend on dining last month?", dataset,
+                                           today=TODAY).text
+    assert "**2 transactions**" in answer_question("How many dining transactions last month?", dataset,
+                                                   today=TODAY).text
+    top = answer_question("What was my top category last month?", dataset, today=TODAY)
+    assert top.table.index.tolist() == ["TRAVEL"]
+    lowest = answer_question("Which category did I spend the least on last month?", dataset, today=TODAY)
+    assert lowest.text.startswith("Lowest category by spending")
+    assert lowest.table.index.tolist() == ["DINING"]
+    counts = answer_question("How many transactions per category last month?", dataset, today=TODAY)
+    assert counts.text.startswith("Transactions by category")
+    assert counts.table["Transactions"].tolist() == [2, 1]
+    average = answer_question("Average spending by category last month", dataset, today=TODAY)
+    assert average.text.startswith("Average transaction by category")
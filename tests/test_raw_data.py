@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import TransactionDataset
+
+
+@pytest.fixture
+def view():
+    return TransactionDataset.from_frame(pd.DataFrame({
+        "DATE": ["2024-01-03", "2024-01-01", "2024-01-02", "2024-01-05", "2024-01-04"],
+        "DESCRIPTION": ["Whole Foods", "Blue Bottle", None, "whole foods market", "Uber"],
+        "CATEGORY": ["GROCERIES", "DINING", "DINING", "GROCERIES", "TRANSIT"],
+        "PRICE": [80.0, 4.5, np.nan, 120.0, 18.0],
+    })).raw_view
+
+
+def _descriptions(view, positions):
+    return view.dataset.frame["DESCRIPTION"].iloc[positions].tolist()
+
+
+def test_search_matches_descriptions_and_categories_ignoring_case(view):
+    assert _descriptions(view, view.query("WHOLE FOODS")) == ["Whole Foods", "whole foods market"]
+    assert _descriptions(view, view.query("transit")) == ["Uber"]
+    assert len(view.query("")) == 5
+
+
+def test_filters_combine_with_search(view):
+    dining = _descriptions(view, view.query("", ["DINING"]))
+    assert dining[0] == "Blue Bottle" and pd.isna(dining[1])
+    assert len(view.query("uber", ["DINING"])) == 0
+
+
+@pytest.mark.parametrize("ascending, prices", [
+    (True, [4.5, 18.0, 80.0, 120.0]),
+    (False, [120.0, 80.0, 18.0, 4.5]),
+])
+def test_missing_values_sort_last_either_way(view, ascending, prices):
+    ordered = view.dataset.frame["PRICE"].iloc[view.query(sort_by="PRICE", ascending=ascending)].tolist()
+    assert ordered[:4] == prices and np.isnan(ordered[4])
+    descriptions = _descriptions(view, view.query(sort_by="DESCRIPTION", ascending=ascending))
+    assert pd.isna(descriptions[-1])
+
+
+def test_pages_are_slices_of_the_result(view):
+    positions = view.query(sort_by="DATE")
+    assert view.query(sort_by="DATE") is positions
+    pages = [view.page(positions, page, 2) for page in (1, 2, 3)]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert pd.concat(pages)["DATE"].is_monotonic_increasing
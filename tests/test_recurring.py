@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from recurring import RECURRING_COLUMNS, find_recurring
+
+
+def _ledger(charges):
+    """(dates, descriptions, prices, categories) from (date, description, price, category) tuples."""
+    dates, descriptions, prices, categories = zip(*charges)
+    return (np.array(dates, dtype="datetime64[D]"), np.array(descriptions, dtype=object),
+            np.array(prices, dtype=np.float64), np.array(categories, dtype=object))
+
+
+def _monthly(description, amount, months, day=5, category="ENTERTAINMENT"):
+    return [(str(pd.Timestamp(2024, month, day).date()), "{} {:04d}".format(description, month), amount, category)
+            for month in months]
+
+
+def _weekly(description, amount, weeks, category="FITNESS"):
+    start = pd.Timestamp("2024-01-01")
+    return [(str((start + pd.Timedelta(weeks=week)).date()), description, amount, category) for week in range(weeks)]
+
+
+def test_subscriptions_are_found_with_their_cadence():
+    table = find_recurring(*_ledger(_monthly("NETFLIX", 15.49, range(1, 13))
+                                    + _weekly("YOGA CLASS", 20.0, 52)
+                                    + [("2024-03-10", "HARDWARE STORE", 63.0, "HOME"),
+                                       ("2024-07-22", "HARDWARE STORE", 12.5, "HOME")]))
+    assert list(table.columns) == RECURRING_COLUMNS
+    # Most expensive per year first
+    assert table["CADENCE"].tolist() == ["Weekly", "Monthly"]
+    assert table["ANNUAL_COST"].tolist() == [20.0 * 52, 15.49 * 12]
+    netflix = table.iloc[1]
+    assert netflix["CHARGES"] == 12 and netflix["CATEGORY"] == "ENTERTAINMENT"
+    # Monthly charges fall due on the same day of the next month
+    assert netflix["NEXT_DATE"] == pd.Timestamp("2025-01-05")
+
+
+def test_price_changes_beyond_the_band_split_a_merchant():
+    table = find_recurring(*_ledger(_monthly("SPOTIFY", 10.99, range(1, 7)) + _monthly("SPOTIFY", 16.99, range(7, 13))))
+    assert table["AMOUNT"].tolist() == [16.99]
+    assert table["FIRST_DATE"].tolist() == [pd.Timestamp("2024-07-05")]
+
+
+def test_ended_charges_are_left_out_unless_asked_for():
+    ledger = _ledger(_monthly("GYM", 40.0, range(1, 6)) + _weekly("COFFEE CLUB", 5.0, 52, category="DINING"))
+    assert find_recurring(*ledger)["MERCHANT"].tolist() == ["COFFEE CLUB"]
+    ended = find_recurring(*ledger, include_ended=True)
+    assert set(ended["MERCHANT"]) == {"COFFEE CLUB", "GYM 0005"}
+
+
+def test_irregular_and_unusable_rows_find_nothing():
+    dates = np.array(["2024-01-01", "2024-01-09", "2024-02-20", "NaT"], dtype="datetime64[D]")
+    assert find_recurring(dates, np.array(["SHOP"] * 4, dtype=object), np.array([5.0, 5.0, 5.0, 5.0])).empty
+    assert find_recurring(dates[:0], np.array([], dtype=object), np.array([])).empty
+    assert find_recurring(dates[:3], np.array([None, "", "!!"], dtype=object), np.array([9.0, 9.0, 9.0])).empty
@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+from analytics import TransactionDataset
+from registry import DatasetRegistry
+
+
+def _dataset(rows=100):
+    return TransactionDataset.from_frame(pd.DataFrame({
+        "DATE": pd.date_range("2024-01-01", periods=rows), "DESCRIPTION": "X", "CATEGORY": "A",
+        "PRICE": 1.0}))
+
+
+def test_one_load_per_version():
+    registry = DatasetRegistry(64 * 1024 * 1024)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return _dataset()
+
+    first = registry.get_or_load("sheet", 1, loader)
+    assert registry.get_or_load("sheet", 1, loader) is first
+    assert len(loads) == 1
+    assert registry.stats()["hits"] == 1
+
+
+def test_a_new_version_replaces_the_old_one():
+    registry = DatasetRegistry(64 * 1024 * 1024)
+    old = registry.get_or_load("sheet", 1, _dataset)
+    new = registry.get_or_load("sheet", 2, _dataset)
+    assert len(registry) == 1
+    assert registry.holds(new) and not registry.holds(old)
+    assert registry.stats()["bytes"] == new.nbytes
+
+
+def test_the_rollup_counts_toward_the_budget():
+    registry = DatasetRegistry(64 * 1024 * 1024)
+    dataset = registry.get_or_load("sheet", 1, _dataset)
+    unsummarized = _dataset()
+    assert registry.stats()["bytes"] == dataset.nbytes > unsummarized.nbytes
+    assert dataset.nbytes == unsummarized.nbytes + unsummarized.rollup.nbytes
+
+
+def test_a_late_old_version_does_not_replace_a_newer_one():
+    registry = DatasetRegistry(64 * 1024 * 1024)
+    new = registry.get_or_load("sheet", 2, _dataset)
+    late = registry.get_or_load("sheet", 1, _dataset)
+    assert registry.holds(new) and not registry.holds(late)
+
+
+def test_registered_datasets_are_read_only():
+    dataset = DatasetRegistry(64 * 1024 * 1024).get_or_load("sheet", 1, _dataset)
+    with pytest.raises(ValueError):
+        dataset.prices[0] = 2.0
+
+
+def test_least_recently_used_sources_are_evicted_over_budget():
+    size = DatasetRegistry(64 * 1024 * 1024).get_or_load("a", 1, _dataset).nbytes
+    registry = DatasetRegistry(int(size * 2.5))
+    first = registry.get_or_load("a", 1, _dataset)
+    registry.get_or_load("b", 1, _dataset)
+    registry.get_or_load("a", 1, _dataset)
+    registry.get_or_load("c", 1, _dataset)
+    assert len(registry) == 2
+    assert registry.holds(first)
+    assert registry.stats()["evictions"] == 1
+    assert registry.stats()["bytes"] <= registry.max_bytes
+
+
+def test_idle_datasets_are_evicted():
+    registry = DatasetRegistry(64 * 1024 * 1024, idle_seconds=-1)
+    registry.get_or_load("a", 1, _dataset)
+    assert registry.evict_idle() == 1
+    assert len(registry) == 0 and registry.stats()["bytes"] == 0
+
+
+def test_shared_objects_are_made_once_per_registered_dataset():
+    registry = DatasetRegistry(64 * 1024 * 1024)
+    dataset = registry.get_or_load("a", 1, _dataset)
+    made = []
+    first = registry.shared(dataset, "assistant", lambda: made.append(1) or object())
+    assert registry.shared(dataset, "assistant", object) is first
+    assert len(made) == 1
+    assert registry.shared(_dataset(), "assistant", object) is None
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import rollup
+
+
+def _pandas_metrics(frame, start, end, categories):
+    rows = frame[(frame["DATE"] >= pd.Timestamp(start)) & (frame["DATE"] < pd.Timestamp(end + timedelta(days=1)))]
+    if categories:
+        rows = rows[rows["CATEGORY"].isin(categories)]
+    return rows
+
+
+def _ranges(dataset, count, seed=3):
+    rng = np.random.default_rng(seed)
+    days = (dataset.max_date - dataset.min_date).days
+    all_categories = dataset.categories
+    for _ in range(count):
+        first = int(rng.integers(0, days))
+        start = dataset.min_date + timedelta(days=first)
+        end = start + timedelta(days=int(rng.integers(0, days - first + 1)))
+        size = int(rng.integers(0, 4))
+        categories = list(rng.choice(all_categories, size=size, replace=False)) if size else None
+        yield start, end, categories
+
+
+def test_totals_counts_and_extremes_match_pandas(dataset):
+    frame = dataset.frame
+    for start, end, categories in _ranges(dataset, 60):
+        summary = dataset.summarize(start, end, categories)
+        rows = _pandas_metrics(frame, start, end, categories)
+        assert summary.count == len(rows)
+        if not len(rows):
+            continue
+        cents = int(np.round(rows["PRICE"] * 100).astype(np.int64).sum())
+        assert summary.metrics.total == cents / 100
+        assert summary.metrics.min == rows["PRICE"].min()
+        assert summary.metrics.max == rows["PRICE"].max()
+        expected = rows.groupby("CATEGORY", observed=True)["PRICE"].sum()
+        assert summary.category_totals.sort_index().to_numpy() == pytest.approx(
+            expected.sort_index().to_numpy(), abs=0.005)
+
+
+def test_small_selections_get_the_exact_median(dataset):
+    for start, end, categories in _ranges(dataset, 30, seed=5):
+        rows = _pandas_metrics(dataset.frame, start, end, categories)
+        if len(rows):
+            assert dataset.summarize(start, end, categories).metrics.median == rows["PRICE"].median()
+
+
+def test_sketch_median_is_within_the_error_bound(dataset, monkeypatch):
+    monkeypatch.setattr(rollup, "EXACT_MEDIAN_ROWS", 0)
+    for start, end, categories in _ranges(dataset, 30, seed=11):
+        rows = _pandas_metrics(dataset.frame, start, end, categories)
+        if len(rows):
+            median = dataset.summarize(start, end, categories).metrics.median
+            assert median == pytest.approx(rows["PRICE"].median(), rel=rollup.MEDIAN_RELATIVE_ERROR * 1.01)
+
+
+def test_empty_range(dataset):
+    summary = dataset.summarize(date(1990, 1, 1), date(1990, 12, 31))
+    assert summary.count == 0
+    assert summary.metrics.total == 0
+    assert summary.category_totals.empty
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+
+import sections
+from sections import PageSections
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """A fresh session: reruns within a test share it, as they do in the app."""
+    fake = SimpleNamespace(session_state={})
+    monkeypatch.setattr(sections, "st", fake)
+    return fake.session_state
+
+
+def _rerun(data_key, filters, calls):
+    page = PageSections("page")
+    page.provide("data", data_key)
+    result = page.run("dashboard", filters, lambda: calls.append(filters) or len(calls), depends_on=["data"])
+    return page, result
+
+
+def test_unchanged_inputs_reuse_the_result(session):
+    calls = []
+    _rerun("v1", ("2024-01-01",), calls)
+    page, result = _rerun("v1", ("2024-01-01",), calls)
+    assert result == 1 and len(calls) == 1
+    assert page.recomputed == []
+
+
+def test_changed_inputs_recompute(session):
+    calls = []
+    _rerun("v1", ("2024-01-01",), calls)
+    page, result = _rerun("v1", ("2024-02-01",), calls)
+    assert result == 2
+    assert page.recomputed == ["dashboard"]
+
+
+def test_new_data_invalidates_dependent_sections(session):
+    calls = []
+    _rerun("v1", ("2024-01-01",), calls)
+    page, _ = _rerun("v2", ("2024-01-01",), calls)
+    assert len(calls) == 2
+    assert page.recomputed == ["data", "dashboard"]
+
+
+def test_put_results_last_until_inputs_or_data_change(session):
+    page = PageSections("page")
+    page.provide("data", "v1")
+    page.put("ai", ("question",), "answer", depends_on=["data"])
+
+    page = PageSections("page")
+    page.provide("data", "v1")
+    assert page.get("ai", ("question",), depends_on=["data"]) == "answer"
+    assert page.get("ai", ("other question",), depends_on=["data"]) is None
+
+    page = PageSections("page")
+    page.provide("data", "v2")
+    assert page.get("ai", ("question",), depends_on=["data"]) is None
+
+
+def test_discard_forgets_a_result(session):
+    page = PageSections("page")
+    page.provide("data", "v1")
+    page.put("ai", ("question",), "answer", depends_on=["data"])
+    page.discard("ai")
+    assert page.get("ai", ("question",), depends_on=["data"]) is None
+
+
+def test_dependencies_must_run_first(session):
+    with pytest.raises(KeyError):
+        PageSections("page").run("dashboard", (), lambda: None, depends_on=["data"])
+
+
+def test_pages_keep_separate_results(session):
+    PageSections("upload").put("ai", (), "upload answer")
+    assert PageSections("sheet").get("ai", ()) is None
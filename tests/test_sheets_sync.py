@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+
+from sheets_sync import LocalSheetBackend, SheetSync
+
+
+def _rows(start, count):
+    return pd.DataFrame({"DATE": pd.date_range("2024-01-01", periods=count) + pd.Timedelta(days=start),
+                         "DESCRIPTION": ["ROW {}".format(start + index) for index in range(count)],
+                         "CATEGORY": "DINING", "PRICE": [float(start + index) for index in range(count)]})
+
+
+BLANK = pd.DataFrame([[None] * 4], columns=["DATE", "DESCRIPTION", "CATEGORY", "PRICE"])
+
+
+class RecordingBackend(LocalSheetBackend):
+    def __init__(self, sheets):
+        super().__init__(sheets)
+        self.skips = []
+
+    def read(self, spreadsheet, skip_rows=0):
+        self.skips.append(skip_rows)
+        return super().read(spreadsheet, skip_rows)
+
+
+def _sync(sync, backend):
+    """Run one background refresh to completion and return the snapshot it stored."""
+    sync.ttl = -1
+    sync.snapshot("sheet", backend)
+    sync.wait("sheet")
+    sync.ttl = float("inf")
+    return sync.snapshot("sheet", backend)
+
+
+@pytest.fixture
+def sync():
+    return SheetSync(ttl=float("inf"), full_refresh_every=10)
+
+
+def test_first_sync_reads_the_whole_sheet(sync):
+    backend = RecordingBackend({"sheet": _rows(0, 5)})
+    snapshot = sync.snapshot("sheet", backend)
+    assert backend.skips == [0]
+    assert len(snapshot.data) == 5 and snapshot.appended is None and snapshot.previous_version is None
+
+
+def test_incremental_sync_reads_only_appended_rows(sync):
+    backend = RecordingBackend({"sheet": _rows(0, 5)})
+    first = sync.snapshot("sheet", backend)
+    backend.sheets["sheet"] = pd.concat([_rows(0, 5), _rows(5, 2)], ignore_index=True)
+    snapshot = _sync(sync, backend)
+    assert backend.skips[-1] == 5
+    assert snapshot.appended == 2 and snapshot.previous_version == first.version
+    assert snapshot.data["PRICE"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_unchanged_sheet_keeps_its_version(sync):
+    backend = RecordingBackend({"sheet": _rows(0, 5)})
+    first = sync.snapshot("sheet", backend)
+    assert _sync(sync, backend).version == first.version
+
+
+def test_blank_rows_do_not_shift_later_reads(sync):
+    sheet = pd.concat([_rows(0, 3), BLANK, _rows(3, 2)], ignore_index=True)
+    backend = RecordingBackend({"sheet": sheet})
+    snapshot = sync.snapshot("sheet", backend)
+    assert len(snapshot.data) == 5 and snapshot.sheet_rows == 6
+
+    for index in range(3):
+        sheet = pd.concat([sheet, _rows(5 + index, 1)], ignore_index=True)
+        backend.sheets["sheet"] = sheet
+        snapshot = _sync(sync, backend)
+        assert snapshot.appended == 1
+    assert backend.skips[1:] == [6, 7, 8]
+    assert snapshot.data["PRICE"].tolist() == [float(value) for value in range(8)]
+
+
+def test_full_refresh_picks_up_edits(sync):
+    sync.full_refresh_every = 2
+    backend = RecordingBackend({"sheet": _rows(0, 5)})
+    sync.snapshot("sheet", backend)
+    edited = _rows(0, 5)
+    edited.loc[0, "PRICE"] = 99.0
+    backend.sheets["sheet"] = edited
+    snapshot = _sync(sync, backend)
+    assert backend.skips[-1] == 0
+    assert snapshot.appended is None
+    assert snapshot.data["PRICE"].iloc[0] == 99.0
+
+
+def test_full_refresh_that_only_adds_rows_counts_them_as_appended(sync):
+    sync.full_refresh_every = 2
+    backend = RecordingBackend({"sheet": _rows(0, 5)})
+    sync.snapshot("sheet", backend)
+    backend.sheets["sheet"] = pd.concat([_rows(0, 5), _rows(5, 3)], ignore_index=True)
+    snapshot = _sync(sync, backend)
+    assert backend.skips[-1] == 0 and snapshot.appended == 3
+
+
+def test_invalidate_forces_a_full_read(sync):
+    backend = RecordingBackend({"sheet": _rows(0, 5)})
+    sync.snapshot("sheet", backend)
+    sync.invalidate("sheet")
+    sync.snapshot("sheet", backend)
+    assert backend.skips == [0, 0]
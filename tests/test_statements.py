@@ -0,0 +1,40 @@
+from conftest import csv_bytes
+from ingest import IngestionCache, import_statements, ingest_uploads
+
+HEADER = "DATE,DESCRIPTION,CATEGORY,PRICE"
+
+
+def test_import_statements_keeps_overlapping_rows_once():
+    january = csv_bytes(HEADER, "2024-01-02,COFFEE,FOOD,3", "2024-01-02,COFFEE,FOOD,3", "2024-01-30,RENT,HOME,900")
+    overlap = csv_bytes(HEADER, "2024-01-30,RENT,HOME,900", "2024-02-01,COFFEE,FOOD,3")
+    result = import_statements([("jan.csv", january), ("feb.csv", overlap)], parallel=False)
+
+    # Two coffees on one day are separate purchases; the repeated rent row is not
+    assert len(result.dataset) == 4
+    assert result.duplicate_count == 1
+    assert [(report.file_name, report.rows, report.duplicates) for report in result.files] == [
+        ("jan.csv", 3, 0), ("feb.csv", 1, 1)]
+    assert result.dataset.frame["FILE"].tolist() == ["jan.csv", "jan.csv", "jan.csv", "feb.csv"]
+
+
+def test_renamed_upload_is_not_served_with_the_old_names():
+    cache = IngestionCache(64 * 1024 * 1024)
+    first = csv_bytes(HEADER, "2024-01-02,A,FOOD,1")
+    second = csv_bytes(HEADER, "2024-01-03,B,FOOD,2")
+    ingest_uploads([("x.csv", first), ("y.csv", second)], cache=cache)
+
+    reports = []
+    result = ingest_uploads([("renamed1.csv", first), ("renamed2.csv", second)], cache=cache,
+                            on_file=reports.append)
+    assert result.dataset.frame["FILE"].tolist() == ["renamed1.csv", "renamed2.csv"]
+    assert [report.file_name for report in result.files] == ["renamed1.csv", "renamed2.csv"]
+    assert [report.file_name for report in reports] == ["renamed1.csv", "renamed2.csv"]
+
+
+def test_cached_upload_still_reports_every_file():
+    cache = IngestionCache(64 * 1024 * 1024)
+    files = [("a.csv", csv_bytes(HEADER, "2024-01-02,A,FOOD,1")), ("b.csv", csv_bytes(HEADER, "2024-01-03,B,FOOD,2"))]
+    first = ingest_uploads(files, cache=cache)
+    reports = []
+    assert ingest_uploads(files, cache=cache, on_file=reports.append) is first
+    assert len(reports) == 2
@@ -0,0 +1,106 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from analytics import TransactionDataset
+from store import TransactionStore
+
+
+@pytest.fixture
+def database():
+    database = TransactionStore(":memory:")
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def store(database):
+    return database.history("session:test")
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=["DATE", "DESCRIPTION", "CATEGORY", "PRICE"])
+
+
+def test_reimporting_a_statement_adds_nothing(store):
+    statement = _frame([("2024-01-02", "COFFEE", "DINING", 3.5), ("2024-01-02", "COFFEE", "DINING", 3.5),
+                        ("2024-01-05", "RENT", "HOUSING", 1900.0)])
+    assert store.append(statement, source="jan.csv") == 3
+    assert store.append(statement, source="jan.csv") == 0
+    assert len(store) == 3
+
+
+def test_overlapping_statements_add_only_new_rows(store):
+    store.append(_frame([("2024-01-30", "RENT", "HOUSING", 1900.0)]))
+    added = store.append(_frame([("2024-01-30", "RENT", "HOUSING", 1900.0),
+                                 ("2024-02-01", "COFFEE", "DINING", 3.5)]))
+    assert added == 1
+    assert len(store) == 2
+
+
+def test_recategorized_rows_are_the_same_transaction(store):
+    store.append(_frame([("2024-01-02", "CHIPOTLE", "Uncategorized", 12.0)]))
+    assert store.append(_frame([("2024-01-02", "CHIPOTLE", "DINING", 12.0)])) == 0
+
+
+def test_totals_are_summed_in_cents(store):
+    store.append(_frame([("2024-01-0{}".format(day), "ITEM {}".format(day), "SHOPPING", 0.1) for day in range(1, 4)]))
+    summary = store.summarize(date(2024, 1, 1), date(2024, 1, 31))
+    assert summary.count == 3
+    assert summary.metrics.total == 0.3
+
+
+def test_sub_cent_totals_match_the_in_memory_engine(store):
+    frame = _frame([("2024-01-0{}".format(day), "ITEM {}".format(day), "SHOPPING", price)
+                    for day, price in enumerate([0.333, 0.333, 0.333, 0.125, 0.005, -0.125], start=1)])
+    store.append(frame)
+    dataset = TransactionDataset.from_frame(frame)
+    start, end = date(2024, 1, 1), date(2024, 1, 31)
+    assert store.summarize(start, end).metrics.total == dataset.summarize(start, end).metrics.total == 1.0
+
+
+def test_owners_never_see_each_others_rows(database, tmp_path):
+    owner = database.history("sheet:private")
+    visitor = database.history("session:visitor")
+    owner.append(_frame([("2024-01-02", "SALARY", "INCOME", -5000.0), ("2024-01-03", "RENT", "HOUSING", 1900.0)]))
+    visitor.append(_frame([("2024-01-04", "COFFEE", "DINING", 3.5)]))
+
+    assert len(owner) == 2 and len(visitor) == 1
+    assert visitor.categories == ["DINING"]
+    assert visitor.fetch()["DESCRIPTION"].tolist() == ["COFFEE"]
+    assert visitor.summarize(date(2024, 1, 1), date(2024, 1, 31)).count == 1
+    assert visitor.spending_over_time(date(2024, 1, 1), date(2024, 1, 31)).sum() == 3.5
+    assert (visitor.min_date, visitor.max_date) == (date(2024, 1, 4), date(2024, 1, 4))
+    path = tmp_path / "visitor.parquet"
+    visitor.export_parquet(path)
+    assert pd.read_parquet(path)["DESCRIPTION"].tolist() == ["COFFEE"]
+
+
+def test_the_same_transaction_is_kept_for_each_owner(database):
+    statement = _frame([("2024-01-02", "COFFEE", "DINING", 3.5)])
+    assert database.history("session:a").append(statement) == 1
+    assert database.history("session:b").append(statement) == 1
+
+
+def test_rows_saved_before_owners_are_hidden(tmp_path):
+    import duckdb
+
+    path = str(tmp_path / "old.duckdb")
+    connection = duckdb.connect(path)
+    connection.execute("CREATE TABLE transactions (FINGERPRINT UBIGINT NOT NULL, DATE DATE NOT NULL, "
+                       "CATEGORY VARCHAR, PRICE DOUBLE, DESCRIPTION VARCHAR, SOURCE VARCHAR, "
+                       "ADDED_AT TIMESTAMP DEFAULT current_timestamp)")
+    connection.execute("INSERT INTO transactions (FINGERPRINT, DATE, PRICE) VALUES (1, DATE '2024-01-02', 5.0)")
+    connection.close()
+
+    database = TransactionStore(path)
+    try:
+        assert len(database.history("session:anyone")) == 0
+    finally:
+        database.close()
+
+
+def test_a_history_needs_an_owner(database):
+    with pytest.raises(ValueError):
+        database.history("")
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from text_to_sql import QueryError, UnsafeQueryError, check_read_only, extract_sql, run_query
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({"DATE": pd.date_range("2024-01-01", periods=50), "CATEGORY": "DINING",
+                         "PRICE": [float(value) for value in range(50)]})
+
+
+@pytest.mark.parametrize("sql", [
+    'SELECT sum("PRICE") FROM transactions',
+    'WITH monthly AS (SELECT * FROM transactions) SELECT count(*) FROM monthly',
+    "SELECT * FROM transactions WHERE CATEGORY = 'drop table'",
+])
+def test_read_only_queries_pass(sql):
+    check_read_only(sql)
+
+
+@pytest.mark.parametrize("sql, message", [
+    ("DELETE FROM transactions", "Only SELECT"),
+    ("DROP TABLE transactions", "Only SELECT"),
+    ("SELECT 1; DROP TABLE transactions", "exactly one"),
+    ("", "exactly one"),
+    ("SELECT * FROM read_csv_auto('/etc/passwd')", "read_csv_auto"),
+    ("SELECT * FROM transactions; PRAGMA version", "exactly one"),
+    ("WITH x AS (SELECT 1) SELECT * FROM read_parquet('x.parquet')", "read_parquet"),
+    ("SELECT * FROM duckdb_settings()", "duckdb_settings"),
+    ("SELECT current_setting('threads')", "current_setting"),
+    ("SELECT * FROM pragma_database_size()", "pragma_database_size"),
+])
+def test_unsafe_queries_are_rejected(sql, message):
+    with pytest.raises(UnsafeQueryError, match=message):
+        check_read_only(sql)
+
+
+def test_run_query_rejects_before_running(frame):
+    with pytest.raises(UnsafeQueryError):
+        run_query(frame, "INSERT INTO transactions VALUES (1)")
+
+
+@pytest.mark.parametrize("sql, message", [
+    ('SELECT "AMOUNT" FROM transactions', "Binder Error"),
+    ("SELECT * FROM accounts", "Catalog Error"),
+    ("SELECT FROM WHERE", "Parser Error"),
+])
+def test_duckdb_errors_become_query_errors(frame, sql, message):
+    with pytest.raises(QueryError, match=message):
+        run_query(frame, sql)
+
+
+def test_results_are_capped(frame):
+    result, truncated = run_query(frame, "SELECT * FROM transactions", max_rows=10)
+    assert len(result) == 10 and truncated
+    result, truncated = run_query(frame, "SELECT * FROM transactions", max_rows=50)
+    assert len(result) == 50 and not truncated
+
+
+def test_single_values(frame):
+    result, truncated = run_query(frame, extract_sql('```sql\nSELECT sum("PRICE") AS total FROM transactions;\n```'))
+    assert result["total"].tolist() == [sum(range(50))]
+    assert not truncated
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+from openpyxl import Workbook
+
+import ingest
+import startup
+from ingest import ingest_workbook
+from workbook import guess_table, iter_sheet, outline
+
+HEADER = ["DATE", "DESCRIPTION", "CATEGORY", "PRICE"]
+ROWS = [["2024-01-0{}".format(day), "SHOP {}".format(day), "FOOD", day * 1.5] for day in range(1, 6)]
+
+
+@pytest.fixture(scope="module")
+def workbook_bytes():
+    """A notes sheet, then a ledger below a two-row title block with a blank row in the table."""
+    workbook = Workbook()
+    notes = workbook.active
+    notes.title = "Notes"
+    notes.append(["Exported for the accountant"])
+    ledger = workbook.create_sheet("Ledger")
+    ledger.append(["Household spending"])
+    ledger.append([None])
+    ledger.append(HEADER)
+    for position, row in enumerate(ROWS):
+        if position == 2:
+            ledger.append([None] * len(HEADER))
+        ledger.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_the_table_is_found_below_its_title(workbook_bytes):
+    previews = outline(workbook_bytes)
+    assert list(previews) == ["Notes", "Ledger"]
+    assert guess_table(previews) == ("Ledger", 2)
+
+
+def test_sheets_are_read_in_chunks_without_empty_rows(workbook_bytes):
+    chunks = list(iter_sheet(workbook_bytes, "Ledger", header_row=2, chunk_rows=3))
+    assert [list(chunk.columns) for chunk in chunks] == [HEADER] * len(chunks)
+    assert sum(len(chunk) for chunk in chunks) == len(ROWS)
+    assert [row for chunk in chunks for row in chunk["DESCRIPTION"]] == [row[1] for row in ROWS]
+
+
+def test_unknown_sheets_raise_value_error(workbook_bytes):
+    with pytest.raises(ValueError, match="no sheet named"):
+        list(iter_sheet(workbook_bytes, "Budget"))
+
+
+def test_later_loads_read_the_parquet_copy(workbook_bytes, tmp_path, monkeypatch):
+    first = ingest_workbook(workbook_bytes, "ledger.xlsx", cache_dir=str(tmp_path))
+    assert len(first.dataset) == len(ROWS)
+    assert list(tmp_path.glob("*.parquet"))
+
+    def parse_again(*args, **kwargs):
+        raise AssertionError("the workbook was parsed again")
+
+    monkeypatch.setattr(ingest, "ingest_transactions", parse_again)
+    again = ingest_workbook(workbook_bytes, "ledger.xlsx", cache_dir=str(tmp_path))
+    assert again.dataset.frame["PRICE"].tolist() == first.dataset.frame["PRICE"].tolist()
+    assert again.dataset.frame["DATE"].tolist() == first.dataset.frame["DATE"].tolist()
+    assert again.rows_read == first.rows_read
+
+
+def test_nothing_is_written_without_a_cache_dir(workbook_bytes, monkeypatch):
+    monkeypatch.setattr(startup, "_settings", startup.get_settings()._replace(workbook_cache_dir=None))
+
+    def write_copy(path, result):
+        raise AssertionError("a Parquet copy was written to " + path)
+
+    monkeypatch.setattr(ingest, "_write_parquet_copy", write_copy)
+    assert len(ingest_workbook(workbook_bytes, "ledger.xlsx").dataset) == len(ROWS)
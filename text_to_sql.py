@@ -0,0 +1,175 @@
+# Natural-language questions answered with a single read-only DuckDB query.
+#
+# The model only sees the table schema, the category vocabulary and a few
+# summary statistics, so the prompt stays the same size however many rows
+# the dataset has. Its SQL is checked to be one SELECT, then run by DuckDB
+# over the transactions with external access disabled and with row and time
+# limits.
+
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+# Limits on what a generated query may return and how long it may run
+MAX_RESULT_ROWS = 1000
+QUERY_TIMEOUT_SECONDS = 10
+
+# Categories listed in the prompt
+MAX_PROMPT_CATEGORIES = 200
+
+# Keywords, file readers and introspection functions a read-only query never needs
+FORBIDDEN_SQL = re.compile(
+    r"\b(insert|update|delete|merge|create|drop|alter|attach|detach|copy|export|import|"
+    r"install|load|pragma|set|reset|call|checkpoint|vacuum|grant|revoke|use|"
+    r"read_csv\w*|read_parquet|read_json\w*|parquet_scan|csv_scan|glob|sniff_csv|"
+    r"duckdb_\w+|pragma_\w+|current_setting|current_schemas?|current_database|current_catalog|"
+    r"information_schema|sqlite_master|which_secret)\b",
+    re.IGNORECASE,
+)
+
+PROMPT = """You write DuckDB SQL for a personal finance app.
+
+Table `transactions` has one row per transaction:
+{schema}
+
+Categories: {categories}
+
+Summary: {rows:,} transactions from {first_date} to {last_date}; PRICE ranges from
+{min_price:,.2f} to {max_price:,.2f} (positive values are spending).
+
+Rules:
+- Answer with exactly one read-only SELECT statement and nothing else.
+- Quote column names with double quotes, e.g. "DATE", "PRICE".
+- Use only the `transactions` table. Compare CATEGORY values exactly as listed.
+- Return a single value when the question asks for one number.
+
+Question: {question}
+SQL:"""
+
+# Result of a generated query
+SqlAnswer = namedtuple("SqlAnswer", ["sql", "result", "truncated"])
+
+
+class UnsafeQueryError(ValueError):
+    """Raised when generated SQL is not a single read-only SELECT."""
+
+
+class QueryError(ValueError):
+    """Raised when DuckDB cannot run generated SQL, e.g. for an unknown column."""
+
+
+class QueryTimeoutError(TimeoutError):
+    """Raised when a generated query runs longer than the time limit."""
+
+
+def describe_schema(frame):
+    """Column list with DuckDB-style types for the prompt."""
+    lines = []
+    for column, dtype in frame.dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            kind = "TIMESTAMP (midnight; use CAST(\"{}\" AS DATE) for dates)".format(column)
+        elif pd.api.types.is_numeric_dtype(dtype):
+            kind = "DOUBLE"
+        else:
+            kind = "VARCHAR"
+        lines.append("- \"{}\" {}".format(column, kind))
+    return "\n".join(lines)
+
+
+def build_prompt(dataset, question):
+    """Schema-only prompt: no rows from the dataset are included."""
+    categories = dataset.categories[:MAX_PROMPT_CATEGORIES]
+    prices = dataset.prices[~np.isnan(dataset.prices)]
+    return PROMPT.format(
+        schema=describe_schema(dataset.frame),
+        categories=", ".join(categories) + (" ..." if len(dataset.categories) > len(categories) else ""),
+        rows=len(dataset),
+        first_date=dataset.min_date,
+        last_date=dataset.max_date,
+        min_price=float(prices.min()) if prices.size else 0.0,
+        max_price=float(prices.max()) if prices.size else 0.0,
+        question=question.strip(),
+    )
+
+
+def extract_sql(text):
+    """The SQL in a model reply, with any code fence and trailing semicolons removed."""
+    fenced = re.search(r"```(?:sql)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    sql = fenced.group(1) if fenced else text
+    return sql.strip().rstrip(";").strip()
+
+
+def check_read_only(sql):
+    """Raise UnsafeQueryError unless `sql` is one SELECT (or WITH ... SELECT)."""
+    import sqlparse
+
+    statements = [statement for statement in sqlparse.parse(sql)
+                  if statement.token_first(skip_cm=True) is not None]
+    if len(statements) != 1:
+        raise UnsafeQueryError("Expected exactly one SQL statement")
+    if statements[0].get_type() != "SELECT":
+        raise UnsafeQueryError("Only SELECT queries are allowed")
+
+    # Look for forbidden words outside string literals
+    unquoted = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    match = FORBIDDEN_SQL.search(unquoted)
+    if match:
+        raise UnsafeQueryError("'{}' is not allowed in generated queries".format(match.group(0)))
+
+
+def run_query(frame, sql, max_rows=MAX_RESULT_ROWS, timeout=QUERY_TIMEOUT_SECONDS):
+    """Run a checked query over `frame` as table `transactions`.
+
+    Returns (result DataFrame, truncated). The connection is in-memory with
+    external access disabled, so queries can only see the registered table.
+    Raises QueryError when DuckDB rejects the query.
+    """
+    import duckdb
+
+    check_read_only(sql)
+    connection = duckdb.connect(":memory:")
+    try:
+        connection.register("transactions", frame)
+        connection.execute("SET enable_external_access = false")
+
+        # Interrupt the query if it runs past the time limit
+        timer = threading.Timer(timeout, connection.interrupt)
+        timer.start()
+        try:
+            result = connection.execute(
+                "SELECT * FROM ({}) AS answer LIMIT {}".format(sql, int(max_rows) + 1)
+            ).df()
+        except duckdb.InterruptException:
+            raise QueryTimeoutError("Query took longer than {}s".format(timeout))
+        except duckdb.Error as error:
+            raise QueryError(str(error).splitlines()[0]) from error
+        finally:
+            timer.cancel()
+    finally:
+        connection.close()
+
+    truncated = len(result) > max_rows
+    return result.head(max_rows), truncated
+
+
+def answer_with_sql(dataset, question, complete):
+    """Ask the model for SQL via `complete(prompt) -> str` and run it."""
+    sql = extract_sql(complete(build_prompt(dataset, question)))
+    result, truncated = run_query(dataset.frame, sql)
+    return SqlAnswer(sql, result, truncated)
+
+
+def format_result(result):
+    """A single value as text, or None when the result should be shown as a table."""
+    if result.shape != (1, 1):
+        return None
+    value = result.iat[0, 0]
+    if isinstance(value, (float, np.floating)):
+        return "{:,.2f}".format(value)
+    if isinstance(value, (int, np.integer)):
+        return "{:,}".format(value)
+    return str(value)
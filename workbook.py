@@ -0,0 +1,116 @@
+# Streaming reads of XLSX workbooks.
+#
+# pd.read_excel builds every row of a sheet as Python objects before the
+# first one is converted. Here the sheet is opened in openpyxl's read-only
+# mode and its rows are handed out in chunks of DataFrames, so only one
+# chunk of raw cells is alive at a time. Workbooks often have a title block
+# above the table, so the header row can be picked (or guessed) instead of
+# always being the first row, and any sheet of the workbook can be read.
+
+import io
+import itertools
+
+import pandas as pd
+
+
+# Rows shown when picking a header row, and scanned when guessing it
+PREVIEW_ROWS = 20
+
+
+def _open(data):
+    from openpyxl import load_workbook
+
+    # read_only streams cells from the zip; data_only reads formula results
+    return load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+
+
+def _worksheet(workbook, sheet):
+    if sheet is None:
+        return workbook.worksheets[0]
+    if sheet not in workbook.sheetnames:
+        raise ValueError("The workbook has no sheet named {!r}.".format(sheet))
+    return workbook[sheet]
+
+
+def _column_names(header):
+    """Header cells as column names, with blank cells named the way pandas names them."""
+    return [str(value).strip() if value is not None and str(value).strip() else "Unnamed: {}".format(index)
+            for index, value in enumerate(header)]
+
+
+def _preview(worksheet, rows):
+    return pd.DataFrame(list(itertools.islice(worksheet.iter_rows(values_only=True), rows)))
+
+
+def preview_rows(data, sheet=None, rows=PREVIEW_ROWS):
+    """The first `rows` rows of a sheet as a DataFrame of raw cell values."""
+    workbook = _open(data)
+    try:
+        return _preview(_worksheet(workbook, sheet), rows)
+    finally:
+        workbook.close()
+
+
+def outline(data, rows=PREVIEW_ROWS):
+    """{sheet name: preview_rows()} for every worksheet, in tab order, from one pass over the file."""
+    workbook = _open(data)
+    try:
+        return {worksheet.title: _preview(worksheet, rows) for worksheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+
+def _header_position(preview):
+    for position, row in enumerate(preview.itertuples(index=False)):
+        names = set(_column_names(row))
+        if "DATE" in names and "PRICE" in names:
+            return position
+    return None
+
+
+def guess_header_row(preview):
+    """0-based position of the first preview row naming the DATE and PRICE columns, else 0."""
+    position = _header_position(preview)
+    return 0 if position is None else position
+
+
+def guess_table(previews):
+    """(sheet, header row) of the first sheet in an outline() with a DATE and PRICE header row.
+
+    Falls back to the first row of the first sheet.
+    """
+    for sheet, preview in previews.items():
+        position = _header_position(preview)
+        if position is not None:
+            return sheet, position
+    return next(iter(previews)), 0
+
+
+def iter_sheet(data, sheet=None, header_row=0, chunk_rows=100_000):
+    """Yield DataFrames of up to `chunk_rows` rows of a sheet, read below `header_row` (0-based).
+
+    Completely empty rows are skipped, as pd.read_excel does. Raises
+    ValueError when the sheet has no row at `header_row`.
+    """
+    workbook = _open(data)
+    try:
+        rows = _worksheet(workbook, sheet).iter_rows(min_row=header_row + 1, values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("The sheet has no row {} to use as the header.".format(header_row + 1))
+        columns = _column_names(header)
+        width = len(columns)
+        empty = True
+        while True:
+            batch = list(itertools.islice(rows, chunk_rows))
+            if not batch:
+                break
+            cells = [row[:width] for row in batch if any(value is not None for value in row)]
+            if cells:
+                empty = False
+                # Columns of only dates or only numbers get a proper dtype, as in pd.read_excel
+                yield pd.DataFrame(cells, columns=columns).infer_objects()
+        if empty:
+            yield pd.DataFrame(columns=columns)
+    finally:
+        workbook.close()